@@ -0,0 +1,139 @@
+"""Benchmark: per-element cleanup loop vs. the batched ``tools.element_cleanup``.
+
+Builds synthetic element lists shaped like ``partition_pdf(strategy="hi_res")``
+output of long reports: narrative paragraphs (some with broken lines,
+hyphens, non-breaking spaces or doubled spaces), short titles, list items
+with bullets or OCR "e" bullets, headers/footers and images of mixed sizes.
+Each list is cleaned with the loop the domain ``unstructure_pdf`` modules
+used and with ``drop_types`` + ``clean_elements`` + ``large_images``. The
+table shows both wall times and whether the texts and the selected images
+are identical.
+
+Usage:
+    python benchmarks/bench_element_cleanup.py --elements 5000 50000 200000
+"""
+
+import argparse
+import copy
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from unstructured.cleaners.core import clean, group_broken_paragraphs  # noqa: E402
+from unstructured.documents.coordinates import PixelSpace  # noqa: E402
+from unstructured.documents.elements import (  # noqa: E402
+    CoordinatesMetadata,
+    ElementMetadata,
+    Footer,
+    Header,
+    Image,
+    ListItem,
+    NarrativeText,
+    Title,
+)
+
+from tools.element_cleanup import clean_elements, drop_types, large_images  # noqa: E402
+
+MIN_WIDTH, MIN_HEIGHT = 250, 270
+WORDS = "the carbon emission of steel production increased by 12 percent in 2023 while water use fell".split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_elements(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    elements = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.55:
+            text = sentence(rng, rng.randint(20, 80))
+            if rng.random() < 0.3:
+                text = text.replace(" of ", " of\n", 2)
+            if rng.random() < 0.2:
+                text = text.replace(" steel ", " low-carbon\xa0steel  ")
+            elements.append(NarrativeText(text))
+        elif kind < 0.75:
+            elements.append(Title(sentence(rng, rng.randint(1, 6))))
+        elif kind < 0.85:
+            bullet = rng.choice(["• ", "e ", "- ", ""])
+            elements.append(ListItem(bullet + sentence(rng, rng.randint(3, 12))))
+        elif kind < 0.93:
+            cls = rng.choice([Header, Footer])
+            elements.append(cls(sentence(rng, 3)))
+        else:
+            x, y = rng.uniform(0, 500), rng.uniform(0, 700)
+            w, h = rng.uniform(50, 600), rng.uniform(50, 600)
+            points = ((x, y), (x, y + h), (x + w, y + h), (x + w, y))
+            metadata = ElementMetadata(coordinates=CoordinatesMetadata(points=points, system=PixelSpace(1000, 1400)))
+            elements.append(Image(rng.choice(["", "Figure 3"]), metadata=metadata))
+    return elements
+
+
+def loop_cleanup(elements):
+    """The loop of the domain ``unstructure_pdf`` modules before ``tools.element_cleanup``."""
+    filtered_elements = [
+        element for element in elements if not (isinstance(element, Header) or isinstance(element, Footer))
+    ]
+    selected = []
+    for element in filtered_elements:
+        if element.text != "":
+            element.text = group_broken_paragraphs(element.text)
+            element.text = clean(
+                element.text,
+                bullets=False,
+                extra_whitespace=True,
+                dashes=False,
+                trailing_punctuation=False,
+            )
+        if isinstance(element, Image):
+            point1 = element.metadata.coordinates.points[0]
+            point2 = element.metadata.coordinates.points[2]
+            width = abs(point2[0] - point1[0])
+            height = abs(point2[1] - point1[1])
+            if width >= MIN_WIDTH and height >= MIN_HEIGHT:
+                selected.append(element)
+    return filtered_elements, selected
+
+
+def batched_cleanup(elements):
+    filtered_elements = drop_types(elements, (Header, Footer))
+    clean_elements(filtered_elements)
+    return filtered_elements, large_images(filtered_elements, MIN_WIDTH, MIN_HEIGHT)
+
+
+def positions(elements, selected):
+    index = {id(element): i for i, element in enumerate(elements)}
+    return [index[id(element)] for element in selected]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[5000, 50000, 200000])
+    args = parser.parse_args()
+
+    print(f"{'elements':>9} {'loop s':>8} {'batched s':>10} {'speedup':>8} {'same':>5}")
+    for count in args.elements:
+        elements = make_elements(count)
+        copied = copy.deepcopy(elements)
+
+        started = time.perf_counter()
+        expected, expected_images = loop_cleanup(elements)
+        loop_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        got, got_images = batched_cleanup(copied)
+        batched_s = time.perf_counter() - started
+
+        same = [e.text for e in expected] == [e.text for e in got] and positions(expected, expected_images) == positions(
+            got, got_images
+        )
+        print(f"{count:>9} {loop_s:>8.2f} {batched_s:>10.2f} {loop_s / batched_s:>7.1f}x {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
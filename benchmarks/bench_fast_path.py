@@ -0,0 +1,105 @@
+"""Benchmark: adaptive fast/hi_res partitioning against full hi_res on local PDFs.
+
+Partitions every PDF of ``--pdf-dir`` twice with the settings of the domain
+``unstructure_pdf`` modules, once with ``hi_res`` on every page and once with
+``tools.pdf_strategy`` choosing per page, then chunks both with the same
+``chunk_by_title`` call. The table shows pages per second of each mode and how
+far the adaptive chunks are from the hi_res ones:
+
+* ``same``: share of hi_res chunk texts found verbatim among the adaptive chunks;
+* ``ratio``: ``difflib`` similarity of the two documents' joined chunk texts.
+
+``--plan-only`` only prints the page routing, which needs PyMuPDF or
+pdfminer.six but not the layout model.
+
+Usage:
+    python benchmarks/bench_fast_path.py --pdf-dir docs/journals --limit 20 --languages eng
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from tools.pdf_partition import partition_pdf_pages  # noqa: E402
+from tools.pdf_strategy import HI_RES, plan_pages  # noqa: E402
+
+
+def chunk_texts(elements):
+    from unstructured.chunking.title import chunk_by_title
+    from unstructured.documents.elements import Footer, Header, Table
+
+    elements = [element for element in elements if not isinstance(element, (Header, Footer))]
+    chunks = chunk_by_title(
+        elements=elements,
+        multipage_sections=True,
+        combine_text_under_n_chars=100,
+        new_after_n_chars=512,
+        max_characters=4096,
+    )
+    return [chunk.metadata.text_as_html if isinstance(chunk, Table) else str(chunk.text) for chunk in chunks]
+
+
+def run(path: str, adaptive: bool, languages):
+    started = time.perf_counter()
+    elements = partition_pdf_pages(
+        filename=path,
+        workers=1,
+        adaptive=adaptive,
+        strategy="hi_res",
+        infer_table_structure=True,
+        hi_res_model_name="yolox",
+        languages=languages,
+    )
+    return chunk_texts(elements), time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", required=True)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--languages", default="eng", help="comma-separated tesseract languages")
+    parser.add_argument("--plan-only", action="store_true")
+    args = parser.parse_args()
+
+    paths = sorted(str(p) for p in Path(args.pdf_dir).rglob("*.pdf"))[: args.limit]
+    languages = args.languages.split(",")
+    if args.plan_only:
+        for path in paths:
+            strategies = plan_pages(path, tables=True, images=False)
+            routing = "".join("H" if s == HI_RES else "." for s in strategies)
+            print(f"{Path(path).name:<48} {strategies.count(HI_RES):>4}/{len(strategies):<4} hi_res  {routing}")
+        return
+
+    # Load the layout model once, so neither mode pays for it.
+    run(paths[0], adaptive=False, languages=languages)
+
+    print(f"{'file':<40} {'pages':>5} {'hi_res':>6} {'s full':>8} {'s adapt':>8} {'chunks':>11} {'same':>6} {'ratio':>6}")
+    totals = {"pages": 0, "full": 0.0, "adaptive": 0.0}
+    for path in paths:
+        strategies = plan_pages(path, tables=True, images=False)
+        full, full_s = run(path, adaptive=False, languages=languages)
+        adaptive, adaptive_s = run(path, adaptive=True, languages=languages)
+        adaptive_set = set(adaptive)
+        same = sum(text in adaptive_set for text in full) / max(1, len(full))
+        ratio = difflib.SequenceMatcher(None, "\n".join(full), "\n".join(adaptive), autojunk=False).ratio()
+        totals["pages"] += len(strategies)
+        totals["full"] += full_s
+        totals["adaptive"] += adaptive_s
+        print(
+            f"{Path(path).name[:40]:<40} {len(strategies):>5} {strategies.count(HI_RES):>6} {full_s:>8.1f} "
+            f"{adaptive_s:>8.1f} {len(full):>5}/{len(adaptive):<5} {same:>6.1%} {ratio:>6.3f}"
+        )
+    pages = totals["pages"]
+    print(
+        f"\n{pages} pages: hi_res {pages / totals['full']:.2f} pages/s, "
+        f"adaptive {pages / totals['adaptive']:.2f} pages/s ({totals['full'] / totals['adaptive']:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
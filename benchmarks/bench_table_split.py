@@ -0,0 +1,107 @@
+"""Benchmark: DataFrame-based table splitting vs. the streaming ``split_html_table``.
+
+Builds synthetic HTML tables of increasing size (the shape of the oversized
+ESG / standards tables), splits each with the old ``pd.read_html`` +
+``pd.concat`` loop and with ``tools.pickle_chunks.split_html_table``, and
+prints wall time, fragment count and the largest fragment in tokens.
+
+Usage:
+    python benchmarks/bench_table_split.py --rows 500 2000 8000 --cols 8
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from tools.pickle_chunks import MAX_CHUNK_TOKENS, split_html_table  # noqa: E402
+from tools.tokenizer import count_tokens, num_tokens_from_string  # noqa: E402
+
+
+def split_dataframe_table(html_table, chunk_size=MAX_CHUNK_TOKENS):
+    """The implementation the domain loaders used before ``split_html_table``."""
+    dfs = pd.read_html(StringIO(html_table))
+    if not dfs:
+        return []
+
+    df = dfs[0]
+    tables = []
+    sub_df = pd.DataFrame()
+    token_count = 0
+
+    for _, row in df.iterrows():
+        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
+        row_token_count = num_tokens_from_string(row_html)
+
+        if token_count + row_token_count > chunk_size and not sub_df.empty:
+            sub_html = sub_df.to_html(index=False, border=0, classes=None)
+            tables.append(sub_html)
+            sub_df = pd.DataFrame()
+            token_count = 0
+
+        sub_df = pd.concat([sub_df, row.to_frame().T])
+        token_count += row_token_count
+
+    if not sub_df.empty:
+        sub_html = sub_df.to_html(index=False, border=0, classes=None)
+        tables.append(sub_html)
+
+    return tables
+
+
+def synthetic_table(rows: int, cols: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+
+    def cell() -> str:
+        if rng.random() < 0.5:
+            return f"{rng.uniform(0, 1e6):.2f}"
+        return " ".join(
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+            for _ in range(rng.randint(1, 6))
+        )
+
+    head = "".join(f"<th>Column {c}</th>" for c in range(cols))
+    body = "".join(
+        "<tr>" + "".join(f"<td>{cell()}</td>" for _ in range(cols)) + "</tr>" for _ in range(rows)
+    )
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def measure(fn, html: str):
+    started = time.perf_counter()
+    fragments = fn(html)
+    elapsed = time.perf_counter() - started
+    largest = max(count_tokens(fragments)) if fragments else 0
+    return elapsed, len(fragments), largest
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, nargs="+", default=[500, 2000, 8000])
+    p.add_argument("--cols", type=int, default=8)
+    p.add_argument("--skip-legacy-above", type=int, default=20000, help="rows; the old splitter is quadratic")
+    args = p.parse_args()
+
+    print(f"{'rows':>7} {'tokens':>9} | {'legacy s':>9} {'frags':>5} {'max tok':>7} | {'stream s':>9} {'frags':>5} {'max tok':>7} | speedup")
+    for rows in args.rows:
+        html = synthetic_table(rows, args.cols, seed=rows)
+        tokens = num_tokens_from_string(html)
+        new = measure(split_html_table, html)
+        if rows <= args.skip_legacy_above:
+            old = measure(split_dataframe_table, html)
+            legacy = f"{old[0]:9.2f} {old[1]:5d} {old[2]:7d}"
+            speedup = f"{old[0] / new[0]:6.1f}x"
+        else:
+            legacy, speedup = f"{'skipped':>9} {'':5} {'':7}", "-"
+        print(f"{rows:7d} {tokens:9d} | {legacy} | {new[0]:9.3f} {new[1]:5d} {new[2]:7d} | {speedup}")
+
+
+if __name__ == "__main__":
+    main()
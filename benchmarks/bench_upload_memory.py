@@ -0,0 +1,100 @@
+"""Benchmark: client memory of concurrent PDF uploads, buffered vs. streamed multipart.
+
+Writes ``--files`` synthetic files of ``--size-mb`` each, starts the fake
+two-stage server (which discards uploads as they arrive) and submits every
+file from ``--workers`` threads, once with ``requests``' ``files=`` encoding
+and once with ``tools.multipart_stream.post_multipart``. Each mode runs in a
+fresh process; the table shows its peak RSS above the post-import baseline.
+
+Usage:
+    python benchmarks/bench_upload_memory.py --files 8 --size-mb 100 --workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "src" / "journals"))
+
+import requests  # noqa: E402
+
+from tools.fake_two_stage_server import start_in_thread  # noqa: E402
+from tools.multipart_stream import post_multipart  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def upload_all(mode: str, url: str, paths, workers: int, queue) -> None:
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+    baseline = rss_mb()
+
+    def upload(path: str) -> int:
+        with open(path, "rb") as f:
+            if mode == "buffered":
+                resp = session.post(url, files={"file": f}, data={"priority": "normal"}, timeout=600)
+            else:
+                resp = post_multipart(url, files={"file": f}, data={"priority": "normal"}, session=session, timeout=600)
+        resp.raise_for_status()
+        return os.path.getsize(path)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sent = sum(pool.map(upload, paths))
+    queue.put((baseline, peak_rss_mb(), time.perf_counter() - started, sent))
+
+
+def write_files(directory: str, count: int, size_mb: int):
+    block = os.urandom(1 << 20)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"doc-{i}.pdf")
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--files", type=int, default=8)
+    p.add_argument("--size-mb", type=int, default=100)
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--modes", nargs="+", default=["buffered", "streamed"], choices=["buffered", "streamed"])
+    args = p.parse_args()
+
+    server = start_in_thread(queue_delay=0, min_duration=0, max_duration=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/two_stage/task"
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(directory, args.files, args.size_mb)
+        print(f"{args.files} files x {args.size_mb} MB, {args.workers} workers")
+        print(f"{'mode':>9} | {'peak RSS MB':>11} {'over base':>9} | {'seconds':>7} {'MB/s':>6}")
+        for mode in args.modes:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=upload_all, args=(mode, url, paths, args.workers, queue))
+            proc.start()
+            baseline, peak, elapsed, sent = queue.get()
+            proc.join()
+            print(f"{mode:>9} | {peak:11.0f} {peak - baseline:9.0f} | {elapsed:7.2f} {sent / 2**20 / elapsed:6.0f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import requests
-import pickle
 import logging
 from dotenv import load_dotenv
 
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+
 load_dotenv()
 
 logging.basicConfig(
@@ -17,23 +19,21 @@ logging.basicConfig(
 token = os.environ.get("TOKEN")
 
 output_dir = "test"
+outputs = OutputDir(output_dir)
 
 
 def unstructure_by_service(doc_path, url, token):
     with open(doc_path, "rb") as f:
         base_name = os.path.basename(doc_path)
         name_without_ext = os.path.splitext(base_name)[0]
-        pickle_path = os.path.join(output_dir, f"{name_without_ext}.pkl")
-
         files = {"file": f}
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(url, files=files, headers=headers)
+        response = post_multipart(url, files=files, headers=headers)
         response.raise_for_status()
         response_data = response.json()
         result = response_data.get("result")
 
-        with open(pickle_path, "wb") as pkl_file:
-            pickle.dump(result, pkl_file)
+        outputs.save(name_without_ext, result)
 
 
 dir_path = "test"
@@ -50,8 +50,7 @@ for doc in os.listdir(dir_path):
         doc_path = os.path.join(dir_path, doc)
         base_name = os.path.basename(doc_path)
         name_without_ext = os.path.splitext(base_name)[0]
-        pickle_path = os.path.join(output_dir, f"{name_without_ext}.pkl")
-        if not os.path.exists(pickle_path):
+        if not outputs.exists(name_without_ext):
             try:
                 unstructure_by_service(doc_path, pdf_url, token)
                 logging.info(f"Processed successfully: {doc}")
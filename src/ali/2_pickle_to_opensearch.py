@@ -2,15 +2,15 @@ import logging
 import os
 import pickle
 from datetime import UTC, datetime
-from io import StringIO
-import pandas as pd
 import psycopg2
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
 
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
+
 # from supabase import create_client, Client
 
 load_dotenv()
@@ -58,12 +58,6 @@ if not client.indices.exists(index="internal_use"):
     client.indices.create(index="internal_use", body=internal_use_mapping)
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -78,41 +72,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d["text"]) > 8100:
+        token_count = num_tokens_from_string(d["text"])
+        if token_count > 8100:
             soup = BeautifulSoup(d["text"], "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -122,14 +87,14 @@ def merge_pickle_list(data):
                         result.append([table_content, d["page_number"]])
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append([str(soup), d["page_number"]])
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d["text"]) < 15:
+        elif token_count < 15:
             temp += d["text"] + " "
         else:
             result.append([(temp + d["text"]), d["page_number"]])
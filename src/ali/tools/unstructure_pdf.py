@@ -1,17 +1,16 @@
 import tempfile
 
 from dotenv import load_dotenv
+from tools.element_cleanup import clean_elements, drop_types, large_images
+from tools.pdf_partition import partition_pdf_pages
 from tools.vision import vision_completion
 from unstructured.chunking.title import chunk_by_title
-from unstructured.cleaners.core import clean, group_broken_paragraphs
 from unstructured.documents.elements import (
     CompositeElement,
     Footer,
     Header,
-    Image,
     Table,
 )
-from unstructured.partition.pdf import partition_pdf
 
 load_dotenv()
 
@@ -20,7 +19,7 @@ def unstructure_pdf(pdf_name, languages=["chi_sim"], extract_images=False):
     min_image_width = 250
     min_image_height = 270
 
-    elements = partition_pdf(
+    elements = partition_pdf_pages(
         filename=pdf_name,
         pdf_extract_images=extract_images,
         pdf_image_output_dir_path=tempfile.gettempdir(),
@@ -30,30 +29,12 @@ def unstructure_pdf(pdf_name, languages=["chi_sim"], extract_images=False):
         languages=languages,
     )
 
-    filtered_elements = [
-        element
-        for element in elements
-        if not (isinstance(element, Header) or isinstance(element, Footer))
-    ]
+    filtered_elements = drop_types(elements, (Header, Footer))
 
-    for element in filtered_elements:
-        if element.text != "":
-            element.text = group_broken_paragraphs(element.text)
-            element.text = clean(
-                element.text,
-                bullets=False,
-                extra_whitespace=True,
-                dashes=False,
-                trailing_punctuation=False,
-            )
-        if extract_images:
-            if isinstance(element, Image):
-                point1 = element.metadata.coordinates.points[0]
-                point2 = element.metadata.coordinates.points[2]
-                width = abs(point2[0] - point1[0])
-                height = abs(point2[1] - point1[1])
-                if width >= min_image_width and height >= min_image_height:
-                    element.text = vision_completion(element.metadata.image_path)
+    clean_elements(filtered_elements)
+    if extract_images:
+        for element in large_images(filtered_elements, min_image_width, min_image_height):
+            element.text = vision_completion(element.metadata.image_path)
 
     chunks = chunk_by_title(
         elements=filtered_elements,
@@ -1,22 +1,24 @@
 import logging
 import os
-import pickle
-from datetime import UTC, datetime
-from io import StringIO
+from typing import List, NamedTuple
 import arrow
 
-import pandas as pd
 from psycopg2 import pool
 from openai import OpenAI
 from pinecone import Pinecone
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_fixed
 
 import boto3
 from opensearchpy import AWSV4SignerAuth
 
+from tools.s3_prefetch import pooled_s3_client, prefetch_pickles
+from tools.status_writer import StatusWriter
+from tools.work_discovery import iter_keyset
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
+
 
 load_dotenv()
 
@@ -40,14 +42,7 @@ service = "aoss"
 credentials = boto3.Session().get_credentials()
 auth = AWSV4SignerAuth(credentials, region, service)
 
-s3_client = boto3.client("s3")
-
-
-def load_pickle_from_s3(bucket_name, s3_key):
-    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-    body = response["Body"].read()
-    data = pickle.loads(body)
-    return data
+s3_client = pooled_s3_client()
 
 
 bucket_name = "tiangong"
@@ -65,12 +60,6 @@ def to_unix_timestamp(date_str: str) -> int:
         return int(arrow.now().timestamp())
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -79,58 +68,21 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_embeddings(items, model="text-embedding-3-small"):
-    text_list = [item[0] for item in items]
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
-        for i in range(0, length, 1000):
-            result = client.embeddings.create(
-                input=text_list[i : i + 1000], model=model
-            ).data
-            results += result
-        return results
-    except Exception as e:
-        print(e)
-
-
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
+embedder = EmbeddingBatcher(client)
 
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
 
-    return tables
+def get_embeddings(items, model="text-embedding-3-small"):
+    text_list = [item[0] for item in items]
+    text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
+    return embedder.embed(text_list, model=model)
 
 
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d[0]) > 8100:
+        token_count = num_tokens_from_string(d[0])
+        if token_count > 8100:
             soup = BeautifulSoup(d[0], "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -140,14 +92,14 @@ def merge_pickle_list(data):
                         result.append([table_content, d[1]])
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append([str(soup), d[1]])
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d[0]) < 15:
+        elif token_count < 15:
             temp += d[0] + " "
         else:
             result.append([(temp + d[0]), d[1]])
@@ -158,7 +110,7 @@ def merge_pickle_list(data):
     return result
 
 
-conn_pool = pool.SimpleConnectionPool(
+conn_pool = pool.ThreadedConnectionPool(
     1,
     20,  # min and max number of connections
     database=os.getenv("POSTGRES_DB"),
@@ -168,41 +120,47 @@ conn_pool = pool.SimpleConnectionPool(
     port=os.getenv("POSTGRES_PORT"),
 )
 
-with conn_pool.getconn() as conn_pg:
-    with conn_pg.cursor() as cur:
-        cur.execute(
-            """SELECT id, title, authors, isbn_number,publish_time FROM edu_textbooks WHERE pdf_exist is NULL"""
-        )
-        records = cur.fetchall()
+class Textbook(NamedTuple):
+    id: str
+    title: str
+    authors: List[str]
+    isbn_number: str
+    publish_time: str
 
-ids = [record[0] for record in records]
-titles = {record[0]: record[1] for record in records}
-authors = {record[0]: record[2] for record in records}
-isbn_numbers = {record[0]: record[3] for record in records}
-publish_times = {record[0]: record[4] for record in records}
 
-files = [str(id) + ".pkl" for id in ids]
+textbooks = iter_keyset(
+    conn_pool,
+    "edu_textbooks",
+    Textbook._fields,
+    record=Textbook,
+    where="pdf_exist IS NULL",
+)
+
+embedding_writer = StatusWriter(conn_pool, "edu_textbooks", "embedding_time")
 
 
-for file in files:
+for textbook, fetched in prefetch_pickles(
+    s3_client, bucket_name, textbooks, key=lambda textbook: f"{prefix}{textbook.id}.pkl"
+):
+    file_id = str(textbook.id)
+    file = file_id + ".pkl"
     try:
-        data = load_pickle_from_s3(bucket_name, prefix + file)
+        data = fetched.result()
         data = merge_pickle_list(data)
         data = fix_utf8(data)
         embeddings = get_embeddings(data)
 
-        file_id = file.split(".")[0]
-        title = titles[file_id]
-        author = ", ".join(authors[file_id])
-        isbn_number = isbn_numbers[file_id]
-        publish_time = to_unix_timestamp(publish_times[file_id])
+        title = textbook.title
+        author = ", ".join(textbook.authors)
+        isbn_number = textbook.isbn_number
+        publish_time = to_unix_timestamp(textbook.publish_time)
 
         vectors = []
         for index, e in enumerate(embeddings):
             vectors.append(
                 {
                     "id": file_id + "_" + str(index),
-                    "values": e.embedding,
+                    "values": e,
                     "metadata": {
                         "text": data[index][0],
                         "page_number": data[index][1],
@@ -222,22 +180,12 @@ for file in files:
                 show_progress=False,
             )
 
-            # Get a connection from the pool
-            conn_pg = conn_pool.getconn()
-            with conn_pg.cursor() as cur:
-                cur.execute(
-                    "UPDATE edu_textbooks SET embedding_time = %s WHERE id = %s",
-                    (datetime.now(UTC), file_id),
-                )
-                conn_pg.commit()
-                logging.info(f"Updated {file_id} in the database.")
+            embedding_writer.mark(file_id)
+            logging.info(f"Indexed {file_id}; embedding_time queued.")
         except Exception as e:
-            conn_pg.rollback()
             print(f"Error: {e}")
-        finally:
-            # Release the connection back to the pool
-            conn_pool.putconn(conn_pg)
     except Exception:
         logging.error(f"Error processing {file_id}")
-# Close the connection pool
+# Write the remaining embedding_time stamps, then close the connection pool
+embedding_writer.close()
 conn_pool.closeall()
@@ -1,16 +1,18 @@
 import concurrent.futures
 import os
-import pickle
-import requests
 
 import psycopg2
 from dotenv import load_dotenv
 
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+
 load_dotenv()
 
 token = os.environ.get("TOKEN")
 input_dir = "docs/education"
 output_dir = "docs/processed_docs/education_pickle"
+outputs = OutputDir(output_dir)
 
 conn_pg = psycopg2.connect(
     database=os.getenv("POSTGRES_DB"),
@@ -30,10 +32,6 @@ with conn_pg.cursor() as cur:
 def unstructure_by_service(doc_id, doc_path, file_type, token):
     """Process document through the appropriate unstructure service based on file type"""
     with open(doc_path, "rb") as f:
-        # Set pickle filename to id.filetype.pickle
-        pickle_filename = f"{doc_id}.{file_type}.pickle"
-        pickle_path = os.path.join(output_dir, pickle_filename)
-
         # Select the appropriate URL based on file type
         if file_type.lower() == "pdf":
             url = pdf_url
@@ -49,13 +47,12 @@ def unstructure_by_service(doc_id, doc_path, file_type, token):
         headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            response = requests.post(url, files=files, headers=headers)
+            response = post_multipart(url, files=files, headers=headers)
             response.raise_for_status()
             response_data = response.json()
             result = response_data.get("result")
 
-            with open(pickle_path, "wb") as pkl_file:
-                pickle.dump(result, pkl_file)
+            outputs.save(f"{doc_id}.{file_type}", result, ".pickle")
 
         except Exception as e:
             print(f"Error processing document ID: {doc_id}: {str(e)}")
@@ -1,14 +1,15 @@
 import logging
 import os
-import pickle
-import requests
-import time
-import random
 from datetime import UTC, datetime
 
 import psycopg2
 from dotenv import load_dotenv
 
+from tools.doc_cost import CostEstimator, longest_first, scaled_timeout
+from tools.endpoint_pool import EndpointPool, dispatch
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+
 load_dotenv()
 
 logging.basicConfig(
@@ -21,7 +22,14 @@ logging.basicConfig(
 token = os.environ.get("TOKEN")
 input_dir = "docs/esg"
 output_dir = "docs/processed_docs/esg_pickle"
+outputs = OutputDir(output_dir)
 pdf_url = "http://localhost:8770/mineru"
+# Extra MinerU services: UNSTRUCTURE_ENDPOINTS="http://host-a:8770/mineru=2,http://host-b:8770/mineru"
+service_pool = EndpointPool.from_env(default=[pdf_url])
+estimator = CostEstimator.from_env()
+# Request timeout grows with the page count; short documents keep the minimum
+TIMEOUT_PER_PAGE = 6
+MIN_TIMEOUT = 1200
 
 
 conn_pg = psycopg2.connect(
@@ -41,42 +49,31 @@ with conn_pg.cursor() as cur:
 
 def unstructure_by_service(doc_id, doc_path, token, url):
     """Process document through the appropriate unstructure service"""
-    pickle_filename = f"{doc_id}.pkl"
-    pickle_path = os.path.join(output_dir, pickle_filename)
-
     # Check if pickle file already exists
-    if os.path.exists(pickle_path):
+    if outputs.exists(doc_id):
         logging.info(f"Pickle file already exists for document ID: {doc_id}, skipping.")
         return doc_id
 
-    try:
-        with open(doc_path, "rb") as f:
-            files = {"file": f}
-            headers = {"Authorization": f"Bearer {token}"}
-            response = requests.post(url, files=files, headers=headers)
-            response.raise_for_status()
-            response_data = response.json()
-
-        result = response_data.get("result")
+    timeout = scaled_timeout(estimator.pages(doc_path), per_unit=TIMEOUT_PER_PAGE, minimum=MIN_TIMEOUT)
+    with open(doc_path, "rb") as f:
+        files = {"file": f}
+        headers = {"Authorization": f"Bearer {token}"}
+        response = post_multipart(url, files=files, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        response_data = response.json()
 
-        with open(pickle_path, "wb") as pkl_file:
-            pickle.dump(result, pkl_file)
+    result = response_data.get("result")
 
-        logging.info(
-            f"Document ID: {doc_id} processed successfully with service: {url}"
-        )
-        time.sleep(1 + 2 * random.random())
-        return doc_id
+    outputs.save(doc_id, result)
 
-    except Exception as e:
-        logging.error(
-            f"Error processing document ID: {doc_id} with service {url}: {str(e)}"
-        )
-        return None
+    logging.info(
+        f"Document ID: {doc_id} processed successfully with service: {url}"
+    )
+    return doc_id
 
 
 def process_documents():
-    """Process documents sequentially using the single configured service"""
+    """Process documents on the least-loaded healthy service, updating the database as they finish"""
     documents = []
     for record in records:
         doc_id = record[0]
@@ -91,10 +88,15 @@ def process_documents():
         logging.info("No documents to process.")
         return
 
-    for doc_id, doc_path in documents:
-        result = unstructure_by_service(doc_id, doc_path, token, pdf_url)
-        if result:
-            logging.info(f"{doc_id} processed with service: {pdf_url}")
+    # Longest documents first, so a few very long reports do not start last and hold up the run
+    documents = list(longest_first(documents, lambda doc: estimator.pages(doc[1])))
+    outcomes = dispatch(
+        service_pool,
+        documents,
+        lambda doc, url: unstructure_by_service(doc[0], doc[1], token, url),
+    )
+    for (doc_id, doc_path), result in outcomes:
+        if not isinstance(result, Exception):
             try:
                 with conn_pg.cursor() as cur:
                     cur.execute(
@@ -108,9 +110,8 @@ def process_documents():
                     f"Error updating unstructure_time for document ID: {doc_id}: {str(e)}"
                 )
         else:
-            logging.error(
-                f"Failed to process document ID: {doc_id} with service: {pdf_url}"
-            )
+            logging.error(f"Failed to process document ID: {doc_id}: {result}")
+    logging.info(f"Services: {service_pool.summary()}")
 
 
 # Run the document processing function
@@ -5,6 +5,8 @@ import time
 import psycopg2
 from dotenv import load_dotenv
 
+from tools.output_layout import OutputDir
+
 load_dotenv()
 
 logging.basicConfig(
@@ -15,6 +17,7 @@ logging.basicConfig(
 )
 
 output_dir = "docs/processed_docs/esg_pickle"
+outputs = OutputDir(output_dir)
 
 conn_pg = psycopg2.connect(
     database=os.getenv("POSTGRES_DB"),
@@ -38,9 +41,9 @@ def update_unstructure_time():
     # First collect all records to update
     for record in records:
         id = record[0]
-        pickle_path = os.path.join(output_dir, f"{id}.pkl")
+        pickle_path = outputs.find(id)
 
-        if os.path.exists(pickle_path):
+        if pickle_path:
             # Get file creation time
             creation_time = os.path.getctime(pickle_path)
             creation_time_str = time.strftime(
@@ -2,17 +2,19 @@ import logging
 import os
 import pickle
 from datetime import UTC, datetime
-from io import StringIO
 
-import pandas as pd
 from psycopg2 import pool
-import tiktoken
 from openai import OpenAI
 from bs4 import BeautifulSoup
 from pinecone import Pinecone
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.output_layout import OutputDir
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
+
 
 load_dotenv()
 
@@ -29,12 +31,6 @@ pc = Pinecone(api_key=os.environ.get("PINECONE_SERVERLESS_API_KEY_US_EAST_1"))
 idx = pc.Index(os.environ.get("PINECONE_SERVERLESS_INDEX_NAME_US_EAST_1"))
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -43,23 +39,13 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_embeddings(items, model="text-embedding-3-small"):
-    text_list = [item[0] for item in items]
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
+embedder = EmbeddingBatcher(client)
 
-        for i in range(0, length, 1000):
-            result = client.embeddings.create(
-                input=text_list[i : i + 1000], model=model
-            ).data
-            results += result
-        return results
 
-    except Exception as e:
-        print(e)
+def get_embeddings(items, model="text-embedding-3-small"):
+    text_list = [item[0] for item in items]
+    text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
+    return embedder.embed(text_list, model=model)
 
 
 def load_pickle_list(file_path):
@@ -70,41 +56,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d[0]) > 8100:
+        token_count = num_tokens_from_string(d[0])
+        if token_count > 8100:
             soup = BeautifulSoup(d[0], "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -114,14 +71,14 @@ def merge_pickle_list(data):
                         result.append([table_content, d[1]])
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append([str(soup), d[1]])
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d[0]) < 15:
+        elif token_count < 15:
             temp += d[0] + " "
         else:
             result.append([(temp + d[0]), d[1]])
@@ -177,11 +134,12 @@ report_end_dates = {record[0]: record[6] for record in records}
 files = [str(id) + ".pkl" for id in ids]
 
 dir = "processed_docs/esg_pickle"
+outputs = OutputDir(dir)
 
 # update_data = []
 
 for file in files:
-    file_path = os.path.join(dir, file)
+    file_path = outputs.path(os.path.splitext(file)[0], ".pkl")
     try:
         data = load_pickle_list(file_path)
         data = merge_pickle_list(data)
@@ -201,7 +159,7 @@ for file in files:
             vectors.append(
                 {
                     "id": file_id + "_" + str(index),
-                    "values": e.embedding,
+                    "values": e,
                     "metadata": {
                         "text": data[index][0],
                         "rec_id": file_id,
@@ -1,20 +1,23 @@
 import logging
 import os
 import pickle
-from datetime import UTC, datetime
-from io import StringIO
+from datetime import datetime
+from typing import NamedTuple
 from urllib.parse import unquote
 
-import pandas as pd
 from psycopg2 import pool
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_fixed
 
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
 
+from tools.s3_manifest import S3Manifest
+from tools.s3_prefetch import pooled_s3_client, prefetch_pickles
+from tools.status_writer import StatusWriter
+from tools.work_discovery import iter_keyset
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
 
 load_dotenv()
 
@@ -33,21 +36,7 @@ service = "aoss"
 credentials = boto3.Session().get_credentials()
 auth = AWSV4SignerAuth(credentials, region, service)
 
-s3_client = boto3.client("s3")
-
-
-def list_all_objects(bucket_name, prefix):
-    paginator = s3_client.get_paginator("list_objects_v2")
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-
-    docs = []
-    for page in page_iterator:
-        if "Contents" in page:
-            for obj in page["Contents"]:
-                key = obj["Key"]
-                if key.endswith(".pkl"):
-                    docs.append(key)
-    return docs
+s3_client = pooled_s3_client()
 
 
 # def list_all_objects(bucket_name, prefix):
@@ -70,13 +59,6 @@ def list_all_objects(bucket_name, prefix):
 #     return docs
 
 
-def load_pickle_from_s3(bucket_name, s3_key):
-    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-    body = response["Body"].read()
-    data = pickle.loads(body)
-    return data
-
-
 bucket_name = "tiangong"
 prefix = "processed_docs/journal_pickle/"
 suffix = ".pdf.pkl"
@@ -87,11 +69,10 @@ def extract_doi_from_path(path):
     return doi
 
 
-docs = list_all_objects(bucket_name, prefix)
-
-# 写入pickle
-with open("docs_s3.pkl", "wb") as f:
-    pickle.dump(docs, f)
+# Incremental listing, persisted under manifests/ (also read by read_pickle.py)
+manifest = S3Manifest(s3_client, bucket_name, prefix)
+logging.info(manifest.refresh().summary())
+docs = manifest.keys(suffix=".pkl")
 
 
 client = OpenSearch(
@@ -125,12 +106,6 @@ if not client.indices.exists(index="sci"):
     print("'sci' index Created.")
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -139,23 +114,6 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_embeddings(items, model="text-embedding-3-small"):
-    text_list = [item[0] for item in items]
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
-
-        for i in range(0, length, 1000):
-            result = client.embeddings.create(
-                input=text_list[i : i + 1000], model=model
-            ).data
-            results += result
-        return results
-
-    except Exception as e:
-        print(e)
 
 
 def load_pickle_list(file_path):
@@ -166,41 +124,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d[0]) > 8100:
+        token_count = num_tokens_from_string(d[0])
+        if token_count > 8100:
             soup = BeautifulSoup(d[0], "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -210,14 +139,14 @@ def merge_pickle_list(data):
                         result.append([table_content, d[1]])
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append([str(soup), d[1]])
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d[0]) < 15:
+        elif token_count < 15:
             temp += d[0] + " "
         else:
             result.append([(temp + d[0]), d[1]])
@@ -245,7 +174,7 @@ def get_files_before(directory, target_time):
     return old_files
 
 
-conn_pool = pool.SimpleConnectionPool(
+conn_pool = pool.ThreadedConnectionPool(
     1,
     20,  # min and max number of connections
     database=os.getenv("POSTGRES_DB"),
@@ -255,31 +184,38 @@ conn_pool = pool.SimpleConnectionPool(
     port=os.getenv("POSTGRES_PORT"),
 )
 
-with conn_pool.getconn() as conn_pg:
-    with conn_pg.cursor() as cur:
-        cur.execute(
-            "SELECT doi,journal,date FROM journals WHERE upload_time IS NOT NULL AND fulltext_time IS NULL"
-        )
-        records = cur.fetchall()
+class Journal(NamedTuple):
+    doi: str
+    journal: str
+    date: datetime
 
-dois = [record[0] for record in records]
-journals = {record[0]: record[1] for record in records}
-dates = {record[0]: record[2] for record in records}
 
-docs_dois = [unquote(unquote(extract_doi_from_path(doc))) for doc in docs]
+journal_records = iter_keyset(
+    conn_pool,
+    "journals",
+    Journal._fields,
+    record=Journal,
+    where="upload_time IS NOT NULL AND fulltext_time IS NULL",
+)
+
+doc_paths = {unquote(unquote(extract_doi_from_path(doc))): doc for doc in docs}
 
-df = pd.DataFrame({"doi": docs_dois, "path": docs})
+fulltext_writer = StatusWriter(conn_pool, "journals", "fulltext_time", "doi")
 
-for index, row in df.iterrows():
+for record, fetched in prefetch_pickles(
+    s3_client,
+    bucket_name,
+    (record for record in journal_records if record.doi in doc_paths),
+    key=lambda record: doc_paths[record.doi],
+):
+    file_id = record.doi
     try:
-        data = load_pickle_from_s3(bucket_name, row["path"])
+        data = fetched.result()
         data = merge_pickle_list(data)
         data = fix_utf8(data)
-        embeddings = get_embeddings(data)
 
-        file_id = row["doi"]
-        journal = journals[file_id]
-        date = int(dates[file_id].timestamp())
+        journal = record.journal
+        date = int(record.date.timestamp())
 
         fulltext_list = []
         for index, d in enumerate(data):
@@ -297,20 +233,10 @@ for index, row in df.iterrows():
             batch = fulltext_list[i : i + 500]
             client.bulk(body=batch)
 
-        # Get a connection from the pool
-        conn_pg = conn_pool.getconn()
-        try:
-            with conn_pg.cursor() as cur:
-                cur.execute(
-                    "UPDATE journal SET fulltext_time = %s WHERE doi = %s",
-                    (datetime.now(UTC), file_id),
-                )
-                conn_pg.commit()
-                logging.info(f"Updated {file_id} in the database.")
-        finally:
-            # Release the connection back to the pool
-            conn_pool.putconn(conn_pg)
-    except Exception:
-        logging.error(f"Error processing {row['path']}")
-# Close the connection pool
+        fulltext_writer.mark(file_id)
+        logging.info(f"Indexed {file_id}; fulltext_time queued.")
+    except Exception as e:
+        logging.error(f"Error processing {record.doi} ({doc_paths[record.doi]}): {e}")
+# Write the remaining fulltext_time stamps, then close the connection pool
+fulltext_writer.close()
 conn_pool.closeall()
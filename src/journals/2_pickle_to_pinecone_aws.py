@@ -1,23 +1,26 @@
 import logging
 import os
 import pickle
-from datetime import UTC, datetime
-from io import StringIO
+from datetime import datetime
+from typing import NamedTuple
 from urllib.parse import unquote
 import arrow
 
-import pandas as pd
 from psycopg2 import pool
 from openai import OpenAI
 from pinecone import Pinecone
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_fixed
 
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
 
+from tools.s3_prefetch import pooled_s3_client, prefetch_pickles
+from tools.status_writer import StatusWriter
+from tools.work_discovery import iter_keyset
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
 
 load_dotenv()
 
@@ -41,7 +44,7 @@ service = "aoss"
 credentials = boto3.Session().get_credentials()
 auth = AWSV4SignerAuth(credentials, region, service)
 
-s3_client = boto3.client("s3")
+s3_client = pooled_s3_client()
 
 
 # def list_all_objects(bucket_name, prefix):
@@ -72,13 +75,6 @@ def list_all_objects(bucket_name, prefix):
     return docs
 
 
-def load_pickle_from_s3(bucket_name, s3_key):
-    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-    body = response["Body"].read()
-    data = pickle.loads(body)
-    return data
-
-
 bucket_name = "tiangong"
 prefix = "processed_docs/journal_pickle/"
 suffix = ".pkl"
@@ -124,12 +120,6 @@ def to_unix_timestamp(date_str: str) -> int:
         return int(arrow.now().timestamp())
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -138,20 +128,12 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+embedder = EmbeddingBatcher(client)
+
+
 def get_embeddings(text_list, model="text-embedding-3-small"):
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
-        for i in range(0, length, 1000):
-            result = client.embeddings.create(
-                input=text_list[i : i + 1000], model=model
-            ).data
-            results += result
-        return results
-    except Exception as e:
-        print(e)
+    text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
+    return embedder.embed(text_list, model=model)
 
 
 def load_pickle_list(file_path):
@@ -162,41 +144,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d) > 8100:
+        token_count = num_tokens_from_string(d)
+        if token_count > 8100:
             soup = BeautifulSoup(d, "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -206,14 +159,14 @@ def merge_pickle_list(data):
                         result.append(table_content)
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append(str(soup))
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d) < 15:
+        elif token_count < 15:
             temp += d + " "
         else:
             result.append((temp + d))
@@ -241,7 +194,7 @@ def get_files_before(directory, target_time):
     return old_files
 
 
-conn_pool = pool.SimpleConnectionPool(
+conn_pool = pool.ThreadedConnectionPool(
     1,
     20,  # min and max number of connections
     database=os.getenv("POSTGRES_DB"),
@@ -251,32 +204,42 @@ conn_pool = pool.SimpleConnectionPool(
     port=os.getenv("POSTGRES_PORT"),
 )
 
-with conn_pool.getconn() as conn_pg:
-    with conn_pg.cursor() as cur:
-        cur.execute(
-            """SELECT id, doi, journal, date FROM journals WHERE upload_time IS NOT NULL AND embedding_time < '2024-10-22T00:00:00+00:00'"""  # 改为embedding_time早于XXX
-        )
-        records = cur.fetchall()
+class Journal(NamedTuple):
+    id: str
+    doi: str
+    journal: str
+    date: datetime
+
+
+journal_records = iter_keyset(
+    conn_pool,
+    "journals",
+    Journal._fields,
+    record=Journal,
+    where="upload_time IS NOT NULL AND embedding_time < '2024-10-22T00:00:00+00:00'",  # 改为embedding_time早于XXX
+)
 
-conn_pg = conn_pool.getconn()
+embedding_writer = StatusWriter(conn_pool, "journals", "embedding_time", "doi")
 
-for record in records:
+for record, fetched in prefetch_pickles(
+    s3_client, bucket_name, journal_records, key=lambda record: f"{prefix}{record.id}.pkl"
+):
+    file_id = record.doi
     try:
-        data = load_pickle_from_s3(bucket_name, prefix + record[0] + ".pkl")
+        data = fetched.result()
         data = merge_pickle_list(data)
         data = fix_utf8(data)
         embeddings = get_embeddings(data)
 
-        file_id = record[1]
-        journal = record[2]
-        date = to_unix_timestamp(record[3])
+        journal = record.journal
+        date = to_unix_timestamp(record.date)
 
         vectors = []
         for index, e in enumerate(embeddings):
             vectors.append(
                 {
                     "id": file_id + "_" + str(index),
-                    "values": e.embedding,
+                    "values": e,
                     "metadata": {
                         "text": data[index],
                         "doi": file_id,
@@ -290,20 +253,13 @@ for record in records:
                 vectors=vectors, batch_size=100, namespace="sci", show_progress=False
             )
 
-            # Get a connection from the pool
-            with conn_pg.cursor() as cur:
-                cur.execute(
-                    "UPDATE journals SET embedding_time = %s WHERE doi = %s",
-                    (datetime.now(UTC), file_id),
-                )
-                conn_pg.commit()
-                logging.info(f"Updated {file_id} in the database.")
+            embedding_writer.mark(file_id)
+            logging.info(f"Indexed {file_id}; embedding_time queued.")
         except Exception as e:
             logging.error(f"Error: {e}")
     except Exception as e:
         logging.error(f"Error processing {file_id}: {e}")
 
-        # Release the connection back to the pool
-conn_pool.putconn(conn_pg)
-# Close the connection pool
+# Write the remaining embedding_time stamps, then close the connection pool
+embedding_writer.close()
 conn_pool.closeall()
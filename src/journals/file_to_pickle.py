@@ -2,13 +2,18 @@ import os
 import requests
 import pickle
 from urllib.parse import quote
-from datetime import UTC, datetime
 import psycopg2
 import psycopg2.pool
 import logging
 from dotenv import load_dotenv
 import concurrent.futures
 
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+from tools.pdf_dedup import DedupRun, PdfDedup
+from tools.pre_screen import OCR, PreScreen
+from tools.status_writer import StatusWriter
+
 load_dotenv()
 
 # --- Constants ---
@@ -30,13 +35,16 @@ logging.basicConfig(
 
 # --- Environment & Globals ---
 token = os.environ.get("TOKEN")
+outputs = OutputDir(OUTPUT_DIR)
 db_pool = None
+upload_writer = None
+dedup_run = None
 
 
 # --- Functions ---
 def init_db_pool():
-    """Initializes the database connection pool."""
-    global db_pool
+    """Initializes the database connection pool and the upload_time writer."""
+    global db_pool, upload_writer
     try:
         db_pool = psycopg2.pool.ThreadedConnectionPool(
             minconn=1,
@@ -48,13 +56,16 @@ def init_db_pool():
             port=os.getenv("POSTGRES_PORT"),
         )
         logging.info("Database connection pool created successfully.")
+        upload_writer = StatusWriter(db_pool, "journals", "upload_time", key_type="uuid")
     except psycopg2.OperationalError as e:
         logging.error(f"Failed to create database connection pool: {e}")
         raise
 
 
 def close_db_pool():
-    """Closes all connections in the pool."""
+    """Flushes pending upload_time stamps and closes all connections in the pool."""
+    if upload_writer:
+        upload_writer.close()
     if db_pool:
         db_pool.closeall()
         logging.info("Database connection pool closed.")
@@ -62,23 +73,20 @@ def close_db_pool():
 
 def unstructure_by_service(doc_path, file_id, url, token):
     """Sends a document to the unstructuring service and saves the result."""
-    pickle_filename = f"{file_id}.pkl"
-    pickle_path = os.path.join(OUTPUT_DIR, pickle_filename)
-
     with open(doc_path, "rb") as f:
         files = {"file": f}
         headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            response = requests.post(
+            response = post_multipart(
                 url, files=files, headers=headers, timeout=REQUEST_TIMEOUT
             )
             response.raise_for_status()
             response_data = response.json()
             result = response_data.get("result")
 
-            with open(pickle_path, "wb") as pkl_file:
-                pickle.dump(result, pkl_file)
+            outputs.save(file_id, result)
+            dedup_run.finished(file_id, result)
 
             return True
         except requests.exceptions.Timeout:
@@ -89,47 +97,54 @@ def unstructure_by_service(doc_path, file_id, url, token):
             return False
 
 
-def process_journal_entry(result):
-    """Processes a single journal entry."""
+def locate_journal_entry(result):
+    """Returns (file_id, pdf path) for an entry that still needs unstructuring, else None."""
     file_id = result[0]
     doi = result[1]
 
     if file_id == "5d2c326d-fec8-495d-84b9-0a81d1b9ecf0":
         logging.info(f"Skipping problematic file_id: {file_id}")
-        return
+        return None
 
-    pickle_path = os.path.join(OUTPUT_DIR, f"{file_id}.pkl")
-    if os.path.exists(pickle_path):
-        return
+    if outputs.exists(file_id):
+        return None
 
     coded_doi = quote(quote(doi))
     file_path = os.path.join(BASE_DIR, coded_doi + ".pdf")
 
     if not os.path.exists(file_path):
         logging.info(f"PDF file not found for {file_id}: {file_path}")
-        return
+        return None
+
+    return file_id, file_path
+
+
+def dedup_entries(dedup, entries):
+    """Copies of a PDF that is already unstructured reuse its result; other copies wait for the first one."""
+    global dedup_run
+    dedup_run = DedupRun(dedup, outputs, on_reused=upload_writer.mark)
+    return list(dedup_run.route(entries, file_id_of=lambda e: e[0], path_of=lambda e: e[1]))
+
+
+def screen_entries(entries):
+    """Drops PDFs that pre-screening quarantines; image-only PDFs (the slow OCR path) are moved to the front."""
+    with PreScreen.from_env() as screen:
+        screened = list(screen.gate(entries, path_of=lambda e: e[1], key=lambda e: e[0]))
+    logging.info(f"Pre-screen: {screen.summary()}")
+    ocr = [entry for entry, check in screened if check.verdict == OCR]
+    rest = [entry for entry, check in screened if check.verdict != OCR]
+    return ocr + rest
+
+
+def process_journal_entry(entry):
+    """Processes a single located journal entry."""
+    file_id, file_path = entry
 
     logging.info(f"Processing {file_id} at {file_path}")
     if not unstructure_by_service(file_path, file_id, PDF_URL, token):
         return  # Stop processing this entry if unstructuring fails
 
-    conn = None
-    try:
-        conn = db_pool.getconn()
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE journals SET upload_time = %s WHERE id = %s",
-                (datetime.now(UTC), file_id),
-            )
-            conn.commit()
-        logging.info(f"Updated upload_time for {file_id}")
-    except Exception as e:
-        logging.error(f"DB Error processing {file_id}: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            db_pool.putconn(conn)
+    upload_writer.mark(file_id)
 
 
 def main():
@@ -140,8 +155,16 @@ def main():
         with open("journals.pkl", "rb") as f:
             data = pickle.load(f)
 
+        dedup = PdfDedup.from_env()
+        try:
+            entries = dedup_entries(dedup, (entry for entry in map(locate_journal_entry, data) if entry))
+        finally:
+            dedup.close()
+        entries = screen_entries(entries)
+
         with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            executor.map(process_journal_entry, data)
+            executor.map(process_journal_entry, entries)
+        logging.info(f"Dedup: {dedup_run.summary()}")
 
         logging.info("All files processed.")
     finally:
@@ -1,5 +1,4 @@
 import os
-import requests
 import pickle
 from urllib.parse import quote
 from datetime import UTC, datetime
@@ -7,6 +6,9 @@ import psycopg2
 import logging
 from dotenv import load_dotenv
 
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+
 
 load_dotenv()
 
@@ -21,23 +23,20 @@ logging.basicConfig(
 token = os.environ.get("TOKEN")
 base_dir = "docs/journals/"
 output_dir = "docs/processed_docs/journal_new_pickle"
+outputs = OutputDir(output_dir)
 pdf_url = "http://localhost:8770/mineru"
 
 
 def unstructure_by_service(doc_path, file_id, url, token):
     with open(doc_path, "rb") as f:
-        pickle_filename = f"{file_id}.pkl"
-        pickle_path = os.path.join(output_dir, pickle_filename)
-
         files = {"file": f}
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(url, files=files, headers=headers)
+        response = post_multipart(url, files=files, headers=headers)
         response.raise_for_status()
         response_data = response.json()
         result = response_data.get("result")
 
-        with open(pickle_path, "wb") as pkl_file:
-            pickle.dump(result, pkl_file)
+        outputs.save(file_id, result)
 
 
 conn_pg = psycopg2.connect(
@@ -68,10 +67,8 @@ for result in data:
 
     coded_doi = quote(quote(doi))
     file_path = os.path.join(base_dir, coded_doi + ".pdf")
-    pickle_path = os.path.join(output_dir, f"{file_id}.pkl")
-
     # 如果pickle存在直接跳过，不写log
-    if os.path.exists(pickle_path):
+    if outputs.exists(file_id):
         continue
     else:
         if os.path.exists(file_path):
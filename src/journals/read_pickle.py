@@ -1,10 +1,13 @@
-import pickle
 import os
 
+from tools.s3_manifest import S3Manifest
+from tools.s3_prefetch import pooled_s3_client
+
 # from tools.chunk_by_sci_pdf import sci_chunk
 
-with open("docs_s3.pkl", "rb") as f:
-    docs_s3 = pickle.load(f)
+manifest = S3Manifest(pooled_s3_client(), "tiangong", "processed_docs/journal_pickle/")
+manifest.refresh()
+docs_s3 = manifest.keys(suffix=".pkl")
 
 
 # 读取processed_docs/journal_pickle/下所有的pickle文件的完整路径
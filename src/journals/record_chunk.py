@@ -4,6 +4,9 @@ from urllib.parse import quote
 
 import psycopg2
 
+from tools.output_layout import OutputDir
+from tools.work_discovery import iter_keyset
+
 conn_pg = psycopg2.connect(
     database=os.getenv("POSTGRES_DB"),
     user=os.getenv("POSTGRES_USER"),
@@ -19,37 +22,6 @@ conn_pg = psycopg2.connect(
 #     )
 #     results = cur.fetchall()
 
-with conn_pg.cursor() as cur:
-    cur.execute("SELECT COUNT(*) FROM journals WHERE upload_time IS NOT NULL")
-    total_records = cur.fetchone()[0]
-    offset = 0
-    batch_size = 3000
-
-    results = []
-    while offset < total_records:
-        cur.execute(
-            "SELECT doi, journal, date FROM journals WHERE upload_time IS NOT NULL LIMIT %s OFFSET %s",
-            (batch_size, offset),
-        )
-        batch_results = cur.fetchall()
-        if not batch_results:
-            break
-        results.extend(batch_results)
-        offset += batch_size
-
-pdf_list = []
-for record in results:
-    pdf_path = quote(quote(record[0] + ".pdf"))
-    pdf_list.append(
-        {
-            "doi": record[0],
-            "pdf_path": pdf_path,
-            "journal": record[1],
-            "date": record[2],
-        }
-    )
-
-
 def get_file_paths(directory):
     file_paths = set()
     for root, _, files in os.walk(directory):
@@ -59,20 +31,32 @@ def get_file_paths(directory):
     return file_paths
 
 
-def get_base_paths(file_paths, extension_length=4):
-    return {path[:-extension_length] for path in file_paths}
-
-
 pdf_directory = "docs/journals/"
 pickle_directory = "processed_docs/journal_pickle/"
 existing_pdf_paths = get_file_paths(pdf_directory)
-existing_pickle_paths = get_base_paths(get_file_paths(pickle_directory))
+existing_pickle_paths = OutputDir(pickle_directory).ids()
 missing_pdf_paths = existing_pdf_paths - existing_pickle_paths
 
-missing_pdf_list = [pdf for pdf in pdf_list if pdf["pdf_path"] in missing_pdf_paths]
+journal_records = iter_keyset(
+    conn_pg,
+    "journals",
+    ["doi", "journal", "date"],
+    where="upload_time IS NOT NULL",
+    batch_size=3000,
+)
 
-for pdf in missing_pdf_list:
-    pdf["pdf_path"] = "docs/journals/" + pdf["pdf_path"]
+missing_pdf_list = []
+for record in journal_records:
+    pdf_path = quote(quote(record.doi + ".pdf"))
+    if pdf_path in missing_pdf_paths:
+        missing_pdf_list.append(
+            {
+                "doi": record.doi,
+                "pdf_path": pdf_directory + pdf_path,
+                "journal": record.journal,
+                "date": record.date,
+            }
+        )
 
 
 # 将 missing_pdf_list 平均分成4份
@@ -1,8 +1,9 @@
-import os
 import pickle
 import math
 from pathlib import Path
 
+from tools.output_layout import OutputDir
+
 # ===== 参数 =====
 parts_files = [f"part{i}_journals.pkl" for i in range(1, 6)]
 processed_folder = Path("processed_docs/journal_new_pickle")
@@ -23,13 +24,8 @@ for fp in parts_files:
 all_ids_set = set(map(to_str_id, all_ids))
 print(f"合并后去重总量: {len(all_ids_set):,}")
 
-# 2) 读取 processed 文件名作为候选已处理ID（仅取去掉 .pkl 的“主干名”）
-processed_candidate_ids = set()
-for name in os.listdir(processed_folder):
-    if not name.endswith(".pkl"):
-        continue
-    stem = name[:-4]  # 去掉 .pkl
-    processed_candidate_ids.add(to_str_id(stem))
+# 2) 读取输出目录的完成索引作为候选已处理ID（分片目录无需逐个列目录；首次会扫描一次建立索引）
+processed_candidate_ids = set(map(to_str_id, OutputDir(str(processed_folder)).ids()))
 
 print(f"候选已处理（按文件名）数量: {len(processed_candidate_ids):,}")
 
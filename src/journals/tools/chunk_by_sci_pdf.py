@@ -8,19 +8,19 @@ from datetime import UTC, datetime
 from openai import OpenAI
 from pinecone import Pinecone
 import psycopg2
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.element_cleanup import clean_elements, large_images
+from tools.pdf_partition import partition_pdf_pages
 from tools.vision import vision_completion
 from unstructured.chunking.title import chunk_by_title
-from unstructured.cleaners.core import clean, group_broken_paragraphs
 from unstructured.documents.elements import (
     CompositeElement,
     Footer,
     Header,
-    Image,
     Table,
     TableChunk,
     Title,
 )
-from unstructured.partition.pdf import partition_pdf
 
 
 load_dotenv()
@@ -65,21 +65,12 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-def get_embeddings(text_list, model="text-embedding-3-small"):
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
-        for i in range(0, length, 1000):
-            results.append(
-                client.embeddings.create(
-                    input=text_list[i : i + 1000], model=model
-                ).data
-            )
-        return sum(results, [])
+embedder = EmbeddingBatcher(client)
 
-    except Exception as e:
-        print(e)
+
+def get_embeddings(text_list, model="text-embedding-3-small"):
+    text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
+    return embedder.embed(text_list, model=model)
 
 
 def check_misc(text):
@@ -130,7 +121,7 @@ def sci_chunk(pdf_list, vision=False):
 
     # 分割文档
     try:
-        elements = partition_pdf(
+        elements = partition_pdf_pages(
             filename=pdf_path,
             header_footer=False,
             pdf_extract_images=vision,
@@ -157,24 +148,10 @@ def sci_chunk(pdf_list, vision=False):
             filtered_elements.append(element)
 
     # 对文本和图像元素进行处理
-    for element in filtered_elements:
-        if element.text != "":
-            element.text = group_broken_paragraphs(element.text)
-            element.text = clean(
-                element.text,
-                bullets=False,
-                extra_whitespace=True,
-                dashes=False,
-                trailing_punctuation=False,
-            )
-        if vision:
-            if isinstance(element, Image):
-                point1 = element.metadata.coordinates.points[0]
-                point2 = element.metadata.coordinates.points[2]
-                width = abs(point2[0] - point1[0])
-                height = abs(point2[1] - point1[1])
-                if width >= min_image_width and height >= min_image_height:
-                    element.text = vision_completion(element.metadata.image_path)
+    clean_elements(filtered_elements)
+    if vision:
+        for element in large_images(filtered_elements, min_image_width, min_image_height):
+            element.text = vision_completion(element.metadata.image_path)
 
     # 将文档分割成块
     chunks = chunk_by_title(
@@ -218,7 +195,7 @@ def sci_chunk(pdf_list, vision=False):
         vectors.append(
             {
                 "id": doi + "_" + str(index),
-                "values": embeddings[index].embedding,
+                "values": embeddings[index],
                 "metadata": {
                     "text": item,
                     "doi": doi,
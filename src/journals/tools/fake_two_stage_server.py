@@ -0,0 +1,216 @@
+"""Local stand-in for the two-stage task API, for exercising the journal clients.
+
+Implements ``POST /two_stage/task``, ``GET /two_stage/task/{task_id}`` and
+(unless started with ``--no-bulk``) ``POST /two_stage/tasks/status``. Every
+submitted task stays PENDING for ``--queue-delay`` seconds, STARTED for a
+random duration in ``[--min-duration, --max-duration]`` and then succeeds
+(or fails with probability ``--failure-rate``). ``GET /stats`` reports
+request counters so round-trips per polling sweep can be compared.
+
+Usage:
+    python src/journals/tools/fake_two_stage_server.py --port 7770
+    TWO_STAGE_BASE=http://localhost:7770 python src/journals/two_stage_pipeline.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+
+@dataclass
+class FakeTask:
+    task_id: str
+    created: float
+    queue_delay: float
+    duration: float
+    fails: bool
+    size: int
+
+    def status(self, now: float) -> Dict:
+        elapsed = now - self.created
+        if elapsed < self.queue_delay:
+            return {"task_id": self.task_id, "state": "PENDING"}
+        if elapsed < self.queue_delay + self.duration:
+            return {"task_id": self.task_id, "state": "STARTED"}
+        if self.fails:
+            return {"task_id": self.task_id, "state": "FAILURE", "error": "simulated failure"}
+        return {
+            "task_id": self.task_id,
+            "state": "SUCCESS",
+            "result": [{"text": f"fake result for {self.task_id} ({self.size} bytes)", "page_number": 1}],
+        }
+
+
+class FakeTwoStageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        *,
+        bulk: bool = True,
+        queue_delay: float = 0.5,
+        min_duration: float = 1.0,
+        max_duration: float = 5.0,
+        failure_rate: float = 0.0,
+    ) -> None:
+        super().__init__(address, FakeTwoStageHandler)
+        self.bulk = bulk
+        self.queue_delay = queue_delay
+        self.min_duration = min_duration
+        self.max_duration = max(min_duration, max_duration)
+        self.failure_rate = failure_rate
+        self.tasks: Dict[str, FakeTask] = {}
+        self.counters: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def create_task(self, size: int) -> FakeTask:
+        task = FakeTask(
+            task_id=str(uuid.uuid4()),
+            created=time.time(),
+            queue_delay=self.queue_delay,
+            duration=random.uniform(self.min_duration, self.max_duration),
+            fails=random.random() < self.failure_rate,
+            size=size,
+        )
+        with self.lock:
+            self.tasks[task.task_id] = task
+        return task
+
+    def get_task(self, task_id: str) -> Optional[FakeTask]:
+        with self.lock:
+            return self.tasks.get(task_id)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+
+class FakeTwoStageHandler(BaseHTTPRequestHandler):
+    server: FakeTwoStageServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:  # keep stdout quiet
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body_chunks(self) -> Iterator[bytes]:
+        """The request body in pieces of at most 1 MiB (``Content-Length`` or chunked)."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                remaining = size
+                while remaining:
+                    piece = self.rfile.read(min(remaining, 1 << 20))
+                    remaining -= len(piece)
+                    yield piece
+                self.rfile.readline()  # CRLF after the chunk (or the last-chunk trailer)
+                if not size:
+                    return
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining > 0:
+            piece = self.rfile.read(min(remaining, 1 << 20))
+            if not piece:
+                return
+            remaining -= len(piece)
+            yield piece
+
+    def _drain_body(self) -> bytes:
+        return b"".join(self._body_chunks())
+
+    def do_POST(self) -> None:
+        if self.path == "/two_stage/task":
+            # Uploads are counted and discarded, so the server stays small next to a client under test.
+            size = sum(len(piece) for piece in self._body_chunks())
+            self.server.count("submit")
+            self.server.count("upload_bytes", size)
+            task = self.server.create_task(size)
+            self._send_json(200, {"task_id": task.task_id})
+        elif self.path == "/two_stage/tasks/status":
+            body = self._drain_body()
+            if not self.server.bulk:
+                self.server.count("bulk_rejected")
+                self._send_json(404, {"detail": "Not Found"})
+                return
+            task_ids = json.loads(body or b"{}").get("task_ids") or []
+            self.server.count("bulk_status")
+            self.server.count("bulk_status_ids", len(task_ids))
+            now = time.time()
+            tasks = {}
+            for task_id in task_ids:
+                task = self.server.get_task(task_id)
+                if task:
+                    tasks[task_id] = task.status(now)
+            self._send_json(200, {"tasks": tasks})
+        else:
+            self._drain_body()
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_GET(self) -> None:
+        prefix = "/two_stage/task/"
+        if self.path.startswith(prefix):
+            self.server.count("status")
+            task = self.server.get_task(self.path[len(prefix) :])
+            if task is None:
+                self._send_json(404, {"detail": "Unknown task"})
+                return
+            self._send_json(200, task.status(time.time()))
+        elif self.path == "/stats":
+            with self.server.lock:
+                payload = dict(self.server.counters, tasks=len(self.server.tasks))
+            self._send_json(200, payload)
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+
+def start_in_thread(port: int = 0, **kwargs) -> FakeTwoStageServer:
+    """Starts a server on a background thread; ``server.server_address`` has the port."""
+    server = FakeTwoStageServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Local stand-in for the two-stage task API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7770)
+    p.add_argument("--no-bulk", action="store_true", help="disable POST /two_stage/tasks/status")
+    p.add_argument("--queue-delay", type=float, default=0.5)
+    p.add_argument("--min-duration", type=float, default=1.0)
+    p.add_argument("--max-duration", type=float, default=5.0)
+    p.add_argument("--failure-rate", type=float, default=0.0)
+    args = p.parse_args()
+
+    server = FakeTwoStageServer(
+        (args.host, args.port),
+        bulk=not args.no_bulk,
+        queue_delay=args.queue_delay,
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        failure_rate=args.failure_rate,
+    )
+    print(f"Fake two-stage API listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
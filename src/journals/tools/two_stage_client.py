@@ -0,0 +1,161 @@
+"""HTTP client for the two-stage (MinerU/Celery) task API.
+
+``fetch_statuses`` asks for many task states in one round-trip through
+``POST /two_stage/tasks/status``. Servers that do not expose the bulk endpoint
+answer 404/405/501; the client remembers that and fans single
+``GET /two_stage/task/{task_id}`` calls out over its connection pool instead.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tools.multipart_stream import post_multipart
+
+BULK_UNSUPPORTED_CODES = {404, 405, 501}
+
+
+class TwoStageClient:
+    def __init__(
+        self,
+        api_base: str,
+        token: Optional[str] = None,
+        *,
+        pool_size: int = 8,
+        submit_timeout: float = 120,
+        status_timeout: float = 30000,
+        status_batch_size: int = 500,
+    ) -> None:
+        self.api_base = api_base.rstrip("/")
+        self.token = token
+        self.pool_size = max(1, pool_size)
+        self.submit_timeout = submit_timeout
+        self.status_timeout = status_timeout
+        self.status_batch_size = max(1, status_batch_size)
+        self.bulk_supported: Optional[bool] = None  # unknown until first bulk call
+
+        self.session = requests.Session()
+        # Callers' threads and the fan-out threads share one connection pool.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2 * self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._fanout: Optional[ThreadPoolExecutor] = None
+        self._fanout_lock = threading.Lock()
+
+    @property
+    def submit_url(self) -> str:
+        return f"{self.api_base}/two_stage/task"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def close(self) -> None:
+        if self._fanout:
+            self._fanout.shutdown(wait=False)
+            self._fanout = None
+        self.session.close()
+
+    def __enter__(self) -> "TwoStageClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------------------------------------------------------- submit
+
+    def submit(self, pdf_path: Path, form_data: Optional[Dict[str, str]] = None) -> str:
+        """Uploads a PDF and returns the Celery task id."""
+        form_data = form_data or {}
+        logging.info(
+            "Submitting %s with priority=%s provider=%s model=%s",
+            pdf_path,
+            form_data.get("priority", "<default>"),
+            form_data.get("provider", "<default>"),
+            form_data.get("model", "<default>"),
+        )
+        with Path(pdf_path).open("rb") as f:
+            # Streamed from the file: concurrent uploads of large PDFs do not each hold a full copy.
+            resp = post_multipart(
+                self.submit_url,
+                files={"file": f},
+                data=form_data,
+                headers=self._headers(),
+                session=self.session,
+                timeout=self.submit_timeout,
+            )
+        resp.raise_for_status()
+        task_id = resp.json().get("task_id")
+        if not task_id:
+            raise RuntimeError(f"Task ID missing in response for {pdf_path}")
+        logging.info("Submitted %s -> task %s", pdf_path, task_id)
+        return task_id
+
+    # ---------------------------------------------------------------- status
+
+    def fetch_status(self, task_id: str) -> Dict:
+        resp = self.session.get(
+            f"{self.api_base}/two_stage/task/{task_id}",
+            headers=self._headers(),
+            timeout=self.status_timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    def fetch_statuses(self, task_ids: Sequence[str]) -> Dict[str, Dict]:
+        """Returns ``{task_id: status}`` for the given ids.
+
+        Ids whose status could not be fetched are left out of the result so the
+        caller can retry them on its next sweep.
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        statuses: Dict[str, Dict] = {}
+        for start in range(0, len(task_ids), self.status_batch_size):
+            chunk = task_ids[start : start + self.status_batch_size]
+            if self.bulk_supported is not False:
+                bulk = self._fetch_bulk(chunk)
+                if bulk is not None:
+                    statuses.update(bulk)
+                    continue
+            statuses.update(self._fetch_fanout(chunk))
+        return statuses
+
+    def _fetch_bulk(self, task_ids: List[str]) -> Optional[Dict[str, Dict]]:
+        resp = self.session.post(
+            f"{self.api_base}/two_stage/tasks/status",
+            json={"task_ids": task_ids},
+            headers=self._headers(),
+            timeout=self.status_timeout,
+        )
+        if resp.status_code in BULK_UNSUPPORTED_CODES:
+            if self.bulk_supported is None:
+                logging.info(
+                    "Bulk status endpoint unavailable (HTTP %d); falling back to per-task polling",
+                    resp.status_code,
+                )
+            self.bulk_supported = False
+            return None
+        resp.raise_for_status()
+        self.bulk_supported = True
+        payload = resp.json()
+        tasks = payload.get("tasks", payload) if isinstance(payload, dict) else payload
+        if isinstance(tasks, list):
+            return {entry["task_id"]: entry for entry in tasks if entry.get("task_id")}
+        return dict(tasks)
+
+    def _fetch_fanout(self, task_ids: List[str]) -> Dict[str, Dict]:
+        with self._fanout_lock:
+            if self._fanout is None:
+                self._fanout = ThreadPoolExecutor(max_workers=self.pool_size)
+        statuses: Dict[str, Dict] = {}
+        futures = {task_id: self._fanout.submit(self.fetch_status, task_id) for task_id in task_ids}
+        for task_id, fut in futures.items():
+            try:
+                statuses[task_id] = fut.result()
+            except Exception as exc:
+                logging.warning("Status check failed for task %s: %s", task_id, exc)
+        return statuses
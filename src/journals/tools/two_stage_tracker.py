@@ -0,0 +1,324 @@
+"""Concurrent tracker for two-stage (MinerU/Celery) tasks.
+
+The tracker keeps a bounded window of tasks in flight: new PDFs are submitted
+as soon as a slot frees up, every task is polled on its own schedule (the poll
+interval backs off while the Celery state is unchanged and resets as soon as
+it moves), and timed-out or failed tasks are resubmitted up to
+``max_attempts``. Tasks that fall due together are polled with one batched
+status call. Every transition is recorded in a ``WorkLedger`` so a restarted
+run re-attaches to existing task ids instead of resubmitting. The run timeout
+can be set per item (``run_timeout_for``), e.g. scaled by page count.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from tools.work_ledger import IN_FLIGHT_STATES, WorkLedger
+
+TERMINAL_FAILURE_STATES = {"FAILURE", "REVOKED"}
+
+
+@dataclass
+class TrackedTask:
+    key: str
+    item: Any
+    attempts: int = 0
+    task_id: Optional[str] = None
+    state: Optional[str] = None
+    submitted_at: Optional[float] = None
+    started_at: Optional[float] = None
+    next_poll: float = 0.0
+    poll_interval: float = 0.0
+    busy: bool = False  # a submit/poll/handler future is outstanding
+    run_timeout: Optional[float] = None  # resolved on first use (see TaskTracker.run_timeout_for)
+
+
+@dataclass
+class TrackerStats:
+    submitted: int = 0
+    resumed: int = 0
+    polls: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retried: int = 0
+    failures: Dict[str, str] = field(default_factory=dict)
+
+
+class TaskTracker:
+    """Drives submit -> poll -> handle for an iterable of work items.
+
+    ``submit(item) -> task_id`` and ``fetch_statuses(task_ids) -> {task_id: status}``
+    perform the HTTP calls (ids missing from the returned mapping are treated
+    as a transient status error); ``on_success(item, result)`` persists a
+    finished result and ``on_failure(item, error)`` is called once an item has
+    exhausted its attempts. ``submit``, ``fetch_statuses`` and ``on_success``
+    run on the tracker's thread pool, so they must be thread-safe.
+    ``run_timeout_for(item)``, when given, replaces ``run_timeout`` per item.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[Any], str],
+        fetch_statuses: Callable[[Sequence[str]], Dict[str, Dict]],
+        on_success: Callable[[Any, Any], None],
+        on_failure: Optional[Callable[[Any, str], None]] = None,
+        *,
+        key: Callable[[Any], str] = lambda item: item.file_id,
+        max_in_flight: int = 64,
+        workers: int = 8,
+        poll_interval: float = 3.0,
+        max_poll_interval: float = 30.0,
+        status_batch_size: int = 500,
+        backoff: float = 1.5,
+        pending_timeout: float = 5000.0,
+        run_timeout: float = 800.0,
+        run_timeout_for: Optional[Callable[[Any], float]] = None,
+        max_attempts: int = 3,
+        ledger: Optional[WorkLedger] = None,
+    ) -> None:
+        self.submit = submit
+        self.fetch_statuses = fetch_statuses
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.key = key
+        self.max_in_flight = max(1, max_in_flight)
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.status_batch_size = max(1, status_batch_size)
+        self.backoff = max(1.0, backoff)
+        self.pending_timeout = pending_timeout
+        self.run_timeout = run_timeout
+        self.run_timeout_for = run_timeout_for
+        self.max_attempts = max(1, max_attempts)
+        self.ledger = ledger
+
+        self.stats = TrackerStats()
+        self._tasks: Dict[str, TrackedTask] = {}
+        self._futures: Dict[Future, Tuple[str, List[TrackedTask]]] = {}
+
+    # -------------------------------------------------------------- dispatch
+
+    def _dispatch(
+        self, pool: ThreadPoolExecutor, kind: str, tasks: List[TrackedTask], fn, *args
+    ) -> None:
+        for task in tasks:
+            task.busy = True
+        self._futures[pool.submit(fn, *args)] = (kind, tasks)
+
+    def _start(self, pool: ThreadPoolExecutor, item: Any) -> None:
+        key = self.key(item)
+        if key in self._tasks:
+            logging.warning("Duplicate work item %s already in flight; skipping", key)
+            return
+        task = TrackedTask(key=key, item=item)
+        self._tasks[key] = task
+        entry = self.ledger.get(key) if self.ledger else None
+        if entry and entry.state in IN_FLIGHT_STATES and entry.task_id:
+            task.task_id = entry.task_id
+            task.attempts = max(1, entry.attempts)
+            task.submitted_at = entry.submitted_at or time.time()
+            task.started_at = entry.started_at
+            task.poll_interval = self.poll_interval
+            task.next_poll = time.time()
+            self.stats.resumed += 1
+            logging.info("Re-attached %s to task %s", key, task.task_id)
+            return
+        if self.ledger:
+            self.ledger.mark_queued(key)
+        self._submit(pool, task)
+
+    def _submit(self, pool: ThreadPoolExecutor, task: TrackedTask) -> None:
+        task.attempts += 1
+        task.task_id = None
+        task.state = None
+        task.started_at = None
+        self._dispatch(pool, "submit", [task], self.submit, task.item)
+
+    def _retry_or_fail(self, pool: ThreadPoolExecutor, task: TrackedTask, error: str) -> None:
+        if task.attempts < self.max_attempts:
+            self.stats.retried += 1
+            logging.info(
+                "Retrying %s (attempt %d/%d) after: %s",
+                task.key,
+                task.attempts + 1,
+                self.max_attempts,
+                error,
+            )
+            self._submit(pool, task)
+            return
+        self._finish(task)
+        if self.ledger:
+            self.ledger.mark_failed(task.key, error, task.attempts)
+        self.stats.failed += 1
+        self.stats.failures[task.key] = error
+        logging.error("Failed after %d attempts: %s (%s)", task.attempts, task.key, error)
+        if self.on_failure:
+            try:
+                self.on_failure(task.item, error)
+            except Exception as exc:
+                logging.error("on_failure hook raised for %s: %s", task.key, exc)
+
+    def _finish(self, task: TrackedTask) -> None:
+        self._tasks.pop(task.key, None)
+
+    # -------------------------------------------------------------- handlers
+
+    def _handle_submit(self, pool: ThreadPoolExecutor, task: TrackedTask, fut: Future) -> None:
+        try:
+            task_id = fut.result()
+        except Exception as exc:
+            logging.error("Submit failed for %s: %s", task.key, exc)
+            self._retry_or_fail(pool, task, str(exc))
+            return
+        now = time.time()
+        task.task_id = task_id
+        task.submitted_at = now
+        task.poll_interval = self.poll_interval
+        task.next_poll = now + self.poll_interval
+        self.stats.submitted += 1
+        if self.ledger:
+            self.ledger.mark_submitted(task.key, task_id, task.attempts)
+
+    def _handle_status(self, pool: ThreadPoolExecutor, task: TrackedTask, data: Dict) -> None:
+        now = time.time()
+        state = data.get("state")
+        if not state:
+            self._retry_or_fail(pool, task, f"Task {task.task_id} response missing state: {data}")
+            return
+        if state == "SUCCESS":
+            result = data.get("result") or data.get("Result")
+            if result is None:
+                self._retry_or_fail(pool, task, f"Task {task.task_id} succeeded without result")
+                return
+            self._dispatch(pool, "handle", [task], self.on_success, task.item, result)
+            return
+        if state in TERMINAL_FAILURE_STATES:
+            self._retry_or_fail(pool, task, f"Task failed: {data.get('error')}")
+            return
+
+        if state == "STARTED" and task.started_at is None:
+            task.started_at = now
+            if self.ledger:
+                self.ledger.mark_started(task.key, now)
+        if state != task.state:
+            task.poll_interval = self.poll_interval
+        else:
+            task.poll_interval = min(task.poll_interval * self.backoff, self.max_poll_interval)
+        task.state = state
+        task.next_poll = now + task.poll_interval
+        self._check_timeouts(pool, task, now)
+
+    def _check_timeouts(self, pool: ThreadPoolExecutor, task: TrackedTask, now: float) -> None:
+        if task.started_at is not None:
+            if task.run_timeout is None:
+                task.run_timeout = self.run_timeout_for(task.item) if self.run_timeout_for else self.run_timeout
+            if now - task.started_at >= task.run_timeout:
+                self._retry_or_fail(pool, task, f"timeout after {task.run_timeout:.1f}s")
+        elif task.submitted_at is not None and now - task.submitted_at >= self.pending_timeout:
+            self._retry_or_fail(pool, task, f"Task {task.task_id} pending timeout")
+
+    def _handle_status_error(
+        self, pool: ThreadPoolExecutor, task: TrackedTask, error: object
+    ) -> None:
+        # Transient status errors only delay the next poll; the timeouts still
+        # bound how long a task can stay in flight.
+        logging.warning("Status check failed for %s (task %s): %s", task.key, task.task_id, error)
+        now = time.time()
+        task.poll_interval = min(task.poll_interval * self.backoff, self.max_poll_interval)
+        task.next_poll = now + task.poll_interval
+        self._check_timeouts(pool, task, now)
+
+    def _handle(self, pool: ThreadPoolExecutor, fut: Future) -> None:
+        kind, tasks = self._futures.pop(fut)
+        for task in tasks:
+            task.busy = False
+        if kind == "submit":
+            self._handle_submit(pool, tasks[0], fut)
+        elif kind == "poll":
+            self.stats.polls += 1
+            try:
+                statuses = fut.result()
+            except Exception as exc:
+                for task in tasks:
+                    self._handle_status_error(pool, task, exc)
+                return
+            for task in tasks:
+                data = statuses.get(task.task_id)
+                if data is None:
+                    self._handle_status_error(pool, task, "status missing from response")
+                else:
+                    self._handle_status(pool, task, data)
+        elif kind == "handle":
+            task = tasks[0]
+            try:
+                fut.result()
+            except Exception as exc:
+                logging.error("Failed to store result for %s (task %s): %s", task.key, task.task_id, exc)
+                self._retry_or_fail(pool, task, str(exc))
+                return
+            self._finish(task)
+            if self.ledger:
+                self.ledger.mark_succeeded(task.key)
+            self.stats.succeeded += 1
+
+    def _dispatch_polls(self, pool: ThreadPoolExecutor, now: float) -> None:
+        idle = [t for t in self._tasks.values() if not t.busy and t.task_id]
+        if not any(t.next_poll <= now for t in idle):
+            return
+        # Once something is due, pull in tasks that would fall due within half
+        # a base interval so they share the same status round-trip.
+        horizon = now + self.poll_interval / 2
+        due = [t for t in idle if t.next_poll <= horizon]
+        for start in range(0, len(due), self.status_batch_size):
+            batch = due[start : start + self.status_batch_size]
+            task_ids = [t.task_id for t in batch]
+            self._dispatch(pool, "poll", batch, self.fetch_statuses, task_ids)
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        due = [t.next_poll for t in self._tasks.values() if not t.busy and t.task_id]
+        if not due:
+            return None
+        return max(0.0, min(due) - now)
+
+    # ------------------------------------------------------------------- run
+
+    def run(self, items: Iterable[Any]) -> TrackerStats:
+        """Process every item; returns once all of them succeeded or failed."""
+        source: Iterator[Any] = iter(items)
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while not exhausted and len(self._tasks) < self.max_in_flight:
+                    try:
+                        item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    self._start(pool, item)
+
+                self._dispatch_polls(pool, time.time())
+
+                if exhausted and not self._tasks and not self._futures:
+                    break
+
+                timeout = self._next_wakeup(time.time())
+                if self._futures:
+                    done, _ = wait(list(self._futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        self._handle(pool, fut)
+                elif timeout:
+                    time.sleep(timeout)
+
+        logging.info(
+            "Tracker finished: %d succeeded, %d failed, %d retried, %d resumed, %d status batches.",
+            self.stats.succeeded,
+            self.stats.failed,
+            self.stats.retried,
+            self.stats.resumed,
+            self.stats.polls,
+        )
+        return self.stats
@@ -0,0 +1,176 @@
+"""Durable per-document work ledger for the journal pipelines (SQLite, WAL mode).
+
+Every file_id moves through ``queued -> submitted -> started -> succeeded`` (or
+``failed``) and the row keeps the Celery task id, the attempt count, the last
+error and the timestamps of each transition. A restarted run looks documents
+up here instead of stat-ing output pickles, and re-attaches to task ids that
+were still in flight when the previous run stopped.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+from tools.output_layout import OutputDir
+
+QUEUED = "queued"
+SUBMITTED = "submitted"
+STARTED = "started"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+IN_FLIGHT_STATES = (SUBMITTED, STARTED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    file_id      TEXT PRIMARY KEY,
+    state        TEXT NOT NULL,
+    task_id      TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    error        TEXT,
+    queued_at    REAL,
+    submitted_at REAL,
+    started_at   REAL,
+    finished_at  REAL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS work_state_idx ON work (state);
+"""
+
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    file_id: str
+    state: str
+    task_id: Optional[str]
+    attempts: int
+    error: Optional[str]
+    queued_at: Optional[float]
+    submitted_at: Optional[float]
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+
+class WorkLedger:
+    """Thread-safe wrapper around one SQLite connection."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "WorkLedger":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------ reads
+
+    def get(self, file_id: str) -> Optional[LedgerEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, state, task_id, attempts, error, queued_at, submitted_at,"
+                " started_at, finished_at FROM work WHERE file_id = ?",
+                (file_id,),
+            ).fetchone()
+        return LedgerEntry(*row) if row else None
+
+    def is_done(self, file_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM work WHERE file_id = ? AND state = ?", (file_id, SUCCEEDED)
+            ).fetchone()
+        return row is not None
+
+    def iter_state(self, *states: str) -> Iterator[LedgerEntry]:
+        placeholders = ",".join("?" for _ in states)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_id, state, task_id, attempts, error, queued_at, submitted_at,"
+                f" started_at, finished_at FROM work WHERE state IN ({placeholders})",
+                states,
+            ).fetchall()
+        for row in rows:
+            yield LedgerEntry(*row)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM work GROUP BY state").fetchall()
+        return dict(rows)
+
+    # ----------------------------------------------------------------- writes
+
+    def _upsert(self, file_id: str, state: str, **columns) -> None:
+        now = time.time()
+        columns["updated_at"] = now
+        names = ["file_id", "state", *columns]
+        updates = ", ".join(f"{name} = excluded.{name}" for name in ["state", *columns])
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO work ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})"
+                f" ON CONFLICT(file_id) DO UPDATE SET {updates}",
+                (file_id, state, *columns.values()),
+            )
+
+    def mark_queued(self, file_id: str) -> None:
+        self._upsert(file_id, QUEUED, queued_at=time.time(), error=None)
+
+    def mark_submitted(self, file_id: str, task_id: str, attempts: int) -> None:
+        self._upsert(
+            file_id,
+            SUBMITTED,
+            task_id=task_id,
+            attempts=attempts,
+            submitted_at=time.time(),
+            started_at=None,
+            finished_at=None,
+        )
+
+    def mark_started(self, file_id: str, started_at: Optional[float] = None) -> None:
+        self._upsert(file_id, STARTED, started_at=started_at or time.time())
+
+    def mark_succeeded(self, file_id: str) -> None:
+        self._upsert(file_id, SUCCEEDED, finished_at=time.time(), error=None)
+
+    def mark_failed(self, file_id: str, error: str, attempts: Optional[int] = None) -> None:
+        columns = {"finished_at": time.time(), "error": error}
+        if attempts is not None:
+            columns["attempts"] = attempts
+        self._upsert(file_id, FAILED, **columns)
+
+    def backfill_succeeded(self, file_ids: Iterable[str]) -> int:
+        """Records already-finished documents (e.g. pickles from before the ledger)."""
+        now = time.time()
+        rows = [(file_id, SUCCEEDED, now, now) for file_id in file_ids]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO work (file_id, state, finished_at, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+
+def backfill_from_pickles(ledger: WorkLedger, output_dir: Union[str, Path]) -> int:
+    """Seeds an empty ledger from the results in ``output_dir`` (its completed index, or one scan)."""
+    if ledger.counts() or not os.path.isdir(output_dir):
+        return 0
+    file_ids = OutputDir(str(output_dir)).ids()
+    count = ledger.backfill_succeeded(file_ids)
+    logging.info("Seeded ledger %s with %d finished documents from %s", ledger.path, count, output_dir)
+    return count
@@ -4,16 +4,19 @@ import pickle
 import time
 from csv import writer as csv_writer
 from dataclasses import dataclass
-from datetime import UTC, datetime
 from pathlib import Path
 from typing import Dict, Iterable, List, Tuple
 from urllib.parse import quote
 
-import requests
 from dotenv import load_dotenv
 import psycopg2
 import psycopg2.pool
 
+from tools.output_layout import OutputDir
+from tools.status_writer import StatusWriter
+from tools.two_stage_client import TwoStageClient
+from tools.work_ledger import IN_FLIGHT_STATES, SUCCEEDED, WorkLedger, backfill_from_pickles
+
 load_dotenv()
 
 API_BASE = (
@@ -21,7 +24,6 @@ API_BASE = (
     or os.environ.get("MINERU_TASK_BASE")
     or "http://localhost:7770"
 ).rstrip("/")
-SUBMIT_URL = f"{API_BASE}/two_stage/task"
 LOG_FILE = "celery_two_stage.log"
 DEFAULT_OUTPUT_DIR = Path("journal_pickle_queue")
 DEFAULT_JOURNALS_PKL = Path("journals_all.pkl")
@@ -32,9 +34,12 @@ DEFAULT_BATCH_INTERVAL = float(os.environ.get("TWO_STAGE_BATCH_INTERVAL", 10))
 MAX_ATTEMPTS = 3  # initial attempt + up to 2 retries
 BATCH_SIZE = 1000
 MAX_DB_CONNECTIONS = int(os.environ.get("TWO_STAGE_DB_MAXCONN", 4))
+STATUS_POOL_SIZE = int(os.environ.get("TWO_STAGE_STATUS_POOL_SIZE", 16))
+STATUS_BATCH_SIZE = int(os.environ.get("TWO_STAGE_STATUS_BATCH_SIZE", 500))
 DEFAULT_ERROR_CSV = Path(
     os.environ.get("TWO_STAGE_ERROR_CSV") or "error_file_id_two_stage.csv"
 )
+DEFAULT_LEDGER = Path(os.environ.get("TWO_STAGE_LEDGER") or "two_stage_enqueue_ledger.sqlite3")
 
 VISION_PROVIDER = (os.environ.get("VISION_PROVIDER") or "").strip()
 VISION_MODEL = (os.environ.get("VISION_MODEL") or "").strip()
@@ -53,6 +58,7 @@ CHUNK_TYPE = _bool_env("TWO_STAGE_CHUNK_TYPE", True)
 RETURN_TXT = _bool_env("TWO_STAGE_RETURN_TXT", False)
 
 db_pool: psycopg2.pool.ThreadedConnectionPool | None = None
+upload_writer: StatusWriter | None = None
 
 logging.basicConfig(
     filename=LOG_FILE,
@@ -79,46 +85,8 @@ def _build_form_data() -> Dict[str, str]:
     return form
 
 
-def submit_task(session: requests.Session, pdf_path: Path, token: str) -> str:
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
-    form_data = _build_form_data()
-    logging.info(
-        "Submitting %s with priority=%s provider=%s model=%s",
-        pdf_path,
-        form_data.get("priority", "<default>"),
-        form_data.get("provider", "<default>"),
-        form_data.get("model", "<default>"),
-    )
-    with pdf_path.open("rb") as f:
-        resp = session.post(
-            SUBMIT_URL,
-            files={"file": f},
-            data=form_data,
-            headers=headers,
-            timeout=120,
-        )
-    resp.raise_for_status()
-    data = resp.json()
-    task_id = data.get("task_id")
-    if not task_id:
-        raise RuntimeError(f"Task ID missing in response for {pdf_path}")
-    logging.info("Submitted %s -> task %s", pdf_path, task_id)
-    return task_id
-
-
-def fetch_status(
-    session: requests.Session,
-    task_id: str,
-    token: str,
-) -> Dict:
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
-    resp = session.get(
-        f"{API_BASE}/two_stage/task/{task_id}",
-        headers=headers,
-        timeout=30000,
-    )
-    resp.raise_for_status()
-    return resp.json()
+def submit_task(client: TwoStageClient, pdf_path: Path) -> str:
+    return client.submit(pdf_path, _build_form_data())
 
 
 @dataclass(frozen=True)
@@ -129,7 +97,7 @@ class JournalItem:
 
 
 def init_db_pool() -> None:
-    global db_pool
+    global db_pool, upload_writer
     if db_pool is not None:
         return
     db_pool = psycopg2.pool.ThreadedConnectionPool(
@@ -142,10 +110,14 @@ def init_db_pool() -> None:
         port=os.getenv("POSTGRES_PORT"),
     )
     logging.info("Database connection pool created.")
+    upload_writer = StatusWriter(db_pool, "journals", "upload_time", key_type="uuid")
 
 
 def close_db_pool() -> None:
-    global db_pool
+    global db_pool, upload_writer
+    if upload_writer is not None:
+        upload_writer.close()
+        upload_writer = None
     if db_pool is None:
         return
     db_pool.closeall()
@@ -153,28 +125,10 @@ def close_db_pool() -> None:
     logging.info("Database connection pool closed.")
 
 
-def update_upload_time(file_id: str) -> bool:
-    if db_pool is None:
+def update_upload_time(file_id: str) -> None:
+    if upload_writer is None:
         raise RuntimeError("Database pool not initialized")
-    conn = None
-    try:
-        conn = db_pool.getconn()
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE journals SET upload_time = %s WHERE id = %s",
-                (datetime.now(UTC), file_id),
-            )
-            conn.commit()
-        logging.info("Updated upload_time for %s", file_id)
-        return True
-    except Exception as exc:
-        logging.error("DB update failed for %s: %s", file_id, exc)
-        if conn:
-            conn.rollback()
-        return False
-    finally:
-        if conn:
-            db_pool.putconn(conn)
+    upload_writer.mark(file_id)
 
 
 def iter_journal_batches(pkl_path: Path, batch_size: int) -> Iterable[List[Tuple[str, str]]]:
@@ -208,14 +162,21 @@ def main() -> None:
     output_dir = Path(DEFAULT_OUTPUT_DIR)
     error_csv = Path(DEFAULT_ERROR_CSV)
     output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = OutputDir(str(output_dir))
 
     init_db_pool()
-    session = requests.Session()
+    ledger = WorkLedger(DEFAULT_LEDGER)
+    backfill_from_pickles(ledger, output_dir)
+    client = TwoStageClient(
+        API_BASE,
+        token,
+        pool_size=STATUS_POOL_SIZE,
+        status_batch_size=STATUS_BATCH_SIZE,
+    )
     try:
         attempts: Dict[str, int] = {}
         successes: Dict[str, str] = {}
         failures: Dict[str, str] = {}
-        db_failures: Dict[str, str] = {}
         recorded_failures: set[str] = set()
 
         has_work = False
@@ -232,11 +193,20 @@ def main() -> None:
                 if not file_id or not doi:
                     continue
 
-                pickle_path = output_dir / f"{file_id}.pkl"
-                if pickle_path.exists():
+                record = ledger.get(file_id)
+                if record and record.state == SUCCEEDED:
                     continue
 
                 pdf_path = build_pdf_path(doi)
+                if record and record.state in IN_FLIGHT_STATES and record.task_id:
+                    # Task from an interrupted run: keep polling it instead of resubmitting.
+                    attempts[file_id] = max(1, record.attempts)
+                    if record.started_at:
+                        run_start_times[record.task_id] = record.started_at
+                    tasks[record.task_id] = JournalItem(file_id=file_id, doi=doi, pdf_path=pdf_path)
+                    logging.info("Re-attached %s to task %s", file_id, record.task_id)
+                    continue
+
                 if not pdf_path.exists():
                     logging.info("PDF missing for %s (%s): %s", file_id, doi, pdf_path)
                     continue
@@ -246,7 +216,7 @@ def main() -> None:
                 while attempts[file_id] < MAX_ATTEMPTS:
                     attempts[file_id] += 1
                     try:
-                        task_id = submit_task(session, pdf_path, token)
+                        task_id = submit_task(client, pdf_path)
                         break
                     except Exception as exc:
                         logging.error(
@@ -261,10 +231,12 @@ def main() -> None:
                             time.sleep(DEFAULT_INTERVAL)
                 if task_id is None:
                     failures[file_id] = "submit_task failed"
+                    ledger.mark_failed(file_id, failures[file_id], attempts[file_id])
                     if file_id not in recorded_failures:
                         append_failure_id(error_csv, file_id)
                         recorded_failures.add(file_id)
                     continue
+                ledger.mark_submitted(file_id, task_id, attempts[file_id])
                 tasks[task_id] = JournalItem(file_id=file_id, doi=doi, pdf_path=pdf_path)
 
             if not tasks:
@@ -276,9 +248,12 @@ def main() -> None:
 
             while tasks:
                 finished: Dict[str, JournalItem] = {}
+                statuses = client.fetch_statuses(list(tasks))
                 for task_id, item in list(tasks.items()):
                     try:
-                        data = fetch_status(session, task_id, token)
+                        data = statuses.get(task_id)
+                        if data is None:
+                            raise RuntimeError(f"Status unavailable for task {task_id}")
                         state = data.get("state")
                         if not state:
                             raise RuntimeError(f"Task {task_id} response missing state: {data}")
@@ -291,20 +266,18 @@ def main() -> None:
                         else:
                             if state == "STARTED" and task_id not in run_start_times:
                                 run_start_times[task_id] = time.time()
+                                ledger.mark_started(item.file_id, run_start_times[task_id])
                             started_at = run_start_times.get(task_id)
                             if started_at is not None:
                                 elapsed = time.time() - started_at
                                 if elapsed >= DEFAULT_TIMEOUT:
                                     raise TimeoutError(f"Task {task_id} timeout")
                             continue
-                        pickle_path = output_dir / f"{item.file_id}.pkl"
-                        with pickle_path.open("wb") as f:
-                            pickle.dump(result, f)
+                        pickle_path = outputs.save(item.file_id, result)
                         logging.info("Wrote %s", pickle_path)
-                        if update_upload_time(item.file_id):
-                            successes[item.file_id] = task_id
-                        else:
-                            db_failures[item.file_id] = "upload_time update failed"
+                        ledger.mark_succeeded(item.file_id)
+                        update_upload_time(item.file_id)
+                        successes[item.file_id] = task_id
                         finished[task_id] = item
                     except TimeoutError:
                         error_msg = f"timeout after {DEFAULT_TIMEOUT:.1f}s"
@@ -321,10 +294,12 @@ def main() -> None:
                                 attempts[item.file_id],
                                 MAX_ATTEMPTS,
                             )
-                            new_task = submit_task(session, item.pdf_path, token)
+                            new_task = submit_task(client, item.pdf_path)
+                            ledger.mark_submitted(item.file_id, new_task, attempts[item.file_id])
                             tasks[new_task] = item
                         else:
                             failures[item.file_id] = error_msg
+                            ledger.mark_failed(item.file_id, error_msg, attempts[item.file_id])
                             if item.file_id not in recorded_failures:
                                 append_failure_id(error_csv, item.file_id)
                                 recorded_failures.add(item.file_id)
@@ -342,10 +317,12 @@ def main() -> None:
                                 attempts[item.file_id],
                                 MAX_ATTEMPTS,
                             )
-                            new_task = submit_task(session, item.pdf_path, token)
+                            new_task = submit_task(client, item.pdf_path)
+                            ledger.mark_submitted(item.file_id, new_task, attempts[item.file_id])
                             tasks[new_task] = item
                         else:
                             failures[item.file_id] = str(exc)
+                            ledger.mark_failed(item.file_id, str(exc), attempts[item.file_id])
                             if item.file_id not in recorded_failures:
                                 append_failure_id(error_csv, item.file_id)
                                 recorded_failures.add(item.file_id)
@@ -365,10 +342,9 @@ def main() -> None:
             return
 
         logging.info(
-            "Finished two-stage enqueue: %d successes, %d failures, %d db failures.",
+            "Finished two-stage enqueue: %d successes, %d failures.",
             len(successes),
             len(failures),
-            len(db_failures),
         )
         for file_id, err in failures.items():
             logging.error(
@@ -377,10 +353,9 @@ def main() -> None:
             if file_id not in recorded_failures:
                 append_failure_id(error_csv, file_id)
                 recorded_failures.add(file_id)
-        for file_id, err in db_failures.items():
-            logging.error("DB update failed for %s (%s)", file_id, err)
     finally:
-        session.close()
+        client.close()
+        ledger.close()
         close_db_pool()
 
 
@@ -8,6 +8,8 @@ from typing import Dict, Iterable
 import requests
 from dotenv import load_dotenv
 
+from tools.multipart_stream import post_multipart
+
 load_dotenv()
 
 API_BASE = (
@@ -76,11 +78,12 @@ def submit_task(session: requests.Session, pdf_path: Path, token: str) -> str:
         form_data.get("model", "<default>"),
     )
     with pdf_path.open("rb") as f:
-        resp = session.post(
+        resp = post_multipart(
             SUBMIT_URL,
             files={"file": f},
             data=form_data,
             headers=headers,
+            session=session,
             timeout=120,
         )
     resp.raise_for_status()
@@ -2,18 +2,24 @@
 
 import logging # 导入日志模块
 import os # 导入操作系统模块
-import pickle # 导入pickle模块
-import time # 导入时间模块
-from dataclasses import dataclass # 导入数据结构
+from dataclasses import dataclass, replace # 导入数据结构（replace 用于给预检结果打 OCR 标记）
+from functools import lru_cache # 导入缓存装饰器
 from pathlib import Path # 导入路径模块
-from typing import Dict, Iterable, Iterator, List, Optional # 导入类型注解模块（字典、可迭代对象类型、迭代器类型、列表、可选等）
-from datetime import UTC, datetime # 导入时间模块
+from typing import Dict, Iterable, Iterator, Optional # 导入类型注解模块（字典、可迭代对象类型、迭代器类型、可选等）
 
 import psycopg2 # 导入psycopg2库，用于连接PostgreSQL数据库
 import psycopg2.pool # 导入连接池模块
-import requests # 导入请求模块
 from dotenv import load_dotenv # 导入环境变量加载模块
 
+from tools.doc_cost import CostEstimator, longest_first, scaled_timeout # 导入 PDF 页数估计（带缓存）与最长任务优先排序
+from tools.output_layout import OutputDir # 导入分片输出目录（哈希前缀子目录 + 完成索引，pickle / parquet 由 CHUNK_FORMAT 决定）
+from tools.pdf_dedup import DedupRun, PdfDedup # 导入内容哈希去重（同一 PDF 的 DOI 名 / UUID 名副本只提交一次）
+from tools.pre_screen import OCR, PreScreen # 导入提交前 PDF 预检闸门（损坏/加密/0 页隔离，纯图片走 OCR 队列）
+from tools.status_writer import StatusWriter # 导入批量写库缓冲（需 PYTHONPATH=src）
+from tools.two_stage_client import TwoStageClient # 导入两阶段接口客户端
+from tools.two_stage_tracker import TaskTracker # 导入并发任务跟踪器
+from tools.work_ledger import WorkLedger, backfill_from_pickles # 导入持久化工作台账
+
 load_dotenv()
 
 ## 读取环境变量，配置常量，设置 API 地址、目录、批量参数、超时等
@@ -23,32 +29,44 @@ API_BASE = (
     or "http://localhost:7770" 
 ).rstrip("/") # 去除末尾斜杠
 
-SUBMIT_URL = f"{API_BASE}/two_stage/task" # 提交任务的URL
 LOG_FILE = "celery_two_stage_normal.log" # 写死日志文件名
 
 DEFAULT_INPUT_DIR = Path("docs/journals") # 输入地址
 DEFAULT_OUTPUT_DIR = Path("docs/processed_docs/journal_two_stage_pickle") # 输出地址
-DEFAULT_INTERVAL = float(os.environ.get("TWO_STAGE_POLL_INTERVAL", 3)) # 轮询间隔
-DEFAULT_TIMEOUT = float(os.environ.get("TWO_STAGE_POLL_TIMEOUT", 800)) # 轮询超时
+BASE_DIR = Path(os.environ.get("TWO_STAGE_INPUT_DIR") or DEFAULT_INPUT_DIR) # 实际输入目录
+OUTPUT_DIR = Path(os.environ.get("TWO_STAGE_OUTPUT_DIR") or DEFAULT_OUTPUT_DIR) # 实际输出目录
+DEFAULT_INTERVAL = float(os.environ.get("TWO_STAGE_POLL_INTERVAL", 3)) # 轮询间隔（初始）
+MAX_POLL_INTERVAL = float(os.environ.get("TWO_STAGE_MAX_POLL_INTERVAL", 30)) # 状态不变时退避到的最大轮询间隔
+DEFAULT_TIMEOUT = float(os.environ.get("TWO_STAGE_POLL_TIMEOUT", 800)) # 轮询超时（运行超时下限）
+TIMEOUT_PER_PAGE = float(os.environ.get("TWO_STAGE_TIMEOUT_PER_PAGE", 3)) # 运行超时按估计页数放大（秒/页）
+MAX_TIMEOUT = float(os.environ.get("TWO_STAGE_MAX_TIMEOUT", 6 * 3600)) # 运行超时上限
 
 PENDING_TIMEOUT = float(os.environ.get("TWO_STAGE_PENDING_TIMEOUT", 5000)) # 待处理超时
 MAX_ATTEMPTS = int(os.environ.get("TWO_STAGE_MAX_ATTEMPTS", 3)) # 最大尝试次数
 MAX_WORKERS = int(os.environ.get("TWO_STAGE_DB_WORKERS", 4)) # 最大工作线程数
-BATCH_SIZE = int(os.environ.get("TWO_STAGE_BATCH_SIZE", 5000)) # 批处理大小
+MAX_IN_FLIGHT = int(
+    os.environ.get("TWO_STAGE_MAX_IN_FLIGHT") or os.environ.get("TWO_STAGE_BATCH_SIZE", 5000)
+) # 同时在途的任务上限（原批处理大小）
+CLIENT_WORKERS = int(os.environ.get("TWO_STAGE_CLIENT_WORKERS", 8)) # 提交/轮询/写结果的线程数
+LEDGER_PATH = Path(os.environ.get("TWO_STAGE_LEDGER") or "two_stage_ledger.sqlite3") # 工作台账（SQLite），重启后续接在途任务
 DB_FETCH_SIZE = int(os.environ.get("TWO_STAGE_DB_FETCH_SIZE", 1000)) # 数据库提取大小
 SUBMIT_TIMEOUT = float(os.environ.get("TWO_STAGE_SUBMIT_TIMEOUT", 120)) # 提交超时
 STATUS_TIMEOUT = float(os.environ.get("TWO_STAGE_STATUS_TIMEOUT", 30000)) # 状态超时
+STATUS_BATCH_SIZE = int(os.environ.get("TWO_STAGE_STATUS_BATCH_SIZE", 500)) # 单次批量状态查询的任务数
+LPT_WINDOW = int(os.environ.get("TWO_STAGE_LPT_WINDOW", 500)) # 每组按页数从多到少排序提交的条数（首批提交前需估完一组，不宜过大）
 
 VISION_PROVIDER = (os.environ.get("VISION_PROVIDER") or "").strip() # 视觉提供商
 VISION_MODEL = (os.environ.get("VISION_MODEL") or "").strip() # 视觉模型
 VISION_PROMPT = (os.environ.get("VISION_PROMPT") or "").strip() # 视觉提示
 PRIORITY = (os.environ.get("TWO_STAGE_PRIORITY") or "normal").strip().lower() or "normal" # 优先级
+OCR_PRIORITY = (os.environ.get("TWO_STAGE_OCR_PRIORITY") or PRIORITY).strip().lower() # 纯图片 PDF（需 OCR）提交时使用的优先级
+OCR_COST_FACTOR = float(os.environ.get("TWO_STAGE_OCR_COST_FACTOR", 3)) # OCR 页相对文本页的耗时倍数（用于排序与运行超时）
 
 
 ## 获取表单数据
-def _build_form_data() -> Dict[str, str]:
+def _build_form_data(ocr: bool = False) -> Dict[str, str]:
     form: Dict[str, str] =  {}
-    form["priority"] = PRIORITY
+    form["priority"] = OCR_PRIORITY if ocr else PRIORITY # 预检判定为纯图片的 PDF 走 OCR 优先级
     if VISION_PROVIDER:
         form["provider"] = VISION_PROVIDER
     if VISION_MODEL:
@@ -85,22 +103,26 @@ class WorkItem:
     file_id: str # uuid
     doi: str # DOI
     pdf_path: Path
+    ocr: bool = False # 预检判定为纯图片 PDF
 
 CHUNK_TYPE = _bool_env("TWO_STAGE_CHUNK_TYPE", True) # 是否分块类型
 RETURN_TXT = _bool_env("TWO_STAGE_RETURN_TXT", False) # 是否返回文本
+DEDUP = _bool_env("TWO_STAGE_DEDUP", True) # 提交前是否按内容哈希去重（PDF_DEDUP_INDEX 配置索引位置）
+PRE_SCREEN = _bool_env("TWO_STAGE_PRE_SCREEN", True) # 提交前是否预检（PRE_SCREEN_* 配置进程数、缓存、隔离清单）
 
 
 # 4、初始化数据库连接池。
 
 db_pool = None # 把变量 db_pool 先初始化为空值（None）用于保存数据库连接池对象
+upload_writer: Optional[StatusWriter] = None # upload_time 批量写入缓冲
 
 def init_db_pool() -> None:
-    """Initializes the database connection pool.""" 
-    global db_pool
+    """Initializes the database connection pool and the upload_time writer.""" 
+    global db_pool, upload_writer
     try:
-        db_pool = psycopg2.pool.ThreadSafeConnectionPool(
+        db_pool = psycopg2.pool.ThreadedConnectionPool(
             minconn=1,
-            maxconn=MAX_WORKERS,
+            maxconn=max(MAX_WORKERS, CLIENT_WORKERS + 1), # 结果在线程池中写库，另留一个连接给待处理记录游标
             database=os.getenv("POSTGRES_DB"),
             user=os.getenv("POSTGRES_USER"),
             password=os.getenv("POSTGRES_PASSWORD"),
@@ -108,12 +130,15 @@ def init_db_pool() -> None:
             port=os.getenv("POSTGRES_PORT"),
         )
         logging.info("Database connection pool created successfully.")
+        upload_writer = StatusWriter(db_pool, "journals", "upload_time", key_type="uuid") # 累积后一次 UPDATE ... FROM (VALUES ...)
     except psycopg2.OperationalError as exc:
         logging.error("Failed to create database connection pool: %s", exc)
         raise
 
 def close_db_pool() -> None: # 关闭数据库连接池
-    """Closes all connections in the pool."""
+    """Flushes pending status updates and closes all connections in the pool."""
+    if upload_writer:
+        upload_writer.close() # 先把缓冲中的 upload_time 写完
     if db_pool:
         db_pool.closeall()
         logging.info("Database connection pool closed.")
@@ -139,9 +164,9 @@ def _resolve_pdf_path(doi: str, pdf_index: Dict[str, Path]) -> Optional[Path]: #
 
 # 6、待处理任务获取，从数据库拉取 upload_time 为空的记录。！！
 
-# 查数据库 → 用 doi 找 PDF → 遍历目录下的pdf文件，跳过已有 pickle → 产出待处理项
+# 查数据库 → 用 doi 找 PDF → 查台账跳过已完成的 → 产出待处理项
 def iter_unprocessed_items( 
-    base_dir: Path, output_dir: Path, pdf_index: Dict[str, Path]
+    base_dir: Path, ledger: WorkLedger, pdf_index: Dict[str, Path]
 ) -> Iterator[WorkItem]:
     if not base_dir.exists():
         logging.error("PDF base directory not found: %s", base_dir) # 目录不存在就直接停止
@@ -173,9 +198,9 @@ def iter_unprocessed_items(
                             doi,
                         )
                         continue
-                    pickle_path = output_dir / f"{file_id}.pkl"
-                    if pickle_path.exists():
-                        logging.info("Pickle already exists for %s; skipping", file_id) # 已有 pickle 文件就跳过
+                    if ledger.is_done(file_id):
+                        logging.info("Already processed %s; skipping", file_id) # 台账中已成功就跳过（索引查询，不再逐个 stat）
+                        update_upload_time(file_id) # 台账已成功但库里仍为空（上次退出前未写入），补写
                         continue
                     yield WorkItem(file_id=file_id, doi=doi, pdf_path=pdf_path) # 产出待处理项
     finally:
@@ -183,235 +208,102 @@ def iter_unprocessed_items(
             db_pool.putconn(conn) # 连接池获取失败时，不在 finally 里报错：先 conn = None，回收时加 if conn
 
 
-# 7、任务提交与状态查询。
+# 6.1、内容去重：同一内容已有结果则直接复制；本次运行中只提交第一份，其余等待其结果。
 
+def mark_reused(ledger: WorkLedger, file_id: str) -> None:
+    ledger.mark_succeeded(file_id) # 复用结果的副本不经过 tracker，手动记台账
+    update_upload_time(file_id)
 
-## 提交任务（PDF提交到两阶段处理接口，并拿回task ID）
-def submit_task(session: requests.Session, pdf_path: Path, token: str) -> str:
-    headers = {"Authorization": f"Bearer {token}"} if token else {} # 如果有 token，就加上授权头
-    form_data = _build_form_data() # 生成表单参数
-    logging.info(
-        "Submitting %s with priority=%s provider=%s model=%s", 
-        pdf_path,
-        form_data.get("priority", "<default>"),
-        form_data.get("provider", "<default>"),
-        form_data.get("model", "<default>"),
-    )
-    with pdf_path.open("rb") as f: # 以二进制方式打开 PDF 文件
-        resp = session.post(
-            SUBMIT_URL,
-            files={"file": f}, # 上传文件
-            data=form_data, # 表单数据
-            headers=headers, # 请求头
-            timeout=SUBMIT_TIMEOUT, # 防止卡死
-        )
-    resp.raise_for_status()
-    data = resp.json() # 解析服务端返回的 JSON
-    task_id = data.get("task_id") # 取出任务 ID，如果没有就报错
-    if not task_id:
-        raise RuntimeError(f"Task ID missing in response for {pdf_path}")
-    logging.info("Submitted %s -> task %s", pdf_path, task_id)
-    return task_id # 返回任务 ID，后续用它去轮询状态
-
-
-## 轮询查询任务状态
-def fetch_status(
-    session: requests.Session, 
-    task_id: str, 
-    token: str
-) -> Dict:
-    headers = {"Authorization": f"Bearer {token}"} if token else {} 
-    resp = session.get(
-        f"{API_BASE}/two_stage/task/{task_id}",
-        headers=headers,
-        timeout=30000, # 超时时间写死
-    )
-    resp.raise_for_status()
-    return resp.json()
 
+def dedup_items(dedup_run: DedupRun, items: Iterable[WorkItem]) -> Iterator[WorkItem]:
+    return dedup_run.route(items, file_id_of=lambda item: item.file_id, path_of=lambda item: item.pdf_path)
 
-# 8、结果存储为 pickle 文件。 一次性提取id、doi（根据doi匹配）
 
-def _write_pickle(output_dir: Path, file_id: str, result: object) -> Path:
-    pickle_path = output_dir / f"{file_id}.pkl"
-    with pickle_path.open("wb") as f:
-        pickle.dump(result, f)
-    return pickle_path
+# 6.2、提交前预检：隔离的文件不提交（台账记为失败并写入隔离清单），纯图片 PDF 打上 OCR 标记。
 
-# 9、更新数据库中的 upload_time。
-def update_upload_time(file_id: str) -> None:
-    if not db_pool:
-        raise RuntimeError("Database pool is not initialized")
-    conn = None
-    try:
-        conn = db_pool.getconn()
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE journals SET upload_time = %s WHERE id = %s",
-                (datetime.now(UTC), file_id),
-            )
-            conn.commit()
-        logging.info("Updated upload_time for %s", file_id)
-    except Exception as exc:
-        logging.error("DB Error processing %s: %s", file_id, exc)
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            db_pool.putconn(conn)
-
-
-## 批量处理与重试，按批提交、轮询、超时重试、统计成功失败数量。
-def _process_batch(
-    session: requests.Session,
-    token: str,
-    batch: List[WorkItem],
-    output_dir: Path,
-    attempts: Dict[str, int],
-    failures: Dict[str, str],
-) -> int:
-    tasks: Dict[str, WorkItem] = {}
-    run_start_times: Dict[str, float] = {}
-    submit_times: Dict[str, float] = {} # 记录提交时间
-    success_count = 0
-
-    for item in batch:
-        attempts[item.file_id] = attempts.get(item.file_id, 0) + 1
-        try:
-            task_id = submit_task(session, item.pdf_path, token)
-        except Exception as exc:
-            logging.error("Submit failed for %s: %s", item.pdf_path, exc)
-            failures[item.file_id] = str(exc)
-            continue
-        submit_times[task_id] = time.time()  # 记录提交时间
-        tasks[task_id] = item
-
-    if not tasks:
-        return success_count
-
-    while tasks:
-        finished: List[str] = []
-        for task_id, item in list(tasks.items()):
-            try:
-                data = fetch_status(session, task_id, token)
-                state = data.get("state")
-                if not state:
-                    raise RuntimeError(f"Task {task_id} response missing state: {data}")
-                if state == "SUCCESS":
-                    result = data.get("result") or data.get("Result")
-                    if result is None:
-                        raise RuntimeError(f"Task {task_id} succeeded without result")
-                elif state in {"FAILURE", "REVOKED"}:
-                    raise RuntimeError(f"Task failed: {data.get('error')}")
-                else:
-                    if state == "STARTED" and task_id not in run_start_times:
-                        run_start_times[task_id] = time.time()
-                    submitted_at = submit_times.get(task_id)
-                    if submitted_at is not None:
-                        pending_elapsed = time.time() - submitted_at
-                        if pending_elapsed >= PENDING_TIMEOUT:
-                            raise TimeoutError(f"Task {task_id} pending timeout")
-                    started_at = run_start_times.get(task_id)
-                    if started_at is not None:
-                        elapsed = time.time() - started_at
-                        if elapsed >= DEFAULT_TIMEOUT:
-                            raise TimeoutError(f"Task {task_id} timeout")
-                    continue
-
-                pickle_path = _write_pickle(output_dir, item.file_id, result)
-                logging.info("Wrote %s", pickle_path)
-                update_upload_time(item.file_id)
-                finished.append(task_id)
-                success_count += 1
-            except TimeoutError as exc:
-                error_msg = str(exc)
-                if "pending" not in error_msg.lower():
-                    error_msg = f"timeout after {DEFAULT_TIMEOUT:.1f}s"
-                logging.error("Task %s timed out for %s (%s)", task_id, item.pdf_path, error_msg)
-                finished.append(task_id)
-                if attempts.get(item.file_id, 1) < MAX_ATTEMPTS:
-                    attempts[item.file_id] += 1
-                    logging.info(
-                        "Retrying %s (attempt %d/%d)...",
-                        item.pdf_path,
-                        attempts[item.file_id],
-                        MAX_ATTEMPTS,
-                    )
-                    try:
-                        new_task = submit_task(session, item.pdf_path, token)
-                    except Exception as retry_exc:
-                        logging.error(
-                            "Retry submit failed for %s: %s",
-                            item.pdf_path,
-                            retry_exc,
-                        )
-                        failures[item.file_id] = str(retry_exc)
-                    else:
-                        tasks[new_task] = item
-                else:
-                    failures[item.file_id] = error_msg
-            except Exception as exc:
-                logging.error("Failed to process %s (task %s): %s", item.pdf_path, task_id, exc)
-                finished.append(task_id)
-                if attempts.get(item.file_id, 1) < MAX_ATTEMPTS:
-                    attempts[item.file_id] += 1
-                    logging.info(
-                        "Retrying %s (attempt %d/%d)...",
-                        item.pdf_path,
-                        attempts[item.file_id],
-                        MAX_ATTEMPTS,
-                    )
-                    try:
-                        new_task = submit_task(session, item.pdf_path, token)
-                    except Exception as retry_exc:
-                        logging.error(
-                            "Retry submit failed for %s: %s",
-                            item.pdf_path,
-                            retry_exc,
-                        )
-                        failures[item.file_id] = str(retry_exc)
-                    else:
-                        tasks[new_task] = item
-                else:
-                    failures[item.file_id] = str(exc)
+def screen_items(screen: PreScreen, ledger: WorkLedger, items: Iterable[WorkItem]) -> Iterator[WorkItem]:
+    def quarantine(item: WorkItem, result) -> None:
+        ledger.mark_failed(item.file_id, "pre-screen: " + "; ".join(result.issues)) # 毫秒级拒绝，不占用 GPU 后端的超时
+
+    for item, result in screen.gate(
+        items, path_of=lambda item: item.pdf_path, key=lambda item: item.file_id, on_quarantine=quarantine
+    ):
+        yield replace(item, ocr=True) if result.verdict == OCR else item
+
+
+def _item_cost(estimator: CostEstimator, item: WorkItem) -> float:
+    pages = estimator.pages(item.pdf_path)
+    return pages * OCR_COST_FACTOR if item.ocr else pages # OCR 页更慢：更早提交、更长超时
 
-        for task_id in finished:
-            tasks.pop(task_id, None)
-            run_start_times.pop(task_id, None)
 
-        if tasks:
-            time.sleep(DEFAULT_INTERVAL)
+# 7、任务提交与状态查询（TwoStageClient：批量状态查询，服务端不支持时回退为连接池并发单查）。
 
-    return success_count
 
-## 批量处理所有待处理项
-def process_items(session: requests.Session, token: str, items: Iterable[WorkItem]) -> None:
-    attempts: Dict[str, int] = {}
-    failures: Dict[str, str] = {}
-    total_success = 0
+def _submit_task(client: TwoStageClient, item: WorkItem) -> str:
+    return client.submit(item.pdf_path, _build_form_data(item.ocr)) # 提交 PDF 并拿回 task ID
 
-    batch: List[WorkItem] = []
-    for item in items:
-        batch.append(item)
-        if len(batch) >= BATCH_SIZE:
-            total_success += _process_batch(session, token, batch, OUTPUT_DIR, attempts, failures)
-            batch = []
 
-    if batch:
-        total_success += _process_batch(session, token, batch, OUTPUT_DIR, attempts, failures)
+# 8、结果存储为 pickle 或 parquet 文件（CHUNK_FORMAT），写入哈希分片子目录，先写临时文件再改名。 一次性提取id、doi（根据doi匹配）
+
+@lru_cache(maxsize=None)
+def _output_dir(output_dir: Path) -> OutputDir:
+    return OutputDir(str(output_dir)) # 每个目录只读一次分片布局标记，线程间共用
+
+
+def _write_pickle(output_dir: Path, file_id: str, result: object) -> Path:
+    return Path(_output_dir(output_dir).save(file_id, result))
+
+# 9、更新数据库中的 upload_time（写入缓冲，按数量/时间阈值批量提交）。
+def update_upload_time(file_id: str) -> None:
+    if not upload_writer:
+        raise RuntimeError("Database pool is not initialized")
+    upload_writer.mark(file_id)
+
+
+## 并发处理所有待处理项：有界在途窗口，空出名额即提交，按任务自适应退避轮询，超时/失败重试。
+def process_items(
+    client: TwoStageClient,
+    ledger: WorkLedger,
+    items: Iterable[WorkItem],
+    estimator: Optional[CostEstimator] = None,
+    dedup_run: Optional[DedupRun] = None,
+) -> None:
+    def store_result(item: WorkItem, result: object) -> None:
+        pickle_path = _write_pickle(OUTPUT_DIR, item.file_id, result)
+        logging.info("Wrote %s", pickle_path)
+        update_upload_time(item.file_id)
+        if dedup_run:
+            dedup_run.finished(item.file_id, result) # 同内容的副本直接写入同一结果
+
+    def run_timeout_for(item: WorkItem) -> float:
+        # 大文档给更长的运行超时，小文档仍为 DEFAULT_TIMEOUT
+        pages = _item_cost(estimator, item)
+        return scaled_timeout(pages, per_unit=TIMEOUT_PER_PAGE, minimum=DEFAULT_TIMEOUT, maximum=MAX_TIMEOUT)
+
+    tracker = TaskTracker(
+        submit=lambda item: _submit_task(client, item),
+        fetch_statuses=client.fetch_statuses,
+        on_success=store_result,
+        max_in_flight=MAX_IN_FLIGHT,
+        workers=CLIENT_WORKERS,
+        poll_interval=DEFAULT_INTERVAL,
+        max_poll_interval=MAX_POLL_INTERVAL,
+        status_batch_size=STATUS_BATCH_SIZE,
+        pending_timeout=PENDING_TIMEOUT,
+        run_timeout=DEFAULT_TIMEOUT,
+        run_timeout_for=run_timeout_for if estimator else None,
+        max_attempts=MAX_ATTEMPTS,
+        ledger=ledger,
+    )
+    stats = tracker.run(items)
 
     logging.info(
         "Finished two-stage pipeline: %d successes, %d failures.",
-        total_success,
-        len(failures),
+        stats.succeeded,
+        stats.failed,
     )
-    for file_id, err in failures.items():
-        logging.error(
-            "Failed after %d attempts: %s (%s)",
-            attempts.get(file_id, 0),
-            file_id,
-            err,
-        )
+    for file_id, err in stats.failures.items():
+        logging.error("Failed: %s (%s)", file_id, err)
 
 
 # 9、主函数入口，环境变量读取，目录创建，数据库连接池初始化，任务处理调度。
@@ -423,13 +315,48 @@ def main() -> None:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     init_db_pool()
-    session = requests.Session()
+    client = TwoStageClient(
+        API_BASE,
+        token,
+        pool_size=CLIENT_WORKERS, # 连接池大小与线程数一致
+        submit_timeout=SUBMIT_TIMEOUT,
+        status_timeout=STATUS_TIMEOUT,
+        status_batch_size=STATUS_BATCH_SIZE,
+    )
+    ledger = WorkLedger(LEDGER_PATH)
+    estimator = CostEstimator.from_env() # 页数估计缓存（DOC_COST_CACHE）
+    screen = PreScreen.from_env() if PRE_SCREEN else None # 预检进程池 + 结果缓存
+    dedup = PdfDedup.from_env() if DEDUP else None # 内容哈希索引（SQLite）
     try:
+        backfill_from_pickles(ledger, OUTPUT_DIR) # 首次使用台账时，从已有 pickle 一次性导入
         pdf_index = _build_pdf_index(BASE_DIR)
-        items = iter_unprocessed_items(BASE_DIR, OUTPUT_DIR, pdf_index)
-        process_items(session, token, items)
+        items = iter_unprocessed_items(BASE_DIR, ledger, pdf_index)
+        dedup_run = None
+        if dedup:
+            dedup_run = DedupRun(dedup, _output_dir(OUTPUT_DIR), on_reused=lambda file_id: mark_reused(ledger, file_id))
+            items = dedup_items(dedup_run, items) # 重复内容不再提交
+        if screen:
+            items = screen_items(screen, ledger, items) # 损坏/加密/0 页在提交前剔除
+        # 页数多的先提交（OCR 页按倍数计），避免几份超长文档在批次末尾拖尾
+        items = longest_first(
+            items,
+            lambda item: _item_cost(estimator, item),
+            window=LPT_WINDOW,
+            prefetch=lambda group: estimator.estimate_many([item.pdf_path for item in group], workers=CLIENT_WORKERS), # 整组并行估计页数，排序时命中缓存
+        )
+        process_items(client, ledger, items, estimator, dedup_run)
+        if screen:
+            logging.info("Pre-screen: %s", screen.summary())
+        if dedup_run:
+            logging.info("Dedup: %s", dedup_run.summary())
     finally:
-        session.close()
+        if dedup:
+            dedup.close()
+        if screen:
+            screen.close()
+        estimator.close()
+        ledger.close()
+        client.close()
         close_db_pool()
 
 
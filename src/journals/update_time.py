@@ -7,6 +7,8 @@ import psycopg2
 from dotenv import load_dotenv
 from psycopg2.extras import execute_batch
 
+from tools.output_layout import OutputDir
+
 
 def _project_root() -> str:
     here = os.path.dirname(__file__)
@@ -14,17 +16,11 @@ def _project_root() -> str:
 
 
 def collect_pickle_ids(pickle_dir: str) -> Set[str]:
-    """Collects pickle IDs from filenames, assuming they are UUIDs or strings."""
-    ids: Set[str] = set()
+    """Collects the IDs of finished results from the directory's completed index (flat or sharded)."""
     if not os.path.isdir(pickle_dir):
         logging.warning("Pickle directory does not exist: %s", pickle_dir)
-        return ids
-    for name in os.listdir(pickle_dir):
-        if not name.endswith(".pkl"):
-            continue
-        stem = name[:-4]
-        ids.add(stem)
-    return ids
+        return set()
+    return OutputDir(pickle_dir).ids()
 
 
 def main() -> None:
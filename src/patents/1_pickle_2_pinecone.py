@@ -11,6 +11,7 @@ from tenacity import retry, stop_after_attempt, wait_fixed
 
 import boto3
 from opensearchpy import AWSV4SignerAuth
+from tools.embedding_batcher import EmbeddingBatcher
 
 load_dotenv()
 
@@ -95,14 +96,11 @@ df["values"] = [None] * len(df)
 df["values"] = df["values"].astype("object")
 
 
-# @retry(wait=wait_fixed(3), stop=stop_after_attempt(10))
+embedder = EmbeddingBatcher(client)
+
+
 def get_embeddings(input):
-    try:
-        return client.embeddings.create(
-            input=input, model="text-embedding-3-small"
-        ).data
-    except Exception as e:
-        logging.error(e)
+    return embedder.embed(list(input))
 
 
 # @retry(wait=wait_fixed(3), stop=stop_after_attempt(10))
@@ -122,7 +120,7 @@ for i in range(0, len(df), 1000):
     logging.info(i)
     embeddings = get_embeddings(df["abstract"][i : i + 1000])
     for j in range(len(embeddings)):
-        df.at[i + j, "values"] = embeddings[j].embedding
+        df.at[i + j, "values"] = embeddings[j]
 
     vectors = []
     for j in range(len(embeddings)):
@@ -1,9 +1,10 @@
-import concurrent.futures
+import logging
 import os
-import pickle
 
 from dotenv import load_dotenv
+from tools.output_layout import OutputDir
 from tools.unstructure_pdf import unstructure_pdf
+from tools.warm_pool import WarmPool, stage
 from xata.client import XataClient
 
 load_dotenv()
@@ -50,9 +51,6 @@ def fetch_all_records(xata, table_name, columns, filter, page_size=1000):
     return all_records
 
 
-records = fetch_all_records(xata, table_name, columns, filter)
-
-
 def process_pdf(record):
     record_id = record["id"]
     if record["language"] == "eng":
@@ -64,17 +62,17 @@ def process_pdf(record):
         pdf_name="docs/reports/" + record_id + ".pdf", languages=language
     )
 
-    with open("reports_pickle/" + record_id + ".pkl", "wb") as f:
-        pickle.dump(text_list, f)
+    with stage("save"):
+        OutputDir("reports_pickle").save(record_id, text_list)
 
-    text_str_list = [
-        "Page {}: {}".format(page_number, text) for text, page_number in text_list
-    ]
+        text_str_list = [
+            "Page {}: {}".format(page_number, text) for text, page_number in text_list
+        ]
 
-    text_str = "\n----------\n".join(text_str_list)
+        text_str = "\n----------\n".join(text_str_list)
 
-    with open("reports_txt/" + record_id + ".txt", "w") as f:
-        f.write(text_str)
+        with open("reports_txt/" + record_id + ".txt", "w") as f:
+            f.write(text_str)
 
     # text_list = unstructure_pdf(
     #     pdf_name="pickle_single/pdf/" + record_id + ".pdf", languages=language
@@ -96,5 +94,10 @@ def process_pdf(record):
 # for record in records:
 #     process_pdf(record)
 
-with concurrent.futures.ProcessPoolExecutor(max_workers=24) as executor:
-    executor.map(process_pdf, records)
+# Workers are spawned (see tools.warm_pool), so they re-import this module: keep the run under the guard.
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    records = fetch_all_records(xata, table_name, columns, filter)
+    with WarmPool.from_env(workers=24) as pool:
+        for record, _ in pool.run(process_pdf, records):
+            logging.info("Processed %s", record["id"])
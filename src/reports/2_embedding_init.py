@@ -2,17 +2,19 @@ import logging
 import os
 import pickle
 from datetime import UTC, datetime
-from io import StringIO
 
-import pandas as pd
 import psycopg2
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from openai import OpenAI
 from pinecone import Pinecone
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.output_layout import OutputDir
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
+
 load_dotenv()
 
 logging.basicConfig(
@@ -30,13 +32,6 @@ pc = Pinecone(api_key=os.environ.get("PINECONE_SERVERLESS_API_KEY"))
 idx = pc.Index(os.environ.get("PINECONE_SERVERLESS_INDEX_NAME"))
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -45,24 +40,12 @@ def fix_utf8(original_list):
     return cleaned_list
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_embeddings(text_list, model="text-embedding-3-small"):
-    try:
-        text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
-        length = len(text_list)
-        results = []
-        # print(text_list[1128:1129])
-        # result = client.embeddings.create(input=text_list[1128:1129], model=model).data
-
-        for i in range(0, length, 1000):
-            result = client.embeddings.create(
-                input=text_list[i : i + 1000], model=model
-            ).data
-            results += result
-        return results
+embedder = EmbeddingBatcher(client)
 
-    except Exception as e:
-        print(e)
+
+def get_embeddings(text_list, model="text-embedding-3-small"):
+    text_list = [text.replace("\n\n", " ").replace("\n", " ") for text in text_list]
+    return embedder.embed(text_list, model=model)
 
 
 # [Embedding(embedding=[], index=0, object='embedding'),Embedding(embedding=[], index=0, object='embedding')]
@@ -74,41 +57,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d) > 8100:
+        token_count = num_tokens_from_string(d)
+        if token_count > 8100:
             soup = BeautifulSoup(d, "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -118,14 +72,14 @@ def merge_pickle_list(data):
                         result.append(table_content)
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append(str(soup))
                     except Exception as e:
                         logging.error(e)
-        elif num_tokens_from_string(d) < 15:
+        elif token_count < 15:
             temp += d + " "
         else:
             result.append(temp + d)
@@ -169,13 +123,14 @@ ids = [record[0] for record in records]
 files = [id + ".pkl" for id in ids]
 
 dir = "reports_pickle"
+outputs = OutputDir(dir)
 
 # aa = os.listdir(dir)
 
 for file in files:
 
     try:
-        file_path = os.path.join(dir, file)
+        file_path = outputs.path(os.path.splitext(file)[0], ".pkl")
         data = load_pickle_list(file_path)
         data = merge_pickle_list(data)
         data = fix_utf8(data)
@@ -188,7 +143,7 @@ for file in files:
             vectors.append(
                 {
                     "id": file_id + "_" + str(index),
-                    "values": e.embedding,
+                    "values": e,
                     "metadata": {
                         "text": data[index],
                         "rec_id": file_id,
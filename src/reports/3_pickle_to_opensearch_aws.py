@@ -2,15 +2,16 @@ import logging
 import os
 import pickle
 from datetime import UTC, datetime
-from io import StringIO
-import pandas as pd
 import psycopg2
-import tiktoken
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
 
+from tools.s3_prefetch import pooled_s3_client, prefetch_pickles
+from tools.pickle_chunks import split_html_table
+from tools.tokenizer import num_tokens_from_string
+
 
 load_dotenv()
 
@@ -29,7 +30,7 @@ service = "aoss"
 credentials = boto3.Session().get_credentials()
 auth = AWSV4SignerAuth(credentials, region, service)
 
-s3_client = boto3.client("s3")
+s3_client = pooled_s3_client()
 
 
 def list_all_objects(bucket_name, prefix):
@@ -46,13 +47,6 @@ def list_all_objects(bucket_name, prefix):
     return docs
 
 
-def load_pickle_from_s3(bucket_name, s3_key):
-    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-    body = response["Body"].read()
-    data = pickle.loads(body)
-    return data
-
-
 bucket_name = "tiangong"
 prefix = "processed_docs/reports_pickle/"
 
@@ -97,12 +91,6 @@ if not client.indices.exists(index="reports"):
     client.indices.create(index="reports", body=reports_mapping)
 
 
-def num_tokens_from_string(string: str) -> int:
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
-
-
 def fix_utf8(original_list):
     cleaned_list = []
     for original_str in original_list:
@@ -117,41 +105,12 @@ def load_pickle_list(file_path):
     return data
 
 
-def split_dataframe_table(html_table, chunk_size=8100):
-    dfs = pd.read_html(StringIO(html_table))
-    if not dfs:
-        return []
-
-    df = dfs[0]
-    tables = []
-    sub_df = pd.DataFrame()
-    token_count = 0
-
-    for _, row in df.iterrows():
-        row_html = row.to_frame().T.to_html(index=False, border=0, classes=None)
-        row_token_count = num_tokens_from_string(row_html)
-
-        if token_count + row_token_count > chunk_size and not sub_df.empty:
-            sub_html = sub_df.to_html(index=False, border=0, classes=None)
-            tables.append(sub_html)
-            sub_df = pd.DataFrame()
-            token_count = 0
-
-        sub_df = pd.concat([sub_df, row.to_frame().T])
-        token_count += row_token_count
-
-    if not sub_df.empty:
-        sub_html = sub_df.to_html(index=False, border=0, classes=None)
-        tables.append(sub_html)
-
-    return tables
-
-
 def merge_pickle_list(data):
     temp = ""
     result = []
     for d in data:
-        if num_tokens_from_string(d) > 8100:
+        token_count = num_tokens_from_string(d)
+        if token_count > 8100:
             soup = BeautifulSoup(d, "html.parser")
             tables = soup.find_all("table")
             for table in tables:
@@ -161,14 +120,14 @@ def merge_pickle_list(data):
                         result.append(table_content)
                 else:
                     try:
-                        sub_tables = split_dataframe_table(table_content)
+                        sub_tables = split_html_table(table)
                         for sub_table in sub_tables:
                             if sub_table:
                                 soup = BeautifulSoup(sub_table, "html.parser")
                                 result.append(str(soup))
                     except Exception as e:
                         logging.error(f"Error splitting dataframe table: {e}")
-        elif num_tokens_from_string(d) < 15:
+        elif token_count < 15:
             temp += d + " "
         else:
             result.append((temp + d))
@@ -201,8 +160,8 @@ urls = {record[0]: record[4] for record in records}
 
 keys = [str(id) + ".pkl" for id in ids]
 
-for key in keys:
-    data = load_pickle_from_s3(bucket_name, prefix + key)
+for key, fetched in prefetch_pickles(s3_client, bucket_name, keys, key=lambda key: prefix + key):
+    data = fetched.result()
     data = merge_pickle_list(data)
     data = fix_utf8(data)
 
@@ -1,13 +1,14 @@
-import concurrent.futures
 import logging
 import os
-import pickle
-import requests
-from collections import deque
 
 import psycopg2
 from dotenv import load_dotenv
 
+from tools.doc_cost import CostEstimator, longest_first, scaled_timeout
+from tools.endpoint_pool import EndpointPool, dispatch
+from tools.multipart_stream import post_multipart
+from tools.output_layout import OutputDir
+
 load_dotenv()
 
 logging.basicConfig(
@@ -20,13 +21,19 @@ logging.basicConfig(
 token = os.environ.get("TOKEN")
 input_dir = "docs/standards"
 output_dir = "temp"
+outputs = OutputDir(output_dir)
 
-# Define multiple service endpoints
+# Define multiple service endpoints (override with UNSTRUCTURE_ENDPOINTS="url=concurrency,...")
 service_endpoints = [
     "http://localhost:8770/pdf",
     "http://localhost:8771/pdf",
     "http://localhost:8772/pdf",
 ]
+service_pool = EndpointPool.from_env(default=service_endpoints)
+estimator = CostEstimator.from_env()
+# Request timeout grows with the page count; short documents keep the minimum
+TIMEOUT_PER_PAGE = 6
+MIN_TIMEOUT = 1200
 
 docx_url = "http://localhost:8770/docx"
 ppt_url = "http://localhost:8770/ppt"
@@ -48,30 +55,27 @@ with conn_pg.cursor() as cur:
 
 def unstructure_by_service(doc_id, doc_path, token, url):
     """Process document through the appropriate unstructure service"""
+    timeout = scaled_timeout(estimator.pages(doc_path), per_unit=TIMEOUT_PER_PAGE, minimum=MIN_TIMEOUT)
     with open(doc_path, "rb") as f:
-        pickle_filename = f"{doc_id}.pkl"
-        pickle_path = os.path.join(output_dir, pickle_filename)
-
         files = {"file": f}
         headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            response = requests.post(url, files=files, headers=headers)
+            response = post_multipart(url, files=files, headers=headers, timeout=timeout)
             response.raise_for_status()
             response_data = response.json()
             result = response_data.get("result")
 
-            with open(pickle_path, "wb") as pkl_file:
-                pickle.dump(result, pkl_file)
+            outputs.save(doc_id, result)
 
             print(f"Successfully processed document ID: {doc_id} with service: {url}")
-            return True
+            return url
 
         except Exception as e:
             print(
                 f"Error processing document ID: {doc_id} with service {url}: {str(e)}"
             )
-            return False
+            raise
 
 
 def process_documents():
@@ -86,39 +90,20 @@ def process_documents():
         else:
             print(f"File not found for ID {doc_id}: {doc_path}")
 
-    service_queue = deque(service_endpoints)
-
-    # Process documents using concurrent execution with multiple services
-    with concurrent.futures.ThreadPoolExecutor(
-        max_workers=len(service_endpoints)
-    ) as executor:
-        futures = []
-        # Distribute documents across services
-        for index, (doc_id, doc_path) in enumerate(documents):
-            # Get the next service from the queue in round-robin fashion
-            service_url = service_queue[0]
-            service_queue.rotate(-1)
-
-            # Submit the processing task to the executor
-            future = executor.submit(
-                unstructure_by_service, doc_id, doc_path, token, service_url
-            )
-            futures.append((future, doc_id, service_url))
-
-        # Wait for all tasks to complete
-        for future, doc_id, service_url in futures:
-            try:
-                result = future.result()
-                if result:
-                    logging.info(f"{doc_id} processed with service: {service_url}")
-                else:
-                    logging.error(
-                        f"Failed to process document ID: {doc_id} with service: {service_url}"
-                    )
-            except Exception as e:
-                logging.error(
-                    f"Exception while processing document ID: {doc_id}: {str(e)}"
-                )
+    # Each document goes to the least-loaded healthy service; server errors are retried on another one
+    # Longest documents first, so a few very long reports do not start last and hold up the run
+    documents = list(longest_first(documents, lambda doc: estimator.pages(doc[1])))
+    outcomes = dispatch(
+        service_pool,
+        documents,
+        lambda doc, url: unstructure_by_service(doc[0], doc[1], token, url),
+    )
+    for (doc_id, doc_path), result in outcomes:
+        if isinstance(result, Exception):
+            logging.error(f"Failed to process document ID: {doc_id}: {str(result)}")
+        else:
+            logging.info(f"{doc_id} processed with service: {result}")
+    logging.info(f"Services: {service_pool.summary()}")
 
 
 # Run the document processing function
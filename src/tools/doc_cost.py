@@ -0,0 +1,206 @@
+"""Cost estimates for PDFs, and longest-first scheduling with scaled timeouts.
+
+The ingestion scripts submitted documents in database order. A few
+800-page ESG reports or textbooks that happened to be adjacent would start
+together near the end of a batch, while the other workers sat idle, and they
+shared the same fixed ``TWO_STAGE_POLL_TIMEOUT`` (800 s) as a 10-page paper.
+This module:
+
+* estimates a document's cost as its page count. The count comes from
+  PyMuPDF or pypdf if installed, otherwise from the ``/Count`` of the page
+  tree found in the first / last MiB of the file, otherwise from the file
+  size (``AVG_PAGE_BYTES`` per page). Results are cached in SQLite by
+  path + size + mtime (``DOC_COST_CACHE``), so re-runs do not reopen the
+  PDFs;
+* orders work longest-processing-time first (``longest_first``), which is
+  what a shared queue needs so the big documents start early and the small
+  ones fill the gaps at the end. ``lpt_partition`` does the same for fixed
+  per-worker lists;
+* scales timeouts with the estimate (``scaled_timeout``).
+
+Usage:
+    estimator = CostEstimator.from_env()
+    documents = list(longest_first(documents, lambda doc: estimator.pages(doc.path)))
+    timeout = scaled_timeout(estimator.pages(path), per_unit=3.0, minimum=800, maximum=6 * 3600)
+"""
+
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+AVG_PAGE_BYTES = 100 * 1024
+SCAN_BYTES = 1 << 20
+
+_PAGES_DICT = re.compile(rb"/Type\s*/Pages\b(?:(?!>>).)*?/Count\s+(\d+)|/Count\s+(\d+)(?:(?!>>).)*?/Type\s*/Pages\b", re.S)
+
+
+class DocCost(NamedTuple):
+    size: int
+    pages: Optional[int]  # None when no page count could be read
+
+    @property
+    def units(self) -> float:
+        """Estimated pages (from the size when the count is unknown), at least 1."""
+        if self.pages:
+            return float(self.pages)
+        return max(1.0, self.size / AVG_PAGE_BYTES)
+
+
+def _scan_page_count(path: str) -> Optional[int]:
+    """Largest ``/Count`` of a ``/Type /Pages`` node in the head or tail of the file."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(SCAN_BYTES)
+        tail = b""
+        if size > SCAN_BYTES:
+            f.seek(max(SCAN_BYTES, size - SCAN_BYTES))
+            tail = f.read()
+    counts = [int(a or b) for a, b in _PAGES_DICT.findall(head) + _PAGES_DICT.findall(tail)]
+    return max(counts) if counts else None
+
+
+def count_pages(path: str) -> Optional[int]:
+    try:
+        import fitz  # PyMuPDF
+
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except ImportError:
+        pass
+    except Exception as e:
+        logging.debug("PyMuPDF could not count pages of %s: %s", path, e)
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages)
+    except ImportError:
+        pass
+    except Exception as e:
+        logging.debug("pypdf could not count pages of %s: %s", path, e)
+    try:
+        return _scan_page_count(path)
+    except OSError as e:
+        logging.debug("Could not scan %s: %s", path, e)
+        return None
+
+
+class CostEstimator:
+    def __init__(self, path: Optional[str] = None) -> None:
+        """``path``: SQLite cache file; ``None`` keeps estimates in memory only."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._memo: Dict[str, DocCost] = {}
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS doc_cost ("
+                " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, pages INTEGER"
+                ") WITHOUT ROWID"
+            )
+
+    @classmethod
+    def from_env(cls) -> "CostEstimator":
+        """Cached in ``DOC_COST_CACHE`` (default ``doc_cost.sqlite3``; empty for memory only)."""
+        return cls(os.environ.get("DOC_COST_CACHE", "doc_cost.sqlite3") or None)
+
+    def close(self) -> None:
+        if self._conn:
+            with self._lock:
+                self._conn.close()
+
+    def estimate(self, path: str) -> DocCost:
+        path = str(path)
+        with self._lock:
+            if path in self._memo:
+                return self._memo[path]
+        try:
+            st = os.stat(path)
+        except OSError:
+            return DocCost(0, None)
+        if self._conn:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT pages FROM doc_cost WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (path, st.st_size, st.st_mtime_ns),
+                ).fetchone()
+            if row:
+                cost = DocCost(st.st_size, row[0])
+                with self._lock:
+                    self._memo[path] = cost
+                return cost
+        cost = DocCost(st.st_size, count_pages(path))
+        with self._lock:
+            self._memo[path] = cost
+            if self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO doc_cost (path, size, mtime_ns, pages) VALUES (?, ?, ?, ?)",
+                    (path, st.st_size, st.st_mtime_ns, cost.pages),
+                )
+        return cost
+
+    def pages(self, path: str) -> float:
+        return self.estimate(path).units
+
+    def estimate_many(self, paths: Iterable[str], workers: int = 8) -> List[DocCost]:
+        """Estimates in parallel (PDF parsing releases the GIL for file reads)."""
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.estimate, paths))
+
+
+def longest_first(
+    items: Iterable[T],
+    cost: Callable[[T], float],
+    window: Optional[int] = None,
+    prefetch: Optional[Callable[[List[T]], object]] = None,
+) -> Iterator[T]:
+    """``items`` by decreasing ``cost``; with ``window``, sorted within consecutive groups of that size.
+
+    The window keeps a streamed work list (e.g. a database cursor) from being materialized in full.
+    ``prefetch`` is called with each group before it is sorted, e.g. to fill a cost cache in
+    parallel with ``CostEstimator.estimate_many`` instead of one ``cost`` call at a time.
+    """
+
+    def ordered(group: List[T]) -> List[T]:
+        if prefetch and group:
+            prefetch(group)
+        return sorted(group, key=cost, reverse=True)
+
+    if window is None:
+        yield from ordered(list(items))
+        return
+    group: List[T] = []
+    for item in items:
+        group.append(item)
+        if len(group) >= window:
+            yield from ordered(group)
+            group = []
+    yield from ordered(group)
+
+
+def lpt_partition(items: Sequence[T], cost: Callable[[T], float], parts: int) -> List[List[T]]:
+    """Splits ``items`` into ``parts`` lists of similar total cost (each longest-first)."""
+    bins: List[List[T]] = [[] for _ in range(max(1, parts))]
+    loads = [(0.0, i) for i in range(len(bins))]
+    for item in sorted(items, key=cost, reverse=True):
+        load, i = heapq.heappop(loads)
+        bins[i].append(item)
+        heapq.heappush(loads, (load + cost(item), i))
+    return bins
+
+
+def scaled_timeout(units: float, *, per_unit: float, minimum: float, maximum: Optional[float] = None) -> float:
+    """``per_unit * units`` clamped to ``[minimum, maximum]``."""
+    timeout = max(minimum, per_unit * units)
+    return min(timeout, maximum) if maximum else timeout
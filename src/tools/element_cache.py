@@ -0,0 +1,171 @@
+"""Per-page cache of the raw elements returned by ``partition_pdf``.
+
+Changing the chunking (``new_after_n_chars=512`` / ``max_characters=4096``
+here, 8192 in ``ali/tools/unstructure_docx.py``), the cleaning or the
+Header/Footer filter meant re-partitioning the whole corpus, although layout
+detection and OCR would give the same elements again. ``ElementCache`` keeps
+them in SQLite (``PDF_ELEMENT_CACHE``), one row per page, keyed by:
+
+* the SHA-256 of the file (a renamed or duplicate file hits the same rows);
+* the 1-based page number and the strategy the page was partitioned with;
+* the layout model and the OCR languages;
+* a digest of the other ``partition_pdf`` arguments and the ``unstructured``
+  version (``options``), so a change of either misses instead of mixing.
+
+Elements are stored as ``elements_to_json`` output compressed with zlib,
+typically a few KiB per page. ``tools.pdf_partition.partition_pdf_pages``
+reads and fills the cache; only the pages without a row are partitioned.
+Calls that extract images skip the cache, since the image files it would
+point to are temporary.
+
+Usage:
+    cache = ElementCache("cache/elements.sqlite3")
+    key = cache.key(path, partition_kwargs)
+    cached = cache.get(key, strategies)  # {page: elements} for the pages already done
+    cache.put(key, {page: (strategy, elements) for ...})
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from tools.pdf_dedup import full_hash
+
+# Arguments that only say where output goes, or are part of the key already.
+IGNORED_ARGS = {
+    "filename",
+    "file",
+    "metadata_filename",
+    "strategy",
+    "hi_res_model_name",
+    "languages",
+    "pdf_image_output_dir_path",
+    "image_output_dir_path",
+    "extract_image_block_output_dir",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_elements (
+    file_hash  BLOB NOT NULL,
+    model      TEXT NOT NULL,
+    languages  TEXT NOT NULL,
+    options    TEXT NOT NULL,
+    page       INTEGER NOT NULL,
+    strategy   TEXT NOT NULL,
+    elements   BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (file_hash, model, languages, options, page, strategy)
+) WITHOUT ROWID;
+"""
+
+
+class DocKey(NamedTuple):
+    file_hash: bytes
+    model: str
+    languages: str
+    options: str
+
+
+def dumps(elements: List[Any]) -> bytes:
+    from unstructured.staging.base import elements_to_json
+
+    return zlib.compress(elements_to_json(elements, indent=None).encode("utf-8"))
+
+
+def loads(blob: bytes) -> List[Any]:
+    from unstructured.staging.base import elements_from_json
+
+    return elements_from_json(text=zlib.decompress(blob).decode("utf-8"))
+
+
+def options_digest(kwargs: Dict[str, Any]) -> str:
+    """Digest of the arguments that change the elements, and of the ``unstructured`` version."""
+    from unstructured.__version__ import __version__
+
+    options = {name: value for name, value in kwargs.items() if name not in IGNORED_ARGS}
+    options["unstructured"] = __version__
+    encoded = json.dumps(options, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class ElementCache:
+    """Thread-safe page element cache over one SQLite connection (several processes may share the file)."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ElementCache"]:
+        """Stored in ``PDF_ELEMENT_CACHE``; ``None`` (no cache) when it is not set."""
+        path = os.environ.get("PDF_ELEMENT_CACHE")
+        return cls(path) if path else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def key(self, path: str, kwargs: Dict[str, Any]) -> DocKey:
+        """Cache key of the document at ``path`` partitioned with ``kwargs``."""
+        return DocKey(
+            full_hash(path),
+            kwargs.get("hi_res_model_name") or "",
+            "+".join(kwargs.get("languages") or []),
+            options_digest(kwargs),
+        )
+
+    def get(self, key: DocKey, strategies: Sequence[str]) -> Dict[int, List[Any]]:
+        """Cached elements by 0-based page, for the pages cached with the strategy in ``strategies``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, strategy, elements FROM page_elements"
+                " WHERE file_hash = ? AND model = ? AND languages = ? AND options = ?",
+                key,
+            ).fetchall()
+        cached = {}
+        for page, strategy, blob in rows:
+            index = page - 1
+            if index < len(strategies) and strategies[index] == strategy:
+                try:
+                    cached[index] = loads(blob)
+                except Exception as e:  # written by an incompatible version: partition the page again
+                    logging.warning("Could not decode cached elements of page %d: %s", page, e)
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(strategies) - len(cached)
+        return cached
+
+    def put(self, key: DocKey, pages: Dict[int, Tuple[str, List[Any]]]) -> None:
+        """Stores ``{0-based page: (strategy, elements)}``; pages without elements are stored too."""
+        now = time.time()
+        rows = [(*key, index + 1, strategy, dumps(elements), now) for index, (strategy, elements) in pages.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO page_elements"
+                " (file_hash, model, languages, options, page, strategy, elements, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+
+    def summary(self) -> str:
+        with self._lock:
+            total = self.hits + self.misses
+            rate = self.hits / total if total else 0.0
+            return f"element cache: {self.hits}/{total} pages from cache ({rate:.0%})"
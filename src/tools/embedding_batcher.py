@@ -0,0 +1,295 @@
+"""Token-budgeted, rate-limited batching for OpenAI embedding requests.
+
+The loaders used to slice their chunks into fixed groups of 1000 strings, so a
+file with long chunks exceeded the per-request token limit and the whole file
+failed (and ``@retry`` re-embedded everything). ``EmbeddingBatcher`` instead
+
+* packs consecutive texts into requests of at most ``max_tokens`` tokens and
+  ``max_items`` inputs,
+* sends the requests of one call concurrently on a shared thread pool, gated
+  by a tokens-per-minute / requests-per-minute ``RateLimiter``,
+* retries only the request that failed (with exponential backoff), and splits
+  a request in half when the API rejects it as too large.
+
+With an ``EmbeddingCache`` (or ``EMBEDDING_CACHE_PATH`` set) texts embedded
+before are served from the cache and only new or changed chunks are sent.
+
+Usage:
+    embedder = EmbeddingBatcher(OpenAI(), tokens_per_minute=1_000_000)
+    vectors = embedder.embed(texts)  # one List[float] per text, in order
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from tools.embedding_cache import EmbeddingCache
+from tools.tokenizer import count_tokens
+
+DEFAULT_MODEL = "text-embedding-3-small"
+# OpenAI allows 2048 inputs and 300k tokens per embeddings request.
+MAX_ITEMS = 2048
+MAX_TOKENS = 250_000
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# How a 400 says the request is too large, as opposed to a bad model name, an empty input, ...
+TOO_LARGE_ERROR = re.compile(r"maximum context length|max_tokens|too many tokens|too long|too large", re.IGNORECASE)
+
+
+class RateLimiter:
+    """Token buckets refilled continuously from per-minute limits (``None`` = unlimited)."""
+
+    def __init__(
+        self,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+    ) -> None:
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self._tokens = float(tokens_per_minute or 0)
+        self._requests = float(requests_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60
+            )
+
+    def acquire(self, tokens: int) -> float:
+        """Blocks until one request of ``tokens`` tokens may be sent; returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                # A request larger than the whole bucket goes out once the bucket is full.
+                need_tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+                wait = 0.0
+                if self.tokens_per_minute and self._tokens < need_tokens:
+                    wait = (need_tokens - self._tokens) * 60 / self.tokens_per_minute
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if wait <= 0:
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, seconds: float) -> None:
+        """Empties the buckets for ``seconds`` (used after a 429)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens_per_minute:
+                self._tokens = min(self._tokens, -seconds * self.tokens_per_minute / 60)
+            if self.requests_per_minute:
+                self._requests = min(self._requests, -seconds * self.requests_per_minute / 60)
+
+
+def pack_batches(
+    token_counts: Sequence[int], max_tokens: int = MAX_TOKENS, max_items: int = MAX_ITEMS
+) -> List[Tuple[int, int]]:
+    """Groups consecutive items into ``(start, end)`` ranges under both limits."""
+    batches = []
+    start, used = 0, 0
+    for i, tokens in enumerate(token_counts):
+        if i > start and (used + tokens > max_tokens or i - start >= max_items):
+            batches.append((start, i))
+            start, used = i, 0
+        used += tokens
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None and getattr(exc, "response", None) is not None:
+        status = getattr(exc.response, "status_code", None)
+    return status
+
+
+def _too_large(exc: Exception, status: Optional[int]) -> bool:
+    """HTTP 413, or a 400 whose error message says the input exceeds a token limit."""
+    if status == 413:
+        return True
+    if status != 400:
+        return False
+    # openai.BadRequestError keeps the decoded error body in ``body``; str(exc) holds its message too.
+    return bool(TOO_LARGE_ERROR.search(f"{exc} {getattr(exc, 'body', '')}"))
+
+
+def _retry_after(exc: Exception) -> float:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after") or 0)
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class EmbeddingStats:
+    requests: int = 0
+    texts: int = 0
+    tokens: int = 0
+    retries: int = 0
+    splits: int = 0
+    throttled_seconds: float = 0.0
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        client,
+        model: str = DEFAULT_MODEL,
+        *,
+        max_tokens: int = MAX_TOKENS,
+        max_items: int = MAX_ITEMS,
+        workers: int = 4,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        """``client`` is an ``openai.OpenAI`` instance (or anything with ``embeddings.create``).
+
+        ``tokens_per_minute`` / ``requests_per_minute`` default to the
+        ``OPENAI_EMBEDDING_TPM`` / ``OPENAI_EMBEDDING_RPM`` environment variables,
+        ``cache`` to ``EmbeddingCache.from_env()``.
+        """
+        if tokens_per_minute is None and os.environ.get("OPENAI_EMBEDDING_TPM"):
+            tokens_per_minute = int(os.environ["OPENAI_EMBEDDING_TPM"])
+        if requests_per_minute is None and os.environ.get("OPENAI_EMBEDDING_RPM"):
+            requests_per_minute = int(os.environ["OPENAI_EMBEDDING_RPM"])
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_items = max(1, min(max_items, MAX_ITEMS))
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(tokens_per_minute, requests_per_minute)
+        self.cache = cache if cache is not None else EmbeddingCache.from_env()
+        self.stats = EmbeddingStats()
+        self._stats_lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def close(self) -> None:
+        if self.cache:
+            logging.info(self.cache.stats.summary())
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self) -> "EmbeddingBatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            return self._pool
+
+    def _count(self, **amounts) -> None:
+        with self._stats_lock:
+            for name, amount in amounts.items():
+                setattr(self.stats, name, getattr(self.stats, name) + amount)
+
+    def embed(self, texts: Sequence[str], model: Optional[str] = None) -> List[List[float]]:
+        """Returns one embedding per text, in order; raises if any request finally fails."""
+        texts = list(texts)
+        if not texts:
+            return []
+        model = model or self.model
+        if self.cache is None:
+            return self._embed(texts, model)
+        vectors = self.cache.get_many(model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Repeated chunks (running headers, boilerplate) are sent once.
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            embedded = self._embed(unique, model)
+            self.cache.put_many(model, unique, embedded)
+            by_text = dict(zip(unique, embedded))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return vectors
+
+    def _embed(self, texts: List[str], model: str) -> List[List[float]]:
+        counts = count_tokens(texts)
+        batches = pack_batches(counts, self.max_tokens, self.max_items)
+        if len(batches) == 1:
+            return self._request(texts, counts, model)
+        pool = self._executor()
+        futures = [pool.submit(self._request, texts[s:e], counts[s:e], model) for s, e in batches]
+        vectors: List[List[float]] = []
+        error = None
+        for fut in futures:
+            try:
+                vectors.extend(fut.result())
+            except Exception as exc:
+                error = error or exc
+        if error:
+            raise error
+        return vectors
+
+    def _request(self, texts: List[str], counts: List[int], model: str) -> List[List[float]]:
+        tokens = sum(counts)
+        for attempt in range(self.max_retries + 1):
+            self._count(throttled_seconds=self.limiter.acquire(tokens))
+            try:
+                response = self.client.embeddings.create(input=texts, model=model)
+            except Exception as exc:
+                status = _status_code(exc)
+                if len(texts) > 1 and _too_large(exc, status):
+                    # Too large for one request: embed the halves separately.
+                    self._count(splits=1)
+                    mid = len(texts) // 2
+                    logging.warning(
+                        "Embedding request of %d texts / %d tokens rejected (HTTP %s); splitting",
+                        len(texts),
+                        tokens,
+                        status,
+                    )
+                    return self._request(texts[:mid], counts[:mid], model) + self._request(
+                        texts[mid:], counts[mid:], model
+                    )
+                retryable = status is None or status in RETRYABLE_STATUS
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = max(self.backoff * 2**attempt, _retry_after(exc))
+                if status == 429:
+                    self.limiter.penalize(delay)
+                self._count(retries=1)
+                logging.warning(
+                    "Embedding request of %d texts failed (%s); retry %d/%d in %.1fs",
+                    len(texts),
+                    exc,
+                    attempt + 1,
+                    self.max_retries,
+                    delay,
+                )
+                time.sleep(delay)
+                continue
+            data = sorted(response.data, key=lambda item: item.index)
+            if len(data) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(data)}")
+            self._count(requests=1, texts=len(texts), tokens=tokens)
+            return [item.embedding for item in data]
+        raise AssertionError("unreachable")
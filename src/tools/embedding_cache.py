@@ -0,0 +1,179 @@
+"""Persistent content-addressed cache of embeddings.
+
+Re-indexing runs (``--reindex``, the journal ``embedding_time < ...`` re-run)
+mostly re-embed chunks that did not change. ``EmbeddingCache`` stores every
+vector in SQLite under ``sha256(model + normalized text)``, so
+``EmbeddingBatcher`` only sends new or changed chunks to the API.
+
+* Text is normalized (NFC, whitespace collapsed) before hashing, matching the
+  newline flattening the loaders already do before embedding.
+* Vectors are raw little-endian float32 blobs (``precision="float16"`` halves
+  the size at ~1e-3 relative error).
+* When the stored vectors exceed ``max_bytes`` the least recently used rows
+  are evicted down to 90% of the budget.
+* ``stats`` counts hits / misses / stores / evictions.
+
+Usage:
+    cache = EmbeddingCache("cache/embeddings.sqlite", max_bytes=20 * 1024**3)
+    embedder = EmbeddingBatcher(OpenAI(), cache=cache)
+    # or export EMBEDDING_CACHE_PATH=cache/embeddings.sqlite
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+_FORMATS = {"float32": "f", "float16": "e"}
+# SQLite's default limit on host parameters per statement is 999 (32766 since 3.32).
+_LOOKUP_BATCH = 900
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"embedding cache: {self.hits} hits / {self.misses} misses "
+            f"({self.hit_rate:.1%}), {self.stores} stored, {self.evictions} evicted"
+        )
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: Optional[int] = None,
+        precision: str = "float32",
+    ) -> None:
+        if precision not in _FORMATS:
+            raise ValueError(f"precision must be one of {sorted(_FORMATS)}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, fmt TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> Optional["EmbeddingCache"]:
+        """``EMBEDDING_CACHE_PATH`` (+ optional ``EMBEDDING_CACHE_MAX_MB``), or ``None``."""
+        path = os.environ.get("EMBEDDING_CACHE_PATH")
+        if not path:
+            return None
+        max_mb = os.environ.get("EMBEDDING_CACHE_MAX_MB")
+        return cls(path, max_bytes=int(max_mb) * 1024 * 1024 if max_mb else None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _encode(self, vector: Sequence[float]) -> bytes:
+        return struct.pack(f"<{len(vector)}{_FORMATS[self.precision]}", *vector)
+
+    @staticmethod
+    def _decode(fmt: str, blob: bytes) -> List[float]:
+        code = _FORMATS[fmt]
+        return list(struct.unpack(f"<{len(blob) // struct.calcsize(code)}{code}", blob))
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached vector for each text, or ``None`` for a miss."""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[bytes, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                chunk = unique[i : i + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, fmt, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, fmt, blob in rows:
+                    found[key] = self._decode(fmt, blob)
+            if found:
+                now = time.time()
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.execute("COMMIT")
+            self.stats.hits += sum(key in found for key in keys)
+            self.stats.misses += sum(key not in found for key in keys)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            rows[cache_key(model, text)] = (self.precision, self._encode(vector), now)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, fmt, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()],
+            )
+            self._conn.execute("COMMIT")
+            self._bytes += sum(len(blob) for _, blob, _ in rows.values())
+            self.stats.stores += len(rows)
+            if self.max_bytes and self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drops least recently used rows until the cache is at 90% of ``max_bytes``."""
+        # Other processes may share the file: start from the real size.
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, length(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            victims, freed = [], 0
+            for key, size in rows:
+                victims.append((key,))
+                freed += size
+                if self._bytes - freed <= target:
+                    break
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self._conn.execute("COMMIT")
+            self._bytes -= freed
+            self.stats.evictions += len(victims)
+        logging.info("Embedding cache evicted down to %d bytes (%d rows so far)", self._bytes, self.stats.evictions)
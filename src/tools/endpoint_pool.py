@@ -0,0 +1,249 @@
+"""Health-aware load balancing over a fleet of unstructure services.
+
+``standards/1_file2pickle.py`` round-robined documents over three fixed
+endpoints, so a slow or dead server got the same share as a fast one, and
+``esg/1_file2pickle.py`` used a single endpoint serially. ``EndpointPool``
+tracks, per endpoint:
+
+* in-flight requests, capped by a per-endpoint concurrency limit;
+* an EWMA of request latency, which is used to prefer faster servers;
+* consecutive failures. After ``failure_threshold`` of them the endpoint is
+  taken out of rotation for ``cooldown`` seconds, and that time doubles up to
+  ``max_cooldown`` while it keeps failing. When the cooldown ends, a single
+  probe request is let through; if it succeeds, the endpoint is healthy again.
+
+``acquire`` picks the healthy endpoint with the lowest expected wait,
+``(in_flight + 1) / limit * latency``, and blocks while every endpoint is
+full or cooling down. ``dispatch`` runs a handler over many items, with as
+many threads as the fleet has slots. A failed item is retried on another
+endpoint when the failure looks like the server's fault: a connection error,
+a timeout or a 5xx. A 4xx belongs to the document and is not retried.
+
+Endpoints come from ``UNSTRUCTURE_ENDPOINTS`` as ``url`` or ``url=limit``,
+comma separated.
+
+Usage:
+    pool = EndpointPool.from_env(default=["http://localhost:8770/pdf", "http://localhost:8771/pdf"])
+    for doc, result in dispatch(pool, documents, lambda doc, url: post(doc, url)):
+        if isinstance(result, Exception):
+            ...
+    logging.info(pool.summary())
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Collection, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import requests
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class NoEndpointAvailable(RuntimeError):
+    pass
+
+
+@dataclass
+class Endpoint:
+    url: str
+    limit: int = 1
+    in_flight: int = 0
+    latency: Optional[float] = None  # EWMA of successful request seconds
+    failures: int = 0  # consecutive
+    down_until: float = 0.0
+    cooldown: float = 0.0
+    completed: int = 0
+    failed: int = 0
+
+    @property
+    def probing(self) -> bool:
+        return self.cooldown > 0
+
+
+def is_endpoint_failure(exc: BaseException) -> bool:
+    """Connection errors, timeouts and 5xx responses count against the server, not the document."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+
+def parse_endpoints(spec: str, default_limit: int = 1) -> List[Tuple[str, int]]:
+    endpoints = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        url, _, limit = part.partition("=")
+        endpoints.append((url.strip(), int(limit) if limit else default_limit))
+    return endpoints
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        endpoints: Sequence[Union[str, Tuple[str, int]]],
+        *,
+        max_concurrency: int = 1,
+        alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+    ) -> None:
+        self.endpoints = [
+            Endpoint(e, max_concurrency) if isinstance(e, str) else Endpoint(e[0], e[1]) for e in endpoints
+        ]
+        if not self.endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(
+        cls, default: Sequence[str], var: str = "UNSTRUCTURE_ENDPOINTS", max_concurrency: int = 1, **kwargs
+    ) -> "EndpointPool":
+        spec = os.getenv(var)
+        endpoints = parse_endpoints(spec, max_concurrency) if spec else [(url, max_concurrency) for url in default]
+        return cls(endpoints, **kwargs)
+
+    @property
+    def capacity(self) -> int:
+        return sum(e.limit for e in self.endpoints)
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        if now < endpoint.down_until:
+            return False
+        # Back from a cooldown: one probe at a time until a request succeeds.
+        limit = 1 if endpoint.probing else endpoint.limit
+        return endpoint.in_flight < limit
+
+    def _score(self, endpoint: Endpoint, default_latency: float) -> float:
+        latency = endpoint.latency if endpoint.latency is not None else default_latency
+        return (endpoint.in_flight + 1) / endpoint.limit * latency
+
+    def acquire(self, timeout: Optional[float] = None, avoid: Collection[str] = ()) -> Endpoint:
+        """Claims a slot on the best endpoint, preferring ones whose URL is not in ``avoid``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = [e for e in self.endpoints if self._available(e, now)]
+                fresh = [e for e in self.endpoints if e.url not in avoid and now >= e.down_until]
+                # Wait for an untried healthy endpoint that is only busy; fall back to tried ones otherwise.
+                candidates = [e for e in candidates if e.url not in avoid] if fresh else candidates
+                if candidates:
+                    known = [e.latency for e in self.endpoints if e.latency is not None]
+                    # Unmeasured endpoints are assumed average, so each gets tried early on.
+                    default_latency = sum(known) / len(known) if known else 1.0
+                    endpoint = min(candidates, key=lambda e: self._score(e, default_latency))
+                    endpoint.in_flight += 1
+                    return endpoint
+                wait = None
+                cooling = [e.down_until - now for e in self.endpoints if e.down_until > now]
+                if cooling:
+                    wait = min(cooling)
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise NoEndpointAvailable(f"no endpoint available within {timeout}s")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(self, endpoint: Endpoint, elapsed: Optional[float], ok: bool) -> None:
+        """Returns a slot; ``ok=False`` only for failures that are the endpoint's fault.
+
+        ``elapsed=None`` (e.g. a request rejected for its document) leaves the latency estimate alone.
+        """
+        with self._cond:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.completed += 1
+                endpoint.failures = 0
+                endpoint.cooldown = 0.0
+            if ok and elapsed is not None:
+                endpoint.latency = (
+                    elapsed
+                    if endpoint.latency is None
+                    else self.alpha * elapsed + (1 - self.alpha) * endpoint.latency
+                )
+            if not ok:
+                endpoint.failed += 1
+                endpoint.failures += 1
+                now = time.monotonic()
+                # Requests that were already in flight when it went down do not extend the cooldown.
+                if now >= endpoint.down_until and (endpoint.failures >= self.failure_threshold or endpoint.probing):
+                    endpoint.cooldown = min(max(endpoint.cooldown * 2, self.base_cooldown), self.max_cooldown)
+                    endpoint.down_until = now + endpoint.cooldown
+                    logging.warning(
+                        "Endpoint %s failed %d times in a row; out of rotation for %.0fs",
+                        endpoint.url,
+                        endpoint.failures,
+                        endpoint.cooldown,
+                    )
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None, avoid: Collection[str] = ()) -> Iterator[Endpoint]:
+        """``acquire`` / ``release`` around a block; exceptions are classified with ``is_endpoint_failure``."""
+        endpoint = self.acquire(timeout, avoid)
+        start = time.monotonic()
+        try:
+            yield endpoint
+        except BaseException as e:
+            self.release(endpoint, None, ok=not is_endpoint_failure(e))
+            raise
+        self.release(endpoint, time.monotonic() - start, ok=True)
+
+    def summary(self) -> str:
+        with self._cond:
+            return "; ".join(
+                f"{e.url}: {e.completed} ok, {e.failed} failed, "
+                f"{'-' if e.latency is None else f'{e.latency:.1f}s'} avg"
+                for e in self.endpoints
+            )
+
+
+def dispatch(
+    pool: EndpointPool,
+    items: Iterable[T],
+    handler: Callable[[T, str], R],
+    *,
+    max_attempts: int = 3,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[T, Union[R, Exception]]]:
+    """Runs ``handler(item, url)`` for every item on the best endpoint; yields ``(item, result or exception)``.
+
+    Results come in completion order.
+    """
+
+    def run(item: T) -> R:
+        tried: List[str] = []
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with pool.lease(avoid=tried) as endpoint:
+                    tried.append(endpoint.url)
+                    return handler(item, endpoint.url)
+            except Exception as e:
+                if attempt == max_attempts or not is_endpoint_failure(e):
+                    raise
+                logging.warning("Attempt %d on %s failed; retrying elsewhere: %s", attempt, tried[-1], e)
+        raise AssertionError("unreachable")
+
+    with ThreadPoolExecutor(max_workers=workers or pool.capacity, thread_name_prefix="dispatch") as executor:
+        futures = {executor.submit(run, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result()
+            except Exception as e:
+                yield item, e
@@ -0,0 +1,203 @@
+"""Local stand-in for the OpenAI embeddings API, for exercising ``EmbeddingBatcher``.
+
+Implements ``POST /v1/embeddings`` (float or base64 encoding, like the real
+endpoint) with deterministic vectors. Requests with more than
+``--max-request-tokens`` tokens or ``--max-items`` inputs get a 400, requests
+beyond ``--tpm`` tokens in the current minute get a 429, and a random
+``--failure-rate`` share gets a 500. ``GET /stats`` reports request counters.
+
+Usage:
+    PYTHONPATH=src python src/tools/fake_embeddings_server.py --port 7771 --tpm 1000000
+    OPENAI_BASE_URL=http://localhost:7771/v1 OPENAI_API_KEY=x python ...
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from tools.tokenizer import count_tokens
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic pseudo-embedding derived from the text's hash."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimensions)]
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        *,
+        dimensions: int = 64,
+        max_request_tokens: int = 300_000,
+        max_items: int = 2048,
+        tokens_per_minute: Optional[int] = None,
+        failure_rate: float = 0.0,
+        latency: float = 0.0,
+    ) -> None:
+        super().__init__(address, FakeEmbeddingsHandler)
+        self.dimensions = dimensions
+        self.max_request_tokens = max_request_tokens
+        self.max_items = max_items
+        self.tokens_per_minute = tokens_per_minute
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.counters: Counter = Counter()
+        self.lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_tokens = 0
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+    def admit(self, tokens: int) -> bool:
+        """Fixed one-minute window, like the per-minute limits of the real API."""
+        if not self.tokens_per_minute:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._window_tokens = now, 0
+            if self._window_tokens + tokens > self.tokens_per_minute:
+                return False
+            self._window_tokens += tokens
+            return True
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    server: FakeEmbeddingsServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:  # keep stdout quiet
+        pass
+
+    def _send_json(self, status: int, payload, headers=None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, code: str, headers=None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": code, "code": code}}, headers)
+
+    def _drain_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self) -> None:
+        body = self._drain_body()
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self._send_json(404, {"detail": "Not Found"})
+            return
+        server = self.server
+        request = json.loads(body or b"{}")
+        texts = request.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        tokens = sum(count_tokens(texts))
+        server.count("requests")
+        if server.latency:
+            time.sleep(server.latency)
+
+        if len(texts) > server.max_items or tokens > server.max_request_tokens:
+            server.count("too_large")
+            self._error(
+                400,
+                f"Requested {tokens} tokens in {len(texts)} inputs; max is "
+                f"{server.max_request_tokens} tokens and {server.max_items} inputs per request.",
+                "invalid_request_error",
+            )
+            return
+        if not server.admit(tokens):
+            server.count("rate_limited")
+            self._error(429, "Rate limit reached for tokens per min.", "rate_limit_exceeded", {"retry-after": "1"})
+            return
+        if random.random() < server.failure_rate:
+            server.count("failed")
+            self._error(500, "Simulated server error.", "server_error")
+            return
+
+        server.count("succeeded")
+        server.count("inputs", len(texts))
+        server.count("tokens", tokens)
+        as_base64 = request.get("encoding_format") == "base64"
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text, server.dimensions)
+            if as_base64:
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        self._send_json(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", ""),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            with self.server.lock:
+                payload = dict(self.server.counters)
+            self._send_json(200, payload)
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+
+def start_in_thread(port: int = 0, **kwargs) -> FakeEmbeddingsServer:
+    """Starts a server on a background thread; ``server.server_address`` has the port."""
+    server = FakeEmbeddingsServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Local stand-in for the OpenAI embeddings API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7771)
+    p.add_argument("--dimensions", type=int, default=64)
+    p.add_argument("--max-request-tokens", type=int, default=300_000)
+    p.add_argument("--max-items", type=int, default=2048)
+    p.add_argument("--tpm", type=int, default=None, help="tokens per minute before answering 429")
+    p.add_argument("--failure-rate", type=float, default=0.0)
+    p.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = p.parse_args()
+
+    server = FakeEmbeddingsServer(
+        (args.host, args.port),
+        dimensions=args.dimensions,
+        max_request_tokens=args.max_request_tokens,
+        max_items=args.max_items,
+        tokens_per_minute=args.tpm,
+        failure_rate=args.failure_rate,
+        latency=args.latency,
+    )
+    print(f"Fake embeddings API listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Per-domain settings for ``tools.index_pipeline``.
+
+Each entry mirrors what the domain's own ``*_pickle_to_{pinecone,opensearch}``
+scripts read from Postgres and write as chunk metadata.
+"""
+
+from typing import Dict
+
+from tools.index_pipeline import IndexConfig, epoch, joined
+
+ESG = IndexConfig(
+    name="esg",
+    table="esg_meta",
+    columns=(
+        "country",
+        "company_name",
+        "report_title",
+        "publication_date",
+        "report_start_date",
+        "report_end_date",
+    ),
+    metadata=lambda r: {
+        "rec_id": str(r.id),
+        "title": r.report_title,
+        "country": r.country,
+        "company_name": r.company_name,
+        "publication_date": epoch(r.publication_date),
+        "report_start_date": epoch(r.report_start_date),
+        "report_end_date": epoch(r.report_end_date),
+    },
+    prefix="processed_docs/esg_pickle/",
+    pinecone_namespace="esg",
+    opensearch_index="esg",
+    ready="unstructure_time IS NOT NULL",
+)
+
+EDU_TEXTBOOKS = IndexConfig(
+    name="edu_textbooks",
+    table="edu_textbooks",
+    columns=("title", "authors", "isbn_number", "publish_time"),
+    metadata=lambda r: {
+        "rec_id": str(r.id),
+        "title": r.title,
+        "author": joined(r.authors),
+        "isbn_number": r.isbn_number,
+        "publication_date": epoch(r.publish_time),
+    },
+    prefix="processed_docs/edu_textbooks_pickle/",
+    pinecone_namespace="textbook",
+    opensearch_index="textbooks",
+    embedding_column="embedding_time",
+    ready="pdf_exist IS NULL",
+)
+
+JOURNALS = IndexConfig(
+    name="journals",
+    table="journals",
+    columns=("doi", "journal", "date"),
+    metadata=lambda r: {"doi": r.doi, "journal": r.journal, "date": epoch(r.date)},
+    prefix="processed_docs/journal_pickle/",
+    pinecone_namespace="sci",
+    opensearch_index="sci",
+    embedding_column="embedding_time",
+    ready="upload_time IS NOT NULL",
+    rec_id_column="doi",
+    page_numbers=False,
+)
+
+STANDARDS = IndexConfig(
+    name="standards",
+    table="standards",
+    columns=("title", "standard_number", "issuing_organization", "effective_date"),
+    metadata=lambda r: {
+        "rec_id": str(r.id),
+        "title": r.title,
+        "standard_number": r.standard_number,
+        "organization": joined(r.issuing_organization, "，"),
+        "effective_date": epoch(r.effective_date),
+    },
+    prefix="processed_docs/standards_pickle/",
+    pinecone_namespace="standard",
+    opensearch_index="standards",
+    page_numbers=False,
+)
+
+REPORTS = IndexConfig(
+    name="reports",
+    table="reports",
+    columns=("title", "issuing_organization", "release_date", "url"),
+    metadata=lambda r: {
+        "rec_id": str(r.id),
+        "title": r.title,
+        "organization": joined(r.issuing_organization, "，"),
+        "release_date": epoch(r.release_date),
+        "url": r.url,
+    },
+    prefix="processed_docs/reports_pickle/",
+    pinecone_namespace="report",
+    opensearch_index="reports",
+    page_numbers=False,
+)
+
+ALI = IndexConfig(
+    name="ali",
+    table="internal_use",
+    columns=("title", "tag"),
+    metadata=lambda r: {"rec_id": str(r.id), "title": r.title, "tag": r.tag},
+    prefix="",
+    pinecone_namespace="internal_use",
+    opensearch_index="internal_use",
+    page_numbers=False,
+    # The ali loaders always dropped the trailing element of these pickles.
+    prepare=lambda data: data[:-1],
+    local_dir="test",
+)
+
+DOMAINS: Dict[str, IndexConfig] = {
+    config.name: config for config in (ESG, EDU_TEXTBOOKS, JOURNALS, STANDARDS, REPORTS, ALI)
+}
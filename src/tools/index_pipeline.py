@@ -0,0 +1,378 @@
+"""Shared pickle -> Pinecone / OpenSearch indexing pipeline.
+
+Every domain loader used to run the same serial loop: load ``{id}.pkl`` from
+S3, ``merge_pickle_list``, ``fix_utf8``, embed, upsert, then ``UPDATE`` one
+status column. Here that loop is a ``Pipeline`` of stages
+
+    source (keyset scan) -> load -> [embed] -> sink -> status
+
+with bounded queues between them and a configurable worker count per stage.
+A domain is described by an ``IndexConfig`` (table, metadata columns, S3
+prefix, index name / namespace, status columns); see ``tools.index_domains``.
+
+Usage:
+    export PYTHONPATH=src
+    python src/tools/index_pipeline.py esg pinecone
+    python src/tools/index_pipeline.py esg opensearch --where "created_time > '2025-10-01'"
+    python src/tools/index_pipeline.py journals pinecone --reindex --where "embedding_time < '2024-10-22'"
+"""
+
+import argparse
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import arrow
+import boto3
+from dotenv import load_dotenv
+from tenacity import retry, stop_after_attempt, wait_fixed
+
+from tools import chunk_store
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.embedding_cache import EmbeddingCache
+from tools.output_layout import OutputDir
+from tools.pickle_chunks import fix_utf8, merge_pickle_list
+from tools.pipeline import Pipeline, PipelineStats, Stage
+from tools.status_writer import StatusWriter
+from tools.work_discovery import iter_keyset
+
+PINECONE = "pinecone"
+OPENSEARCH = "opensearch"
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    name: str
+    table: str
+    columns: Tuple[str, ...]  # metadata columns read alongside the id
+    metadata: Callable[[Any], Dict[str, Any]]  # record -> per-document metadata
+    prefix: str  # S3 prefix of the {id}.pkl files
+    pinecone_namespace: Optional[str] = None
+    opensearch_index: Optional[str] = None
+    embedding_column: str = "embedded_time"
+    fulltext_column: str = "fulltext_time"
+    ready: Optional[str] = None  # SQL condition for rows whose pickle exists
+    key_column: str = "id"  # pickle file name and keyset pagination key
+    rec_id_column: str = "id"  # chunk ids / status updates are keyed by this
+    page_numbers: bool = True  # store page_number with every chunk
+    prepare: Optional[Callable[[list], list]] = None  # applied to the raw pickle list
+    local_dir: Optional[str] = None  # read pickles from disk instead of S3
+    bucket: str = "tiangong"
+
+    def status_column(self, target: str) -> str:
+        return self.embedding_column if target == PINECONE else self.fulltext_column
+
+    def select_columns(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys((self.key_column, self.rec_id_column, *self.columns)))
+
+
+@dataclass
+class Document:
+    record: Any
+    key: str
+    rec_id: str
+    chunks: Optional[List[list]] = None  # [[text, page_number], ...]
+    embeddings: Optional[List[List[float]]] = None
+
+
+def epoch(value) -> Optional[int]:
+    """Unix seconds for a datetime or a date string; ``None`` stays ``None``."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(arrow.get(value).timestamp())
+
+
+def joined(values, sep: str = ", ") -> Optional[str]:
+    if values is None:
+        return None
+    return sep.join(values) if isinstance(values, (list, tuple)) else str(values)
+
+
+# ------------------------------------------------------------------- stages
+
+
+class IndexStages:
+    """Stage functions for one domain and target; clients are created by ``main``."""
+
+    def __init__(
+        self,
+        config: IndexConfig,
+        target: str,
+        *,
+        s3_client=None,
+        embedder: Optional[EmbeddingBatcher] = None,
+        pinecone_index=None,
+        opensearch_client=None,
+        status_writer: Optional[StatusWriter] = None,
+        local_dir: Optional[str] = None,
+        suffix: str = ".pkl",
+    ) -> None:
+        self.config = config
+        self.target = target
+        self.s3_client = s3_client
+        self.embedder = embedder
+        self.pinecone_index = pinecone_index
+        self.opensearch_client = opensearch_client
+        self.status_writer = status_writer
+        self.local_dir = local_dir or config.local_dir
+        self.local_outputs = OutputDir(self.local_dir) if self.local_dir else None
+        self.suffix = suffix
+
+    def source(self, db, where: Optional[str] = None, reindex: bool = False):
+        config = self.config
+        conditions = [] if reindex else [f"{config.status_column(self.target)} IS NULL"]
+        if config.ready:
+            conditions.append(config.ready)
+        if where:
+            conditions.append(where)
+        for record in iter_keyset(
+            db,
+            config.table,
+            config.select_columns(),
+            key=config.key_column,
+            where=" AND ".join(f"({c})" for c in conditions) or None,
+        ):
+            yield Document(
+                record=record,
+                key=str(getattr(record, config.key_column)),
+                rec_id=str(getattr(record, config.rec_id_column)),
+            )
+
+    def load(self, doc: Document) -> Optional[Document]:
+        name = doc.key + self.suffix
+        if self.local_outputs:
+            # Sharded or flat, pickle or Parquet: whatever the directory's layout holds.
+            path = self.local_outputs.find(doc.key)
+            if path is None:
+                logging.warning("No result for %s in %s; skipping", doc.key, self.local_dir)
+                return None
+            data = chunk_store.load(path)
+        else:
+            response = self.s3_client.get_object(Bucket=self.config.bucket, Key=self.config.prefix + name)
+            data = chunk_store.loads(name, response["Body"].read())
+        if self.config.prepare:
+            data = self.config.prepare(data)
+        doc.chunks = fix_utf8(merge_pickle_list(data))
+        if not doc.chunks:
+            logging.warning("No chunks in %s; skipping", name)
+            return None
+        return doc
+
+    def embed(self, doc: Document) -> Document:
+        texts = [text.replace("\n\n", " ").replace("\n", " ") for text, _ in doc.chunks]
+        doc.embeddings = self.embedder.embed(texts)
+        return doc
+
+    def _chunk_metadata(self, base: Dict[str, Any], text: str, page_number) -> Dict[str, Any]:
+        metadata = {"text": text}
+        if self.config.page_numbers and page_number is not None:
+            metadata["page_number"] = page_number
+        metadata.update(base)
+        return metadata
+
+    def _doc_metadata(self, doc: Document) -> Dict[str, Any]:
+        # Pinecone rejects null metadata values.
+        return {k: v for k, v in self.config.metadata(doc.record).items() if v is not None}
+
+    @retry(wait=wait_fixed(3), stop=stop_after_attempt(10))
+    def _upsert(self, vectors: List[Dict]) -> None:
+        self.pinecone_index.upsert(
+            vectors=vectors,
+            batch_size=200,
+            namespace=self.config.pinecone_namespace,
+            show_progress=False,
+        )
+
+    def upsert(self, doc: Document) -> Document:
+        base = self._doc_metadata(doc)
+        vectors = [
+            {
+                "id": f"{doc.rec_id}_{index}",
+                "values": embedding,
+                "metadata": self._chunk_metadata(base, text, page_number),
+            }
+            for index, ((text, page_number), embedding) in enumerate(zip(doc.chunks, doc.embeddings))
+        ]
+        self._upsert(vectors)
+        return doc
+
+    @retry(wait=wait_fixed(3), stop=stop_after_attempt(5))
+    def _bulk(self, body: List[Dict]) -> None:
+        response = self.opensearch_client.bulk(body=body)
+        if response.get("errors"):
+            raise RuntimeError(f"Bulk request to {self.config.opensearch_index} reported errors")
+
+    def index(self, doc: Document) -> Document:
+        base = self._doc_metadata(doc)
+        actions = []
+        for index, (text, page_number) in enumerate(doc.chunks):
+            actions.append({"index": {"_index": self.config.opensearch_index, "_id": f"{doc.rec_id}_{index}"}})
+            actions.append(self._chunk_metadata(base, text, page_number))
+        for i in range(0, len(actions), 500):
+            self._bulk(actions[i : i + 500])
+        return doc
+
+    def status(self, doc: Document) -> Document:
+        self.status_writer.mark(doc.rec_id)
+        logging.info("Indexed %s into %s %s", doc.rec_id, self.config.name, self.target)
+        return doc
+
+    def stages(self, load_workers: int, embed_workers: int, sink_workers: int) -> List[Stage]:
+        stages = [Stage("load", self.load, workers=load_workers)]
+        if self.target == PINECONE:
+            stages.append(Stage("embed", self.embed, workers=embed_workers))
+            stages.append(Stage("upsert", self.upsert, workers=sink_workers))
+        else:
+            stages.append(Stage("index", self.index, workers=sink_workers))
+        stages.append(Stage("status", self.status, workers=1))
+        return stages
+
+
+# --------------------------------------------------------------------- main
+
+
+def _pinecone_index():
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=os.environ.get("PINECONE_SERVERLESS_API_KEY_US_EAST_1"))
+    return pc.Index(os.environ.get("PINECONE_SERVERLESS_INDEX_NAME_US_EAST_1"))
+
+
+def _opensearch_client(pool_maxsize: int):
+    from opensearchpy import AWSV4SignerAuth, OpenSearch, RequestsHttpConnection
+
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, "us-east-1", "aoss")
+    return OpenSearch(
+        hosts=[{"host": os.environ.get("AWS_OPENSEARCH_URL"), "port": 443}],
+        http_auth=auth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        pool_maxsize=pool_maxsize,
+        timeout=300,
+    )
+
+
+def run(
+    config: IndexConfig,
+    target: str,
+    *,
+    where: Optional[str] = None,
+    reindex: bool = False,
+    local_dir: Optional[str] = None,
+    load_workers: int = 8,
+    embed_workers: int = 4,
+    sink_workers: int = 4,
+    embedding_cache: Optional[str] = None,
+    chunk_format: str = "pickle",
+) -> PipelineStats:
+    from psycopg2 import pool
+
+    if target == PINECONE and not config.pinecone_namespace:
+        raise ValueError(f"Domain {config.name} has no Pinecone namespace")
+    if target == OPENSEARCH and not config.opensearch_index:
+        raise ValueError(f"Domain {config.name} has no OpenSearch index")
+
+    conn_pool = pool.ThreadedConnectionPool(
+        1,
+        2,  # discovery + status writer
+        database=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+    )
+    status_writer = StatusWriter(
+        conn_pool, config.table, config.status_column(target), config.rec_id_column
+    )
+    stages = IndexStages(
+        config,
+        target,
+        s3_client=None if local_dir or config.local_dir else boto3.client("s3"),
+        status_writer=status_writer,
+        local_dir=local_dir,
+        suffix=chunk_store.PARQUET_SUFFIX if chunk_format == "parquet" else ".pkl",
+    )
+    if target == PINECONE:
+        from openai import OpenAI
+
+        # Shared by all embed workers so the rate limit covers the whole process.
+        stages.embedder = EmbeddingBatcher(
+            OpenAI(),
+            workers=embed_workers,
+            cache=EmbeddingCache(embedding_cache) if embedding_cache else None,
+        )
+        stages.pinecone_index = _pinecone_index()
+    else:
+        stages.opensearch_client = _opensearch_client(pool_maxsize=max(20, sink_workers))
+
+    pipeline = Pipeline(
+        stages.stages(load_workers, embed_workers, sink_workers),
+        describe=lambda doc: doc.rec_id,
+    )
+    try:
+        return pipeline.run(stages.source(conn_pool, where, reindex))
+    finally:
+        status_writer.close()
+        if stages.embedder:
+            stages.embedder.close()
+        conn_pool.closeall()
+
+
+def main() -> None:
+    from tools.index_domains import DOMAINS
+
+    p = argparse.ArgumentParser(description="Index domain pickles into Pinecone or OpenSearch")
+    p.add_argument("domain", choices=sorted(DOMAINS))
+    p.add_argument("target", choices=[PINECONE, OPENSEARCH])
+    p.add_argument("--where", help="extra SQL condition on the domain table")
+    p.add_argument(
+        "--reindex", action="store_true", help="also process rows whose status column is already set"
+    )
+    p.add_argument("--local-dir", help="read {id}.pkl from this directory instead of S3")
+    p.add_argument("--load-workers", type=int, default=8)
+    p.add_argument("--embed-workers", type=int, default=4)
+    p.add_argument("--sink-workers", type=int, default=4)
+    p.add_argument(
+        "--embedding-cache",
+        help="SQLite embedding cache path (default: $EMBEDDING_CACHE_PATH, if set)",
+    )
+    p.add_argument(
+        "--chunk-format",
+        choices=["pickle", "parquet"],
+        default=os.getenv("CHUNK_FORMAT", "pickle"),
+        help="read {id}.pkl or {id}.parquet (default: $CHUNK_FORMAT or pickle)",
+    )
+    p.add_argument("--log-file", help="defaults to <domain>_<target>.log")
+    args = p.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(
+        filename=args.log_file or f"{args.domain}_{args.target}.log",
+        level=logging.INFO,
+        format="%(asctime)s:%(levelname)s:%(message)s",
+        filemode="w",
+        force=True,
+    )
+    stats = run(
+        DOMAINS[args.domain],
+        args.target,
+        where=args.where,
+        reindex=args.reindex,
+        local_dir=args.local_dir,
+        load_workers=args.load_workers,
+        embed_workers=args.embed_workers,
+        sink_workers=args.sink_workers,
+        embedding_cache=args.embedding_cache,
+        chunk_format=args.chunk_format,
+    )
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Streaming ``multipart/form-data`` uploads.
+
+``requests.post(url, files={"file": f})`` encodes the whole multipart body
+into one ``bytes`` object before sending, so every concurrent upload of a
+100 MB+ standards / ESG PDF costs that much client memory (more while the
+encoder concatenates). ``MultipartStream`` produces the same body lazily:
+the part headers are built up front, file contents are read from the open
+file in ``CHUNK_SIZE`` pieces as the socket asks for them, and the total
+length is known in advance, so ``requests`` sends a normal
+``Content-Length`` request (not chunked) that any server accepts.
+
+``post_multipart`` has the ``requests.post`` signature the clients already
+use (``files=``, ``data=``, ``headers=``), so the call sites only change the
+function name. Memory per upload is one chunk regardless of file size.
+
+Usage:
+    with open(pdf_path, "rb") as f:
+        response = post_multipart(url, files={"file": f}, data={"priority": "normal"}, headers=headers)
+"""
+
+import mimetypes
+import os
+import uuid
+from typing import IO, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+
+FileSpec = Union[IO[bytes], Tuple[str, IO[bytes]], Tuple[str, IO[bytes], str]]
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", "%0D").replace("\n", "%0A")
+
+
+def _remaining(f: IO[bytes]) -> int:
+    position = f.tell()
+    try:
+        return os.fstat(f.fileno()).st_size - position
+    except (AttributeError, OSError, ValueError):  # not a real file (BytesIO, ...)
+        end = f.seek(0, os.SEEK_END)
+        f.seek(position)
+        return end - position
+
+
+class MultipartStream:
+    """A file-like ``multipart/form-data`` body that reads file parts on demand.
+
+    ``requests`` streams it because it is iterable and reports its length via ``len()``.
+    """
+
+    def __init__(
+        self,
+        files: Mapping[str, FileSpec],
+        data: Optional[Mapping[str, str]] = None,
+        boundary: Optional[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        # Each part: bytes (headers / fields) or (file object, byte count).
+        self._parts: List[Union[bytes, Tuple[IO[bytes], int]]] = []
+        for name, value in (data or {}).items():
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode()
+                + str(value).encode("utf-8")
+                + b"\r\n"
+            )
+        for name, spec in files.items():
+            if isinstance(spec, tuple):
+                filename, f = spec[0], spec[1]
+                content_type = spec[2] if len(spec) > 2 else None
+            else:
+                f = spec
+                filename = os.path.basename(getattr(f, "name", name) or name)
+                content_type = None
+            content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            self._parts.append(
+                (
+                    f"--{self.boundary}\r\n"
+                    f'Content-Disposition: form-data; name="{_quote(name)}"; filename="{_quote(filename)}"\r\n'
+                    f"Content-Type: {content_type}\r\n\r\n"
+                ).encode()
+            )
+            self._parts.append((f, _remaining(f)))
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+        self._length = sum(len(p) if isinstance(p, bytes) else p[1] for p in self._parts)
+        self._index = 0
+        self._offset = 0  # bytes of the current part already returned
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        out = []
+        while size > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                piece = part[self._offset : self._offset + size]
+                part_length = len(part)
+            else:
+                f, part_length = part
+                piece = f.read(min(size, part_length - self._offset))
+                if not piece and self._offset < part_length:
+                    raise IOError(f"{getattr(f, 'name', 'file')} shrank while uploading")
+            out.append(piece)
+            size -= len(piece)
+            self._offset += len(piece)
+            if self._offset >= part_length:
+                self._index += 1
+                self._offset = 0
+        return b"".join(out)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def post_multipart(
+    url: str,
+    files: Mapping[str, FileSpec],
+    data: Optional[Mapping[str, str]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    session: Optional[requests.Session] = None,
+    **kwargs,
+) -> requests.Response:
+    """``requests.post(url, files=..., data=...)`` with the body streamed from the files."""
+    body = MultipartStream(files, data)
+    headers = dict(headers or {})
+    headers["Content-Type"] = body.content_type
+    return (session or requests).post(url, data=body, headers=headers, **kwargs)
@@ -0,0 +1,208 @@
+"""Sharded result directories with an index of completed outputs.
+
+``journal_new_pickle``, ``esg_pickle`` and ``journal_two_stage_pickle`` held
+hundreds of thousands of flat ``{file_id}.pkl`` files. Listing them (to find
+what is done) and ``exists`` checks slowed down as they grew, and a crash in
+the middle of a write left a truncated pickle that blocked reprocessing.
+``OutputDir`` stores results as
+
+    {root}/{shard}/{file_id}{suffix}      shard = md5(file_id)[:shard_width]
+
+so every subdirectory stays small (256 shards for the default width of 2). It
+writes through ``chunk_store.save_result`` (temp file + rename, pickle or
+Parquet per ``CHUNK_FORMAT``) and appends each completed ``file_id`` to
+``{root}/.completed``. ``ids()`` reads that log instead of listing the tree.
+
+The shard width is recorded in ``{root}/.layout.json``. A new or empty
+directory is sharded. An existing flat directory without the marker keeps
+working unsharded until it is converted with ``migrate``.
+
+Usage:
+    outputs = OutputDir("docs/processed_docs/esg_pickle")
+    if not outputs.exists(doc_id):
+        outputs.save(doc_id, result)
+    done = outputs.ids()
+
+    PYTHONPATH=src python src/tools/output_layout.py migrate docs/processed_docs/journal_new_pickle
+    PYTHONPATH=src python src/tools/output_layout.py reindex docs/processed_docs/esg_pickle
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Iterator, Optional, Set, Tuple
+
+from tools.chunk_store import PARQUET_SUFFIX, chunk_format, save_result
+
+LAYOUT_FILE = ".layout.json"
+INDEX_FILE = ".completed"
+DEFAULT_SHARD_WIDTH = 2
+RESULT_SUFFIXES = (".pkl", ".pickle", PARQUET_SUFFIX)
+
+
+def shard_of(file_id: str, width: int) -> str:
+    return hashlib.md5(file_id.encode("utf-8")).hexdigest()[:width]
+
+
+def split_suffix(name: str) -> Tuple[str, Optional[str]]:
+    for suffix in RESULT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)], suffix
+    return name, None
+
+
+def _read_layout(root: str) -> Optional[int]:
+    try:
+        with open(os.path.join(root, LAYOUT_FILE)) as f:
+            return int(json.load(f)["shard_width"])
+    except FileNotFoundError:
+        return None
+
+
+def _write_layout(root: str, width: int) -> None:
+    os.makedirs(root, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=".tmp-layout-")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"shard_width": width}, f)
+    os.replace(tmp, os.path.join(root, LAYOUT_FILE))
+
+
+class OutputDir:
+    def __init__(self, root: str, shard_width: Optional[int] = None) -> None:
+        """``shard_width`` applies to new directories; an existing layout marker always wins."""
+        self.root = str(root)
+        width = _read_layout(self.root)
+        # The marker of a new directory is written by the first save, so readers never create anything.
+        self._unmarked = width is None
+        if width is None:
+            if os.path.isdir(self.root) and any(True for _ in os.scandir(self.root)):
+                width, self._unmarked = 0, False  # legacy flat directory
+            else:
+                width = DEFAULT_SHARD_WIDTH if shard_width is None else shard_width
+        self.shard_width = width
+
+    def _dir(self, file_id: str) -> str:
+        if not self.shard_width:
+            return self.root
+        return os.path.join(self.root, shard_of(file_id, self.shard_width))
+
+    def path(self, file_id: str, suffix: Optional[str] = None, pickle_suffix: str = ".pkl") -> str:
+        """Path of ``file_id``'s result; ``suffix`` defaults to the ``CHUNK_FORMAT`` one."""
+        if suffix is None:
+            suffix = PARQUET_SUFFIX if chunk_format() == "parquet" else pickle_suffix
+        return os.path.join(self._dir(file_id), file_id + suffix)
+
+    def find(self, file_id: str) -> Optional[str]:
+        """Existing result for ``file_id`` in any format, or ``None``."""
+        for suffix in RESULT_SUFFIXES:
+            path = self.path(file_id, suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, file_id: str) -> bool:
+        return self.find(file_id) is not None
+
+    def save(self, file_id: str, result: Any, pickle_suffix: str = ".pkl", suffix: Optional[str] = None) -> str:
+        """Atomically writes ``result`` and records ``file_id`` as completed."""
+        index = os.path.join(self.root, INDEX_FILE)
+        if self._unmarked:
+            _write_layout(self.root, self.shard_width)
+            open(index, "a").close()  # a new directory is indexed from its first result
+            self._unmarked = False
+        path = self.path(file_id, suffix, pickle_suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_result(path, file_id, result)
+        # Without an index (legacy directory, never listed) ``ids()`` builds one from a scan.
+        if os.path.exists(index):
+            with open(index, "a", encoding="utf-8") as f:
+                f.write(file_id + "\n")
+        return path
+
+    def iter_files(self) -> Iterator[Tuple[str, str]]:
+        """``(file_id, path)`` of every result on disk (a full scan)."""
+        dirs = [self.root]
+        if self.shard_width:
+            with os.scandir(self.root) as entries:
+                dirs = [e.path for e in entries if e.is_dir() and len(e.name) == self.shard_width]
+        for directory in dirs:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue  # layout/index files and in-progress temp files
+                    file_id, suffix = split_suffix(entry.name)
+                    if suffix and entry.is_file():
+                        yield file_id, entry.path
+
+    def rebuild_index(self) -> int:
+        """Rewrites ``.completed`` from a scan (run while no writer is active)."""
+        ids = sorted({file_id for file_id, _ in self.iter_files()})
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-index-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(file_id + "\n" for file_id in ids)
+        os.replace(tmp, os.path.join(self.root, INDEX_FILE))
+        return len(ids)
+
+    def ids(self) -> Set[str]:
+        """Completed ``file_id``s, from the index (built by one scan the first time)."""
+        index = os.path.join(self.root, INDEX_FILE)
+        if not os.path.isdir(self.root):
+            return set()
+        if not os.path.exists(index):
+            self.rebuild_index()
+        with open(index, encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def migrate(root: str, shard_width: int = DEFAULT_SHARD_WIDTH) -> int:
+    """Moves a flat directory's results into shards (renames only), then writes marker and index."""
+    current = _read_layout(root)
+    if current:
+        logging.info("%s is already sharded (width %d)", root, current)
+        return 0
+    moved = 0
+    made = set()
+    with os.scandir(root) as entries:
+        for entry in entries:
+            file_id, suffix = split_suffix(entry.name)
+            if not suffix or entry.name.startswith(".") or not entry.is_file():
+                continue
+            shard = shard_of(file_id, shard_width)
+            if shard not in made:
+                os.makedirs(os.path.join(root, shard), exist_ok=True)
+                made.add(shard)
+            os.rename(entry.path, os.path.join(root, shard, entry.name))
+            moved += 1
+            if moved % 100000 == 0:
+                logging.info("Moved %d files", moved)
+    _write_layout(root, shard_width)
+    OutputDir(root).rebuild_index()
+    return moved
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Sharded result directory tools")
+    sub = p.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="move a flat directory's results into hash shards")
+    m.add_argument("root")
+    m.add_argument("--shard-width", type=int, default=DEFAULT_SHARD_WIDTH)
+    r = sub.add_parser("reindex", help="rebuild the .completed index from disk")
+    r.add_argument("root")
+    c = sub.add_parser("count", help="number of completed results (from the index)")
+    c.add_argument("root")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    if args.command == "migrate":
+        print(f"moved {migrate(args.root, args.shard_width)} files")
+    elif args.command == "reindex":
+        print(f"indexed {OutputDir(args.root).rebuild_index()} results")
+    else:
+        print(len(OutputDir(args.root).ids()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Content-hash deduplication of PDFs before they are sent for unstructuring.
+
+The same journal PDF is often on disk more than once: under its DOI-encoded
+name (``quote(quote(doi))``) and under its UUID, or twice in a merged corpus
+(see ``rename.py`` and the "Duplicate PDF key" warnings of
+``_build_pdf_index``). Each copy was submitted to the GPU backend separately.
+
+``PdfDedup`` maps every ``file_id`` to the canonical ``file_id`` of its
+content, in SQLite (``PDF_DEDUP_INDEX``):
+
+* a partial hash (BLAKE2b of the size and the first and last ``PARTIAL_BYTES``)
+  is computed for every file; it is enough to tell almost all files apart;
+* the full SHA-256 is computed only when another file has the same size and
+  partial hash, and it is stored, so each file is read in full at most once;
+* rows are reused while path, size and mtime are unchanged.
+
+``DedupRun`` applies the mapping to one run. If the canonical document
+already has a result, that result is copied to the duplicate. Otherwise the
+first copy seen in the run is submitted, and the others wait for its result.
+
+Usage:
+    dedup = PdfDedup.from_env()
+    run = DedupRun(dedup, outputs, on_reused=upload_writer.mark)
+    for item in run.route(items, file_id_of=lambda item: item.file_id, path_of=lambda item: item.pdf_path):
+        result = submit(item)
+        outputs.save(item.file_id, result)
+        run.finished(item.file_id, result)
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, TypeVar
+
+from tools.chunk_store import load
+from tools.output_layout import OutputDir
+
+T = TypeVar("T")
+
+PARTIAL_BYTES = 64 * 1024
+FULL_CHUNK = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_hash (
+    file_id   TEXT PRIMARY KEY,
+    path      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    partial   BLOB NOT NULL,
+    full      BLOB,
+    canonical TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pdf_hash_partial_idx ON pdf_hash (size, partial);
+CREATE INDEX IF NOT EXISTS pdf_hash_canonical_idx ON pdf_hash (canonical);
+"""
+
+
+def partial_hash(path: str, size: int) -> bytes:
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            h.update(f.read())
+    return h.digest()
+
+
+def full_hash(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FULL_CHUNK), b""):
+            h.update(block)
+    return h.digest()
+
+
+class PdfDedup:
+    """Thread-safe ``file_id`` -> canonical ``file_id`` index over one SQLite connection."""
+
+    def __init__(self, path: str = ":memory:") -> None:
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.full_hashes = 0
+
+    @classmethod
+    def from_env(cls) -> "PdfDedup":
+        """Stored in ``PDF_DEDUP_INDEX`` (default ``pdf_dedup.sqlite3``)."""
+        return cls(os.environ.get("PDF_DEDUP_INDEX") or "pdf_dedup.sqlite3")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _full_hash_of(self, file_id: str, path: str, size: int, mtime_ns: int) -> Optional[bytes]:
+        """Full hash of an indexed file, computed and stored on first use; ``None`` if it changed on disk."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            return None
+        digest = full_hash(path)
+        self.full_hashes += 1
+        self._conn.execute("UPDATE pdf_hash SET full = ? WHERE file_id = ?", (digest, file_id))
+        return digest
+
+    def canonical(self, file_id: str, path: str) -> str:
+        """``file_id`` of the first indexed file with the same content as ``path`` (``file_id`` itself if none)."""
+        path = str(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT canonical FROM pdf_hash WHERE file_id = ? AND path = ? AND size = ? AND mtime_ns = ?",
+                (file_id, path, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if row:
+            return row[0]
+        partial = partial_hash(path, st.st_size)
+        with self._lock:
+            old = self._conn.execute("SELECT size, partial, full FROM pdf_hash WHERE file_id = ?", (file_id,)).fetchone()
+            full = None
+            if old and old[2] is not None:  # only files that other documents matched have a full hash
+                if (old[0], old[1]) == (st.st_size, partial):
+                    full = full_hash(path)
+                    self.full_hashes += 1
+                if full != old[2]:
+                    # New content: the documents that shared the old content stand on their own again.
+                    self._conn.execute(
+                        "UPDATE pdf_hash SET canonical = file_id WHERE canonical = ? AND file_id != ?",
+                        (file_id, file_id),
+                    )
+            candidates = self._conn.execute(
+                "SELECT file_id, path, size, mtime_ns, full, canonical FROM pdf_hash"
+                " WHERE size = ? AND partial = ? AND file_id != ?",
+                (st.st_size, partial, file_id),
+            ).fetchall()
+            canonical = file_id
+            if candidates:
+                if full is None:
+                    full = full_hash(path)
+                    self.full_hashes += 1
+                for other_id, other_path, size, mtime_ns, other_full, other_canonical in candidates:
+                    if other_canonical == file_id:
+                        continue  # our own duplicates
+                    if other_full is None:
+                        other_full = self._full_hash_of(other_id, other_path, size, mtime_ns)
+                    if other_full == full:
+                        canonical = other_canonical
+                        break
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pdf_hash (file_id, path, size, mtime_ns, partial, full, canonical)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, path, st.st_size, st.st_mtime_ns, partial, full, canonical),
+            )
+        if canonical != file_id:
+            logging.info("%s (%s) has the same content as %s", file_id, path, canonical)
+        return canonical
+
+    def duplicates(self, canonical: str) -> List[str]:
+        """Other ``file_id``s indexed with ``canonical``'s content."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_id FROM pdf_hash WHERE canonical = ? AND file_id != ? ORDER BY file_id",
+                (canonical, canonical),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+def copy_result(outputs: OutputDir, source_id: str, file_id: str) -> Optional[str]:
+    """Saves ``source_id``'s stored result as ``file_id``'s (re-encoded, since Parquet rows carry the doc id)."""
+    source = outputs.find(source_id)
+    if source is None:
+        return None
+    return outputs.save(file_id, load(source))
+
+
+class DedupRun:
+    """Submits one copy of each content per run; the other copies get its result.
+
+    ``on_reused(file_id)`` is called for every document served from another one's result
+    (e.g. to stamp ``upload_time``).
+    """
+
+    def __init__(self, dedup: PdfDedup, outputs: OutputDir, on_reused: Callable[[str], None]) -> None:
+        self.dedup = dedup
+        self.outputs = outputs
+        self.on_reused = on_reused
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._leaders: Dict[str, str] = {}  # canonical -> file_id submitted in this run
+        self._followers: Dict[str, List[str]] = {}  # submitted file_id -> duplicates waiting for it
+        self._finished: Set[str] = set()
+
+    def _reuse(self, source_id: str, file_id: str) -> bool:
+        try:
+            path = copy_result(self.outputs, source_id, file_id)
+        except Exception as e:  # unreadable result: submit the duplicate after all
+            logging.warning("Could not reuse the result of %s for %s: %s", source_id, file_id, e)
+            return False
+        if path is None:
+            return False
+        logging.info("Reused the result of %s for duplicate %s", source_id, file_id)
+        with self._lock:
+            self.reused += 1
+        self.on_reused(file_id)
+        return True
+
+    def route(
+        self, items: Iterable[T], file_id_of: Callable[[T], str], path_of: Callable[[T], str]
+    ) -> Iterator[T]:
+        """Yields the items that have to be submitted; duplicates are served or parked."""
+        for item in items:
+            file_id = file_id_of(item)
+            try:
+                canonical = self.dedup.canonical(file_id, path_of(item))
+            except OSError as e:
+                logging.warning("Could not hash %s: %s", file_id, e)
+                yield item
+                continue
+            if canonical != file_id and self._reuse(canonical, file_id):
+                continue
+            with self._lock:
+                leader = self._leaders.setdefault(canonical, file_id)
+                parked = leader != file_id and leader not in self._finished
+                if parked:
+                    self._followers.setdefault(leader, []).append(file_id)
+            if parked:
+                continue
+            if leader != file_id and self._reuse(leader, file_id):
+                continue
+            yield item
+
+    def finished(self, file_id: str, result) -> List[str]:
+        """Records ``file_id``'s result; saves it for the duplicates that waited on it, and returns their ids."""
+        with self._lock:
+            self._finished.add(file_id)
+            followers = self._followers.pop(file_id, [])
+        for follower in followers:
+            self.outputs.save(follower, result)
+            with self._lock:
+                self.reused += 1
+            self.on_reused(follower)
+        return followers
+
+    def summary(self) -> str:
+        with self._lock:
+            waiting = sum(len(f) for f in self._followers.values())
+        summary = f"{self.reused} duplicates served from another document's result"
+        if waiting:
+            summary += f", {waiting} left waiting on documents that did not finish"
+        return summary
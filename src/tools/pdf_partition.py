@@ -0,0 +1,260 @@
+"""Page-parallel ``partition_pdf(strategy="hi_res")`` for long PDFs.
+
+The local chunkers (``tools/unstructure_pdf.py`` of esg, standards, reports,
+education, edu_textbooks and ali, and ``journals/tools/chunk_by_sci_pdf.py``)
+partitioned a whole document in one process. A 600-page ESG report kept
+one core busy for tens of minutes while the others were idle.
+
+``partition_pdf_pages`` splits the PDF into ranges of ``pages_per_range``
+pages, writes each range to a temporary PDF (pypdf, which ships with
+``unstructured[pdf]``), partitions the ranges on a process pool and stitches
+the elements back in page order:
+
+* ``metadata.page_number`` is shifted by the range's first page;
+* ``metadata.filename`` / ``file_directory`` point at the original file
+  again, not at the range file;
+* coordinates are relative to their page, so they stay valid unchanged;
+* images extracted with ``pdf_image_output_dir_path`` go to one
+  subdirectory per range, so ``figure-1-1.jpg`` of two ranges cannot
+  overwrite each other.
+
+Each pool worker is warmed up once by ``tools.warm_pool.warm_worker``
+(layout model, OCR languages, NLTK data) and then reuses it for every range
+it handles. The pool is shared by all documents
+of the process. It is opt-in: ``PDF_PAGE_WORKERS`` (default 1, i.e. the
+whole document in-process as before) and ``PDF_PAGES_PER_RANGE`` (default 10).
+Documents no longer than one range are always partitioned in-process.
+
+With ``PDF_ADAPTIVE_STRATEGY=1``, ``strategy="hi_res"`` calls keep ``hi_res``
+only for the pages that need it (scans, tables, large images; see
+``tools.pdf_strategy``). The other pages are partitioned with ``fast`` from
+their text layer. Ranges then never mix strategies, and a document is split
+even without page workers when its pages take different strategies.
+
+With ``PDF_ELEMENT_CACHE`` set, the elements of every page are kept in
+``tools.element_cache`` and only the pages missing from it are partitioned.
+
+Usage:
+    elements = partition_pdf_pages(
+        filename=pdf_name, strategy="hi_res", hi_res_model_name="yolox", languages=["chi_sim"]
+    )
+    chunks = chunk_by_title(elements, ...)
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Dict, List, Optional, Sequence, Tuple
+
+from tools.element_cache import ElementCache
+from tools.pdf_strategy import HI_RES, plan_pages
+from tools.warm_pool import stage, warm_worker
+
+PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", 1))
+PAGES_PER_RANGE = int(os.environ.get("PDF_PAGES_PER_RANGE", 10))
+ADAPTIVE = os.environ.get("PDF_ADAPTIVE_STRATEGY", "0").lower() in ("1", "true", "yes", "on")
+IMAGE_DIR_ARGS = ("pdf_image_output_dir_path", "image_output_dir_path", "extract_image_block_output_dir")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key: Optional[Tuple[int, str, Tuple[str, ...]]] = None
+_pool_lock = threading.Lock()
+_cache: Optional[ElementCache] = None
+_cache_opened = False
+
+
+def page_ranges(strategies: Sequence[Optional[str]], pages_per_range: int) -> List[Tuple[int, int, str]]:
+    """``[start, end)`` 0-based page ranges of at most ``pages_per_range`` pages sharing one strategy.
+
+    Pages whose strategy is ``None`` are left out.
+    """
+    ranges: List[Tuple[int, int, str]] = []
+    for page, strategy in enumerate(strategies):
+        if strategy is None:  # nothing to partition (e.g. cached)
+            continue
+        if ranges and ranges[-1][1] == page and ranges[-1][2] == strategy and page - ranges[-1][0] < pages_per_range:
+            ranges[-1] = (ranges[-1][0], page + 1, strategy)
+        else:
+            ranges.append((page, page + 1, strategy))
+    return ranges
+
+
+def _shared_pool(workers: int, model_name: str, languages: Sequence[str]) -> ProcessPoolExecutor:
+    global _pool, _pool_key
+    key = (workers, model_name, tuple(languages))
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker, initargs=key[1:])
+            _pool_key = key
+        return _pool
+
+
+def _element_cache() -> Optional[ElementCache]:
+    """The process's ``ElementCache.from_env()``, opened on first use."""
+    global _cache, _cache_opened
+    with _pool_lock:
+        if not _cache_opened:
+            _cache, _cache_opened = ElementCache.from_env(), True
+        return _cache
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_key = None, None
+
+
+atexit.register(shutdown_pool)
+
+
+def split_pdf(filename: str, ranges: List[Tuple[int, int, str]], directory: str) -> List[str]:
+    """Writes each page range of ``filename`` to its own PDF in ``directory``."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(filename)
+    paths = []
+    for start, end, _ in ranges:
+        writer = PdfWriter()
+        for index in range(start, end):
+            writer.add_page(reader.pages[index])
+        path = os.path.join(directory, f"pages-{start + 1:05d}-{end:05d}.pdf")
+        with open(path, "wb") as f:
+            writer.write(f)
+        paths.append(path)
+    return paths
+
+
+def stitch(elements: List[Any], first_page: int, filename: Optional[str]) -> List[Any]:
+    """Maps the elements of a range file back onto the original document (``first_page`` is 0-based)."""
+    directory, name = os.path.split(os.path.abspath(filename)) if filename else (None, None)
+    for element in elements:
+        metadata = element.metadata
+        metadata.page_number = (metadata.page_number or 1) + first_page
+        metadata.filename = name
+        metadata.file_directory = directory
+    return elements
+
+
+def partition_range(range_file: str, first_page: int, filename: Optional[str], kwargs: Dict[str, Any]) -> List[Any]:
+    """Runs in a pool worker: partitions one range file and stitches its elements."""
+    from unstructured.partition.pdf import partition_pdf
+
+    return stitch(partition_pdf(filename=range_file, **kwargs), first_page, filename)
+
+
+def _page_count(filename: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(filename).pages)
+
+
+def partition_pdf_pages(
+    filename: Optional[str] = None,
+    file: Optional[IO[bytes]] = None,
+    *,
+    workers: Optional[int] = None,
+    pages_per_range: Optional[int] = None,
+    adaptive: Optional[bool] = None,
+    **kwargs,
+) -> List[Any]:
+    """``partition_pdf(filename=... or file=..., **kwargs)``, split over page ranges when the document is long.
+
+    With ``adaptive`` (default ``PDF_ADAPTIVE_STRATEGY``), a ``strategy="hi_res"`` call partitions the
+    pages that ``tools.pdf_strategy.plan_pages`` finds a good text layer on with ``strategy="fast"``.
+    """
+    with stage("partition"):
+        return _partition_pdf_pages(filename, file, workers, pages_per_range, adaptive, kwargs)
+
+
+def _partition_pdf_pages(
+    filename: Optional[str],
+    file: Optional[IO[bytes]],
+    workers: Optional[int],
+    pages_per_range: Optional[int],
+    adaptive: Optional[bool],
+    kwargs: Dict[str, Any],
+) -> List[Any]:
+    from unstructured.partition.pdf import partition_pdf
+
+    workers = PAGE_WORKERS if workers is None else workers
+    pages_per_range = pages_per_range or PAGES_PER_RANGE
+    adaptive = (ADAPTIVE if adaptive is None else adaptive) and kwargs.get("strategy") == HI_RES
+    cache = None
+    if not any(kwargs.get(arg) for arg in ("extract_images_in_pdf", "pdf_extract_images")):
+        cache = _element_cache()
+    if workers <= 1 and not adaptive and cache is None:
+        return partition_pdf(filename=filename, file=file, **kwargs)
+
+    with tempfile.TemporaryDirectory(prefix="pdf-pages-") as tmp:
+        path, source = filename, filename
+        if filename is None:  # spooled to disk; the elements get partition_pdf(file=...)'s metadata
+            path, source = os.path.join(tmp, "document.pdf"), kwargs.get("metadata_filename")
+            with open(path, "wb") as out:
+                shutil.copyfileobj(file, out)
+            file.seek(0)
+        page_count = _page_count(path)
+        strategies = [kwargs.get("strategy", "auto")] * page_count
+        if adaptive:
+            strategies = plan_pages(
+                path,
+                tables=bool(kwargs.get("infer_table_structure")),
+                images=bool(kwargs.get("extract_images_in_pdf") or kwargs.get("pdf_extract_images")),
+                page_count=page_count,
+            )
+        cached: Dict[int, List[Any]] = {}
+        if cache is not None:
+            key = cache.key(path, kwargs)
+            cached = cache.get(key, strategies)
+        todo = [None if page in cached else strategy for page, strategy in enumerate(strategies)]
+        # Without page workers, ranges only separate the strategies (and the cached pages).
+        ranges = page_ranges(todo, pages_per_range if workers > 1 else max(1, page_count))
+        if cache is None and len(ranges) <= 1:
+            if ranges:
+                kwargs = dict(kwargs, strategy=ranges[0][2])
+            return partition_pdf(filename=filename, file=file, **kwargs)
+
+        started = time.perf_counter()
+        whole = len(ranges) == 1 and ranges[0][:2] == (0, page_count)
+        range_files = [path] if whole else split_pdf(path, ranges, tmp)
+        pool = None
+        if workers > 1 and len(ranges) > 1:
+            pool = _shared_pool(workers, kwargs.get("hi_res_model_name") or "yolox", kwargs.get("languages") or ["eng"])
+        results = []
+        for (start, end, strategy), range_file in zip(ranges, range_files):
+            range_kwargs = dict(kwargs, strategy=strategy)
+            for arg in IMAGE_DIR_ARGS:
+                if range_kwargs.get(arg):
+                    range_kwargs[arg] = os.path.join(range_kwargs[arg], f"pages-{start + 1:05d}-{end:05d}")
+            if pool is None:
+                results.append(partition_range(range_file, start, source, range_kwargs))
+            else:
+                results.append(pool.submit(partition_range, range_file, start, source, range_kwargs))
+        by_page: Dict[int, List[Any]] = {page: stitch(elements, 0, source) for page, elements in cached.items()}
+        for (start, end, _), result in zip(ranges, results):
+            for page in range(start, end):
+                by_page[page] = []
+            for element in result if pool is None else result.result():
+                page = min(max(start, element.metadata.page_number - 1), end - 1)
+                by_page[page].append(element)
+        if cache is not None and ranges:
+            cache.put(key, {page: (strategies[page], by_page[page]) for page in range(page_count) if page not in cached})
+        elements = [element for page in range(page_count) for element in by_page.get(page, [])]
+        logging.info(
+            "Partitioned %s: %d pages (%d hi_res, %d cached) in %d ranges on %d workers, %.1fs",
+            source or "<file>",
+            page_count,
+            strategies.count(HI_RES),
+            len(cached),
+            len(ranges),
+            max(1, workers),
+            time.perf_counter() - started,
+        )
+        return elements
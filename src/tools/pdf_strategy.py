@@ -0,0 +1,132 @@
+"""Per-page choice between the ``fast`` text-layer path and ``hi_res`` layout + OCR.
+
+Every local chunker partitions with ``strategy="hi_res"``, so a born-digital
+journal article with a perfect text layer still goes through YOLOX and
+tesseract page by page. ``plan_pages`` looks at the PDF itself and keeps
+``hi_res`` only for the pages that need it:
+
+* pages without a text layer (fewer than ``MIN_PAGE_CHARS`` characters), i.e.
+  scans that need OCR;
+* pages with at least ``TABLE_RULINGS`` ruling lines / rectangles, when the
+  caller infers table structure (only ``hi_res`` yields ``text_as_html``);
+* pages whose images cover ``IMAGE_AREA`` of the page or more, when the caller
+  extracts images (only ``hi_res`` yields ``Image`` elements).
+
+All other pages take ``fast``. ``SAMPLE_PAGES`` pages spread over the document
+are profiled first; when none of them has a text layer, the whole document
+is taken as scanned and the other pages are not looked at.
+
+Pages are profiled with PyMuPDF if installed, otherwise with pdfminer.six
+(a dependency of ``unstructured[pdf]``). ``tools.pdf_partition`` partitions
+the resulting runs of pages with their strategy when
+``PDF_ADAPTIVE_STRATEGY=1``.
+
+Usage:
+    strategies = plan_pages(path, tables=True, images=False)
+    logging.info("%d of %d pages need hi_res", strategies.count(HI_RES), len(strategies))
+"""
+
+import logging
+import os
+from typing import List, NamedTuple, Optional, Sequence
+
+from tools.doc_cost import count_pages
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - optional
+    fitz = None
+
+FAST = "fast"
+HI_RES = "hi_res"
+
+MIN_PAGE_CHARS = int(os.environ.get("PDF_FAST_MIN_CHARS", 200))
+TABLE_RULINGS = int(os.environ.get("PDF_FAST_TABLE_RULINGS", 12))
+IMAGE_AREA = float(os.environ.get("PDF_FAST_IMAGE_AREA", 0.3))
+SAMPLE_PAGES = 5
+
+
+class PageProfile(NamedTuple):
+    chars: int  # characters in the text layer
+    rulings: int  # straight lines and rectangles drawn on the page
+    image_area: float  # fraction of the page covered by images
+
+
+def _profile_fitz(path: str, pages: Sequence[int]) -> List[PageProfile]:
+    profiles = []
+    with fitz.open(path) as doc:
+        for pno in pages:
+            page = doc.load_page(pno)
+            area = abs(page.rect) or 1.0
+            rulings = sum(
+                1 for drawing in page.get_drawings() for item in drawing["items"] if item[0] in ("l", "re")
+            )
+            covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+            profiles.append(PageProfile(len(page.get_text().strip()), rulings, min(1.0, covered / area)))
+    return profiles
+
+
+def _profile_pdfminer(path: str, pages: Sequence[int]) -> List[PageProfile]:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTCurve, LTFigure, LTImage, LTTextContainer
+
+    def walk(container):
+        for obj in container:
+            yield obj
+            if isinstance(obj, LTFigure):
+                yield from walk(obj)
+
+    profiles = {}
+    for pno, layout in zip(sorted(pages), extract_pages(path, page_numbers=sorted(pages))):
+        area = (layout.width * layout.height) or 1.0
+        chars = rulings = 0
+        covered = 0.0
+        for obj in walk(layout):
+            if isinstance(obj, LTTextContainer):
+                chars += len(obj.get_text().strip())
+            elif isinstance(obj, LTCurve):  # LTLine and LTRect are curves too
+                rulings += 1
+            elif isinstance(obj, LTImage):
+                covered += obj.width * obj.height
+        profiles[pno] = PageProfile(chars, rulings, min(1.0, covered / area))
+    return [profiles[pno] for pno in pages]
+
+
+def profile_pages(path: str, pages: Sequence[int]) -> List[PageProfile]:
+    """Profiles of the 0-based ``pages`` of ``path``."""
+    if fitz is not None:
+        return _profile_fitz(path, pages)
+    return _profile_pdfminer(path, pages)
+
+
+def choose(profile: PageProfile, *, tables: bool, images: bool) -> str:
+    if profile.chars < MIN_PAGE_CHARS:
+        return HI_RES
+    if tables and profile.rulings >= TABLE_RULINGS:
+        return HI_RES
+    if images and profile.image_area >= IMAGE_AREA:
+        return HI_RES
+    return FAST
+
+
+def sample(page_count: int, size: int = SAMPLE_PAGES) -> List[int]:
+    """Up to ``size`` 0-based pages spread evenly over the document, first page included."""
+    if page_count <= size:
+        return list(range(page_count))
+    return sorted({round(i * (page_count - 1) / (size - 1)) for i in range(size)})
+
+
+def plan_pages(path: str, *, tables: bool, images: bool, page_count: Optional[int] = None) -> List[str]:
+    """``FAST`` or ``HI_RES`` for every page of ``path``; all ``HI_RES`` when the PDF cannot be profiled."""
+    page_count = count_pages(path) if page_count is None else page_count
+    if not page_count:
+        return []
+    try:
+        sampled = sample(page_count)
+        if all(profile.chars < MIN_PAGE_CHARS for profile in profile_pages(path, sampled)):
+            return [HI_RES] * page_count  # scanned
+        profiles = profile_pages(path, range(page_count))
+    except Exception as e:
+        logging.warning("Could not profile the pages of %s, keeping hi_res: %s", path, e)
+        return [HI_RES] * page_count
+    return [choose(profile, tables=tables, images=images) for profile in profiles]
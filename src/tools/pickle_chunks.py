@@ -0,0 +1,131 @@
+"""Chunk preparation shared by the pickle -> Pinecone/OpenSearch loaders.
+
+The domain pickles come in three shapes: ``{"text", "page_number"}`` dicts,
+``[text, page_number]`` pairs and plain strings. ``merge_pickle_list`` accepts
+all of them and always returns ``[text, page_number]`` pairs (``page_number``
+is ``None`` when the pickle has none): short elements are glued onto the next
+one and oversized tables are split row-wise (``split_html_table``) so every
+chunk fits the embedding model.
+"""
+
+import logging
+from typing import Any, List, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup, Tag
+
+from tools.tokenizer import count_tokens, num_tokens_from_string
+
+MAX_CHUNK_TOKENS = 8100
+MIN_CHUNK_TOKENS = 15
+# Token counts of concatenated rows are not exactly additive (BPE merges across
+# tag boundaries); keep this much of every fragment's budget in reserve.
+_SPLIT_SLACK_TOKENS = 32
+
+
+def fix_utf8(original_list):
+    cleaned_list = []
+    for original_str in original_list:
+        cleaned_str = original_str[0].replace("\ufffd", " ")
+        cleaned_list.append([cleaned_str, original_str[1]])
+    return cleaned_list
+
+
+def _table_rows(table: Tag) -> Tuple[List[Tag], List[Tag]]:
+    """Splits a table's own rows (not those of nested tables) into header and body."""
+    header, body = [], []
+    for child in table.children:
+        if not isinstance(child, Tag):
+            continue
+        if child.name == "tr":
+            body.append(child)
+        elif child.name in ("thead", "tbody", "tfoot"):
+            rows = [tr for tr in child.children if isinstance(tr, Tag) and tr.name == "tr"]
+            (header if child.name == "thead" else body).extend(rows)
+    if not header and body:
+        first = body[0]
+        cells = [c for c in first.children if isinstance(c, Tag)]
+        if cells and all(c.name == "th" for c in cells):
+            header.append(body.pop(0))
+    return header, body
+
+
+def split_html_table(table: Union[str, Tag], chunk_size: int = MAX_CHUNK_TOKENS) -> List[str]:
+    """Splits an oversized ``<table>`` into fragments of at most ``chunk_size`` tokens.
+
+    Rows are walked once and counted in one batch; every fragment repeats the
+    header rows (a ``<thead>``, or a leading row of ``<th>`` cells) unless the
+    header alone would take half the budget. A single row larger than
+    ``chunk_size`` becomes its own fragment.
+    """
+    if isinstance(table, str):
+        table = BeautifulSoup(table, "html.parser").find("table")
+        if table is None:
+            return []
+    header, body = _table_rows(table)
+    if not body:
+        return [str(table)]
+
+    header_html = "".join(map(str, header))
+    if header_html and num_tokens_from_string(header_html) >= chunk_size // 2:
+        # Too big to repeat: keep the header rows only at the top of the first fragment.
+        body = header + body
+        header_html = ""
+
+    def wrap(rows: List[str]) -> str:
+        head = f"<thead>{header_html}</thead>" if header_html else ""
+        return f"<table>{head}<tbody>{''.join(rows)}</tbody></table>"
+
+    budget = chunk_size - num_tokens_from_string(wrap([])) - _SPLIT_SLACK_TOKENS
+    row_html = [str(row) for row in body]
+    fragments: List[str] = []
+    current: List[str] = []
+    used = 0
+    for html, tokens in zip(row_html, count_tokens(row_html)):
+        if current and used + tokens > budget:
+            fragments.append(wrap(current))
+            current, used = [], 0
+        current.append(html)
+        used += tokens
+    fragments.append(wrap(current))
+    return fragments
+
+
+def text_and_page(element: Any) -> Tuple[str, Optional[Any]]:
+    if isinstance(element, dict):
+        return element.get("text") or "", element.get("page_number")
+    if isinstance(element, (list, tuple)):
+        return element[0] or "", element[1] if len(element) > 1 else None
+    return element or "", None
+
+
+def merge_pickle_list(data) -> List[list]:
+    elements = [text_and_page(element) for element in data]
+    # One batched pass counts every element once.
+    token_counts = count_tokens([text for text, _ in elements])
+    temp = ""
+    result = []
+    page_number = None
+    for (text, page_number), token_count in zip(elements, token_counts):
+        if token_count > MAX_CHUNK_TOKENS:
+            soup = BeautifulSoup(text, "html.parser")
+            tables = soup.find_all("table")
+            contents = [str(table) for table in tables]
+            for table, table_content, table_tokens in zip(tables, contents, count_tokens(contents)):
+                if table_tokens < MAX_CHUNK_TOKENS:
+                    if table_content:  # check if table_content is not empty
+                        result.append([table_content, page_number])
+                else:
+                    try:
+                        for sub_table in split_html_table(table):
+                            result.append([sub_table, page_number])
+                    except Exception as e:
+                        logging.error(f"Error splitting table: {e}")
+        elif token_count < MIN_CHUNK_TOKENS:
+            temp += text + " "
+        else:
+            result.append([(temp + text), page_number])
+            temp = ""
+    if temp:
+        result.append([temp, page_number])
+
+    return result
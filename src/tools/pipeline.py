@@ -0,0 +1,136 @@
+"""Minimal thread-based stage pipeline with bounded queues.
+
+Each ``Stage`` runs ``fn(item)`` on ``workers`` threads. Stages are connected
+by bounded queues, so a slow stage (an embedding API, an index bulk call)
+blocks the stages in front of it instead of letting work pile up in memory;
+the source iterator is only advanced when the first queue has room.
+
+``fn`` returns the item to hand to the next stage, or ``None`` to drop it.
+An exception drops the item, is logged with the stage name and counted in
+``PipelineStats``; the pipeline keeps going.
+
+Usage:
+    pipeline = Pipeline([Stage("load", load, workers=8), Stage("index", index, workers=4)])
+    stats = pipeline.run(records)
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+    queue_size: Optional[int] = None  # defaults to 2 * workers
+
+
+@dataclass
+class PipelineStats:
+    fed: int = 0
+    processed: Counter = field(default_factory=Counter)
+    dropped: Counter = field(default_factory=Counter)
+    failed: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        parts = [
+            f"{name}: {self.processed[name]} ok, {self.failed[name]} failed, {self.dropped[name]} dropped"
+            for name in self.processed.keys() | self.failed.keys() | self.dropped.keys()
+        ]
+        return f"{self.fed} items in {self.elapsed:.1f}s ({'; '.join(sorted(parts))})"
+
+
+class Pipeline:
+    def __init__(
+        self,
+        stages: Sequence[Stage],
+        *,
+        describe: Callable[[Any], str] = repr,
+    ) -> None:
+        """``describe(item)`` labels items in error logs (e.g. their record id)."""
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = list(stages)
+        self.describe = describe
+        self.stats = PipelineStats()
+        self._lock = threading.Lock()
+
+    def _count(self, counter: Counter, name: str) -> None:
+        with self._lock:
+            counter[name] += 1
+
+    def _worker(
+        self,
+        stage: Stage,
+        inbox: queue.Queue,
+        outbox: Optional[queue.Queue],
+        remaining: List[int],
+        next_workers: int,
+    ) -> None:
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            try:
+                result = stage.fn(item)
+            except Exception as exc:
+                self._count(self.stats.failed, stage.name)
+                logging.error("Stage %s failed for %s: %s", stage.name, self.describe(item), exc)
+                continue
+            if result is None:
+                self._count(self.stats.dropped, stage.name)
+                continue
+            self._count(self.stats.processed, stage.name)
+            if outbox is not None:
+                outbox.put(result)
+        # The last worker of a stage to finish tells every worker of the next one.
+        with self._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and outbox is not None:
+            for _ in range(next_workers):
+                outbox.put(_STOP)
+
+    def run(self, source: Iterable[Any]) -> PipelineStats:
+        """Feeds every item of ``source`` through the stages; returns when all are done."""
+        started = time.time()
+        queues = [
+            queue.Queue(maxsize=stage.queue_size or 2 * max(1, stage.workers)) for stage in self.stages
+        ]
+        threads = []
+        for i, stage in enumerate(self.stages):
+            workers = max(1, stage.workers)
+            outbox = queues[i + 1] if i + 1 < len(self.stages) else None
+            next_workers = max(1, self.stages[i + 1].workers) if outbox is not None else 0
+            remaining = [workers]
+            for n in range(workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, queues[i], outbox, remaining, next_workers),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                queues[0].put(item)
+                self.stats.fed += 1
+        finally:
+            for _ in range(max(1, self.stages[0].workers)):
+                queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+            self.stats.elapsed = time.time() - started
+        logging.info("Pipeline finished: %s", self.stats.summary())
+        return self.stats
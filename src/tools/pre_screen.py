@@ -0,0 +1,606 @@
+"""PDF pre-screening, as a gate in front of the unstructure services.
+
+``journals/0_pre_screening_fast.py`` checked PDFs in parallel but only
+printed a report, so the pipelines still sent corrupt, encrypted and empty
+files to the GPU backend, and each one held a slot until the 800 s timeout.
+This module holds the checks from that script (``check_single_pdf``) and
+gives every result a verdict:
+
+* ``QUARANTINE``: empty file, not openable, encrypted, zero pages or first
+  page not renderable. These are never submitted. They are appended to the
+  quarantine list (JSONL, ``PRE_SCREEN_QUARANTINE``) with their issues.
+* ``OCR``: no extractable text on the first ``OCR_SAMPLE_PAGES`` pages, so
+  probably a scan. These still go through, but the pipelines put them on the
+  OCR path: submitted with their own priority, first in the queue.
+* ``OK``: everything else. Font and qpdf warnings are reported but do not
+  block submission.
+
+PyMuPDF is used when installed, then pypdf. Without either, only the byte-level checks run:
+the ``%PDF-`` header, an ``/Encrypt`` trailer entry and the page count from ``tools.doc_cost``.
+
+``PreScreen.gate`` checks items in batches on a process pool. It yields the
+items that may be submitted, together with their results.
+
+Results are kept in a ``ScreenCache`` (SQLite, ``PRE_SCREEN_CACHE``).
+Each result is committed as soon as it arrives, so a killed run loses nothing
+and a rerun only opens new or changed files. A row is keyed by path, inode,
+size and mtime. A hash of the file's first 64 KiB lets a renamed file keep
+its row. ``ScreenCache.query`` lists stored files by verdict or by issue text,
+e.g. every encrypted file under a directory.
+
+Usage:
+    with PreScreen.from_env() as screen:
+        for item, result in screen.gate(items, path_of=lambda item: item.pdf_path, key=lambda item: item.file_id):
+            submit(item, ocr=result.verdict == OCR)
+"""
+
+from __future__ import annotations
+
+import concurrent.futures as cf
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from tools.doc_cost import count_pages
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - optional
+    fitz = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional
+    PdfReader = None
+
+T = TypeVar("T")
+
+OK = "ok"
+OCR = "ocr"
+QUARANTINE = "quarantine"
+
+OCR_SAMPLE_PAGES = 3
+TAIL_BYTES = 64 * 1024
+HEAD_HASH_BYTES = 64 * 1024
+
+
+@dataclass
+class PDFCheckConfig:
+    enable_qpdf: bool = True
+    conditional_qpdf: bool = True  # 若前置全部正常则跳过 qpdf
+    font_scan_pages: int = 5  # <=0 表示全量
+    font_scan_strategy: str = "firstN"  # firstN | spread
+    stop_on_first_unembedded: bool = True
+    processes: int = 4
+    qpdf_timeout: int = 25
+    cache_path: Optional[str] = None
+    ignore_dirs: Tuple[str, ...] = tuple()  # 可配置忽略目录前缀
+    verbose: bool = True
+
+
+@dataclass
+class PDFCheckResult:
+    path: str
+    issues: List[str]
+    info: List[str]
+    size: int
+    mtime: float
+    duration: float
+    verdict: str = OK
+    pages: Optional[int] = None
+
+
+# ------------------------- 工具函数 ------------------------- #
+
+
+def run_qpdf_check(filepath: str, timeout: int) -> Tuple[bool, List[str], dict]:
+    if not shutil.which("qpdf"):
+        return False, [], {}
+    try:
+        proc = subprocess.run(
+            ["qpdf", "--check", filepath], capture_output=True, text=True, timeout=timeout
+        )
+    except Exception as e:  # pragma: no cover - 外部进程异常
+        return True, [f"qpdf 执行失败: {e}"], {}
+    output = (proc.stdout + proc.stderr).splitlines()
+    warnings = [l.strip() for l in output if "WARNING:" in l]
+    linearized = None
+    for l in output:
+        if "File is linearized" in l:
+            linearized = True
+        elif "File is not linearized" in l:
+            linearized = False
+    return True, warnings, {"linearized": linearized}
+
+
+def select_font_pages(total_pages: int, cfg: PDFCheckConfig) -> List[int]:
+    if cfg.font_scan_pages <= 0 or cfg.font_scan_pages >= total_pages:
+        return list(range(total_pages))
+    n = cfg.font_scan_pages
+    if cfg.font_scan_strategy == "spread" and total_pages > n:
+        # 均匀抽样页索引
+        step = total_pages / n
+        return sorted({int(i * step) for i in range(n)})
+    # 默认 firstN
+    return list(range(min(n, total_pages)))
+
+
+def _check_raw(path: str, issues: List[str], info: List[str]) -> Tuple[str, Optional[int]]:
+    """Byte-level checks when neither PyMuPDF nor pypdf is installed."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(1024)
+        f.seek(max(0, size - TAIL_BYTES))
+        tail = f.read()
+    if b"%PDF-" not in head:
+        issues.append("文件头缺少 %PDF-, 不是 PDF。")
+        return QUARANTINE, None
+    if b"/Encrypt" in tail:
+        issues.append("文件已加密 (trailer /Encrypt)。")
+        return QUARANTINE, None
+    pages = count_pages(path)
+    if pages == 0:
+        issues.append("文件页数为 0。")
+        return QUARANTINE, pages
+    if pages is None:
+        info.append("未安装 PyMuPDF/pypdf, 页数未知。")
+    return OK, pages
+
+
+# ------------------------- 核心单文件检查逻辑 (供多进程调用) ------------------------- #
+
+
+def check_single_pdf(path: str, cfg: PDFCheckConfig) -> PDFCheckResult:
+    start = time.time()
+    issues: List[str] = []
+    info: List[str] = []
+    size = os.path.getsize(path)
+    mtime = os.path.getmtime(path)
+    verdict = OK
+
+    # 0. 空文件
+    if size == 0:
+        issues.append("文件大小为 0 字节。")
+        return PDFCheckResult(path, issues, info, size, mtime, time.time() - start, QUARANTINE, 0)
+
+    if fitz is None and PdfReader is None:
+        verdict, pages = _check_raw(path, issues, info)
+        return PDFCheckResult(path, issues, info, size, mtime, time.time() - start, verdict, pages)
+
+    opened = False
+    doc = None
+    page_count = 0
+
+    if fitz is not None:
+        try:
+            doc = fitz.open(path)
+            opened = True
+            page_count = len(doc)
+            if doc.needs_pass:
+                issues.append("PyMuPDF: 文件已加密 (需要密码)。")
+                verdict = QUARANTINE
+            elif page_count == 0:
+                issues.append("PyMuPDF: 文件页数为 0。")
+                verdict = QUARANTINE
+            else:
+                try:
+                    page0 = doc.load_page(0)
+                    page0.get_pixmap(dpi=48)  # 更低 dpi 更快即可验证可渲染
+                    texts = [page0.get_text().strip()]
+                    for pno in range(1, min(OCR_SAMPLE_PAGES, page_count)):
+                        texts.append(doc.load_page(pno).get_text().strip())
+                    if not any(texts):
+                        issues.append("警告: 可能是纯图片PDF (抽样页无可提取文本)。")
+                        verdict = OCR
+                    elif not texts[0] and page_count > 1:
+                        issues.append("警告: 可能是纯图片PDF (首页无可提取文本)。")
+                except Exception as e:  # pragma: no cover - 特殊渲染异常
+                    issues.append(f"PyMuPDF: 第一页处理失败: {e}")
+                    verdict = QUARANTINE
+        except Exception as e:
+            issues.append(f"PyMuPDF 无法打开: {e}")
+
+    # 1. 回退 pypdf
+    if not opened:
+        if PdfReader is None:
+            verdict = QUARANTINE
+        else:
+            try:
+                with open(path, "rb") as f:
+                    reader = PdfReader(f)
+                    if getattr(reader, "is_encrypted", False):
+                        issues.append("pypdf: 文件已加密。")
+                        verdict = QUARANTINE
+                    else:
+                        page_count = len(reader.pages)
+                        if page_count == 0:
+                            issues.append("pypdf: 文件页数为 0。")
+                            verdict = QUARANTINE
+                        else:
+                            info.append(f"pypdf: 可解析 ({page_count} 页)。")
+                            sample = range(min(OCR_SAMPLE_PAGES, page_count))
+                            if not any((reader.pages[i].extract_text() or "").strip() for i in sample):
+                                issues.append("警告: 可能是纯图片PDF (抽样页无可提取文本)。")
+                                verdict = OCR
+            except Exception as e:
+                issues.append(f"pypdf 打开失败: {e}")
+                verdict = QUARANTINE
+    elif verdict != QUARANTINE:
+        # 2. 字体抽样检查
+        try:
+            pages_to_check = select_font_pages(page_count, cfg)
+            non_embedded_fonts = []
+            for pno in pages_to_check:
+                try:
+                    fonts = doc.get_page_fonts(pno)
+                except Exception as e:  # pragma: no cover - 罕见页级异常
+                    issues.append(f"警告: 第 {pno+1} 页字体信息获取失败: {e}")
+                    continue
+                for font in fonts:
+                    embedded = font[3] if len(font) > 3 else None
+                    name = font[1] if len(font) > 1 else str(font)
+                    if embedded is False and name not in non_embedded_fonts:
+                        non_embedded_fonts.append(name)
+                        if cfg.stop_on_first_unembedded:
+                            break
+                if cfg.stop_on_first_unembedded and non_embedded_fonts:
+                    break
+            if non_embedded_fonts:
+                issues.append(
+                    "警告: 发现未嵌入字体(抽样): " + ", ".join(non_embedded_fonts)
+                )
+            elif cfg.font_scan_pages > 0 and page_count > cfg.font_scan_pages:
+                info.append(
+                    f"字体检查: 抽样 {len(pages_to_check)}/{page_count} 页策略={cfg.font_scan_strategy}"
+                )
+        except Exception as e:
+            issues.append(f"字体检查异常: {e}")
+
+    if doc:
+        try:
+            doc.close()
+        except Exception:  # pragma: no cover
+            pass
+
+    # 3. 条件 qpdf
+    run_qpdf = cfg.enable_qpdf and (not cfg.conditional_qpdf or issues)
+    if run_qpdf:
+        qpdf_available, qpdf_warnings, meta = run_qpdf_check(path, cfg.qpdf_timeout)
+        if qpdf_available:
+            if meta.get("linearized") is True:
+                info.append("qpdf: 文件 linearized")
+            elif meta.get("linearized") is False:
+                info.append("qpdf: 非 linearized")
+            if qpdf_warnings:
+                linearization_related = any(
+                    "shared object" in w or "hint table" in w for w in qpdf_warnings
+                )
+                if linearization_related:
+                    issues.append(
+                        "结构警告: linearization hint table/共享对象索引异常 (可能影响流式解析)。"
+                    )
+                sample = qpdf_warnings[:5]
+                issues.append("qpdf WARNING 示例: " + " | ".join(sample))
+        else:
+            info.append("qpdf 未安装, 跳过。")
+    elif cfg.enable_qpdf and cfg.conditional_qpdf and not issues:
+        info.append("qpdf: 预检正常 -> 已跳过 (conditional)。")
+
+    return PDFCheckResult(path, issues, info, size, mtime, time.time() - start, verdict, page_count or None)
+
+
+# ------------------------- 缓存处理 ------------------------- #
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pre_screen (
+    path       TEXT PRIMARY KEY,
+    inode      INTEGER NOT NULL,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    head_hash  BLOB NOT NULL,
+    verdict    TEXT NOT NULL,
+    pages      INTEGER,
+    issues     TEXT NOT NULL,
+    info       TEXT NOT NULL,
+    duration   REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pre_screen_file_idx ON pre_screen (inode, size, mtime_ns);
+CREATE INDEX IF NOT EXISTS pre_screen_verdict_idx ON pre_screen (verdict);
+"""
+
+_COLUMNS = "path, size, mtime_ns, verdict, pages, issues, info, duration"
+
+
+def head_hash(path: str) -> bytes:
+    """BLAKE2b of the first ``HEAD_HASH_BYTES``: cheap evidence that a moved file is the same file."""
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(HEAD_HASH_BYTES), digest_size=16).digest()
+
+
+class ScreenCache:
+    """Pre-screen results in SQLite (WAL), one autocommitted row per checked file.
+
+    A row is reused when the file's inode, size and mtime are unchanged. A file renamed or moved on the same
+    filesystem (e.g. by ``rename.py``) keeps its row if the first ``HEAD_HASH_BYTES`` still hash the same.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _result(row) -> PDFCheckResult:
+        path, size, mtime_ns, verdict, pages, issues, info, duration = row
+        return PDFCheckResult(path, json.loads(issues), json.loads(info), size, mtime_ns / 1e9, duration, verdict, pages)
+
+    def get(self, path: str) -> Optional[PDFCheckResult]:
+        """The stored result if ``path`` is unchanged since it was checked, else ``None``."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM pre_screen WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (path, *key),
+            ).fetchone()
+            if row:
+                return self._result(row)
+            moved = self._conn.execute(
+                f"SELECT {_COLUMNS}, head_hash FROM pre_screen WHERE inode = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchall()
+        for *row, digest in moved:
+            try:
+                if head_hash(path) != digest:
+                    continue
+            except OSError:
+                return None
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM pre_screen WHERE path = ?", (path,))
+                self._conn.execute("UPDATE pre_screen SET path = ? WHERE path = ?", (path, row[0]))
+                self._conn.execute("COMMIT")
+            row[0] = path
+            return self._result(row)
+        return None
+
+    def put(self, result: PDFCheckResult) -> None:
+        """Stores ``result`` in its own transaction, unless the file changed while it was being checked."""
+        try:
+            st = os.stat(result.path)
+            digest = head_hash(result.path)
+        except OSError:
+            return
+        if st.st_size != result.size or abs(st.st_mtime - result.mtime) > 1e-6:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pre_screen"
+                " (path, inode, size, mtime_ns, head_hash, verdict, pages, issues, info, duration, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    result.path,
+                    st.st_ino,
+                    st.st_size,
+                    st.st_mtime_ns,
+                    digest,
+                    result.verdict,
+                    result.pages,
+                    json.dumps(result.issues, ensure_ascii=False),
+                    json.dumps(result.info, ensure_ascii=False),
+                    result.duration,
+                    time.time(),
+                ),
+            )
+
+    def query(
+        self, *, verdict: Optional[str] = None, issue: Optional[str] = None, under: Optional[str] = None
+    ) -> Iterator[PDFCheckResult]:
+        """Stored results filtered by verdict, by an issue containing ``issue``, and by directory ``under``."""
+        clauses, params = [], []
+        if verdict:
+            clauses.append("verdict = ?")
+            params.append(verdict)
+        if issue:
+            clauses.append("EXISTS (SELECT 1 FROM json_each(issues) WHERE instr(value, ?) > 0)")
+            params.append(issue)
+        if under:
+            prefix = os.path.join(os.path.abspath(under), "")
+            clauses.append("substr(path, 1, ?) = ?")
+            params.extend([len(prefix), prefix])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM pre_screen{where} ORDER BY path", params).fetchall()
+        return map(self._result, rows)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT verdict, COUNT(*) FROM pre_screen GROUP BY verdict").fetchall())
+
+
+def gather_pdfs(root: str, ignore_dirs: Tuple[str, ...]) -> List[str]:
+    pdfs = []
+    root = os.path.abspath(root)
+    for r, dirs, files in os.walk(root):
+        # 忽略目录前缀 (简单匹配路径中是否包含)
+        skip = False
+        for ig in ignore_dirs:
+            if ig and ig in r:
+                skip = True
+                break
+        if skip:
+            continue
+        for fn in files:
+            if fn.lower().endswith(".pdf"):
+                pdfs.append(os.path.join(r, fn))
+    return pdfs
+
+
+# ------------------------- Gate ------------------------- #
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _batches(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PreScreen:
+    """Runs ``check_single_pdf`` on a process pool, with the result cache and the quarantine list.
+
+    With ``cfg.cache_path`` set, results are looked up in and written to a ``ScreenCache`` there.
+    """
+
+    def __init__(
+        self,
+        cfg: Optional[PDFCheckConfig] = None,
+        quarantine_path: Optional[str] = None,
+        batch_size: int = 256,
+    ) -> None:
+        self.cfg = cfg or PDFCheckConfig()
+        self.quarantine_path = quarantine_path
+        self.batch_size = batch_size
+        self.counts: Counter = Counter()
+        self.cache_hits = 0
+        self.cache = ScreenCache(self.cfg.cache_path) if self.cfg.cache_path else None
+        self._lock = threading.Lock()
+        self._executor: Optional[cf.ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "PreScreen":
+        """``PRE_SCREEN_PROCESSES`` (default 4), ``PRE_SCREEN_CACHE`` (default ``pre_screen_cache.sqlite3``),
+        ``PRE_SCREEN_QUARANTINE`` (default ``pre_screen_quarantine.jsonl``) and ``PRE_SCREEN_QPDF`` (default off;
+        qpdf only adds warnings, which never change the verdict).
+        """
+        cfg = PDFCheckConfig(
+            enable_qpdf=_env_bool("PRE_SCREEN_QPDF", False),
+            processes=max(1, int(os.environ.get("PRE_SCREEN_PROCESSES", 4))),
+            cache_path=os.environ.get("PRE_SCREEN_CACHE", "pre_screen_cache.sqlite3") or None,
+            verbose=False,
+        )
+        return cls(cfg, os.environ.get("PRE_SCREEN_QUARANTINE", "pre_screen_quarantine.jsonl") or None)
+
+    def __enter__(self) -> "PreScreen":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
+    def check(self, paths: Sequence[str]) -> Iterator[PDFCheckResult]:
+        """Results for ``paths`` (absolute or not), cached ones first, the rest in completion order."""
+        pending = []
+        for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+            result = self.cache.get(path) if self.cache else None
+            if result:
+                self.cache_hits += 1
+                yield result
+            else:
+                pending.append(path)
+        if not pending:
+            return
+        if self.cfg.processes <= 1 or len(pending) == 1:
+            results: Iterable[PDFCheckResult] = (self._check_one(p) for p in pending)
+        else:
+            if self._executor is None:
+                self._executor = cf.ProcessPoolExecutor(max_workers=self.cfg.processes)
+            futures = {self._executor.submit(check_single_pdf, p, self.cfg): p for p in pending}
+            results = (self._future_result(fut, futures[fut]) for fut in cf.as_completed(futures))
+        for result in results:
+            if self.cache and result.size:  # unreadable files are checked again next time
+                self.cache.put(result)
+            yield result
+
+    def _check_one(self, path: str) -> PDFCheckResult:
+        return self._unreadable(path, check_single_pdf, path, self.cfg)
+
+    def _future_result(self, fut: cf.Future, path: str) -> PDFCheckResult:
+        return self._unreadable(path, fut.result)
+
+    @staticmethod
+    def _unreadable(path: str, fn: Callable, *args) -> PDFCheckResult:
+        try:
+            return fn(*args)
+        except OSError as e:  # vanished or unreadable: not worth a submission either
+            return PDFCheckResult(path, [f"无法读取: {e}"], [], 0, 0.0, 0.0, QUARANTINE)
+
+    def gate(
+        self,
+        items: Iterable[T],
+        path_of: Callable[[T], str],
+        key: Optional[Callable[[T], str]] = None,
+        on_quarantine: Optional[Callable[[T, PDFCheckResult], None]] = None,
+    ) -> Iterator[Tuple[T, PDFCheckResult]]:
+        """Yields ``(item, result)`` for the items that may be submitted, in input order.
+
+        Quarantined items are logged, written to the quarantine list (as ``key(item)``) and passed to ``on_quarantine``.
+        """
+        for batch in _batches(items, self.batch_size):
+            paths = [os.path.abspath(path_of(item)) for item in batch]
+            results = {r.path: r for r in self.check(paths)}
+            for item, path in zip(batch, paths):
+                result = results[path]
+                self.counts[result.verdict] += 1
+                if result.verdict != QUARANTINE:
+                    yield item, result
+                    continue
+                label = key(item) if key else path
+                logging.warning("Pre-screen quarantined %s (%s): %s", label, path, "; ".join(result.issues))
+                self._record_quarantine(label, result)
+                if on_quarantine:
+                    on_quarantine(item, result)
+
+    def _record_quarantine(self, label: str, result: PDFCheckResult) -> None:
+        if not self.quarantine_path:
+            return
+        line = json.dumps(
+            {"id": label, "path": result.path, "issues": result.issues, "checked_at": time.time()},
+            ensure_ascii=False,
+        )
+        with self._lock, open(self.quarantine_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def summary(self) -> str:
+        return ", ".join(f"{self.counts[v]} {v}" for v in (OK, OCR, QUARANTINE))
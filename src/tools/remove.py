@@ -1,6 +1,8 @@
 import logging
 import boto3
 
+from tools.s3_manifest import S3Manifest
+
 logging.basicConfig(
     filename="sci_remove.log",
     level=logging.INFO,
@@ -17,19 +19,16 @@ bucket_name = "tiangong"
 prefix = "processed_docs/journal_pickle/"
 
 
-# 列出所有对象
-paginator = s3_client.get_paginator("list_objects_v2")
-page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-
-file_count = 0
-for page in page_iterator:
-    if "Contents" in page:
-        for obj in page["Contents"]:
-            # print(obj['Key'])
-            file_count += 1
+# 列出所有对象（增量刷新 manifests/ 下的清单）
+manifest = S3Manifest(s3_client, bucket_name, prefix)
+logging.info(manifest.refresh().summary())
+file_count = len(manifest)
 
 logging.info(f"总共有 {file_count} 个文件")
 
+paginator = s3_client.get_paginator("list_objects_v2")
+page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+
 # for page in page_iterator:
 #     if "Contents" in page:
 #         for obj in page["Contents"]:
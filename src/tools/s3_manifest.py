@@ -0,0 +1,203 @@
+"""Persisted, incrementally refreshed listing of an S3 prefix.
+
+``processed_docs/journal_pickle/`` holds about a million pickles, and every
+run that needed its key list paginated the whole prefix (1000 keys per
+request, one request at a time). ``S3Manifest`` keeps key / ETag / size /
+LastModified in a local SQLite file and refreshes it in one of two ways:
+
+* ``refresh()`` splits the known key space at quantiles of the stored keys
+  and lists the ranges in parallel (``StartAfter`` = lower bound, stop at the
+  upper bound). Every new, changed or deleted object is found, in roughly
+  ``1 / workers`` of the sequential time. The first refresh of an empty
+  manifest is a plain sequential listing.
+* ``refresh(tail=True)`` only lists keys after the last known one, for
+  prefixes where new keys sort last; it takes seconds but does not notice
+  changes or deletions in the middle.
+
+Each refresh returns a ``ManifestDiff`` of what changed.
+
+Usage:
+    manifest = S3Manifest(s3_client, "tiangong", "processed_docs/journal_pickle/")
+    diff = manifest.refresh()
+    docs = manifest.keys(suffix=".pkl")
+
+    PYTHONPATH=src python src/tools/s3_manifest.py tiangong processed_docs/journal_pickle/
+"""
+
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_DIR = "manifests"
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    etag: str
+    size: int
+    last_modified: str
+
+
+@dataclass
+class ManifestDiff:
+    added: List[ObjectInfo] = field(default_factory=list)
+    changed: List[ObjectInfo] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    listed: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"listed {self.listed} objects: {len(self.added)} added, "
+            f"{len(self.changed)} changed, {len(self.removed)} removed"
+        )
+
+
+def default_path(bucket: str, prefix: str) -> str:
+    name = prefix.strip("/").replace("/", "_") or "root"
+    return os.path.join(os.getenv("S3_MANIFEST_DIR", DEFAULT_DIR), f"{bucket}-{name}.sqlite")
+
+
+class S3Manifest:
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        prefix: str = "",
+        path: Optional[str] = None,
+        *,
+        workers: int = 16,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.path = path or default_path(bucket, prefix)
+        self.workers = max(1, workers)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # SQLite's default BINARY collation orders UTF-8 keys the way S3 lists them.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " key TEXT PRIMARY KEY, etag TEXT, size INTEGER, last_modified TEXT"
+            ") WITHOUT ROWID"
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+    def keys(self, suffix: Optional[str] = None) -> List[str]:
+        if suffix:
+            rows = self._conn.execute(
+                "SELECT key FROM objects WHERE substr(key, -?) = ? ORDER BY key", (len(suffix), suffix)
+            )
+        else:
+            rows = self._conn.execute("SELECT key FROM objects ORDER BY key")
+        return [key for (key,) in rows]
+
+    def get(self, key: str) -> Optional[ObjectInfo]:
+        row = self._conn.execute(
+            "SELECT key, etag, size, last_modified FROM objects WHERE key = ?", (key,)
+        ).fetchone()
+        return ObjectInfo(*row) if row else None
+
+    def _boundaries(self) -> List[str]:
+        """Keys splitting the stored key space into ``workers`` ranges of similar size."""
+        count = len(self)
+        if count < self.workers * 1000:  # under ~one page per range, splitting does not pay
+            return []
+        step = count // self.workers
+        return [
+            self._conn.execute("SELECT key FROM objects ORDER BY key LIMIT 1 OFFSET ?", (i * step,)).fetchone()[0]
+            for i in range(1, self.workers)
+        ]
+
+    def _list_range(self, start_after: Optional[str], stop: Optional[str]) -> List[ObjectInfo]:
+        """Objects with ``start_after < key <= stop`` (open ends for ``None``)."""
+        params = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+        objects = []
+        for page in self.s3_client.get_paginator("list_objects_v2").paginate(**params):
+            for obj in page.get("Contents", []):
+                if stop is not None and obj["Key"] > stop:
+                    return objects
+                objects.append(
+                    ObjectInfo(
+                        obj["Key"], obj["ETag"].strip('"'), obj["Size"], obj["LastModified"].isoformat()
+                    )
+                )
+        return objects
+
+    def _known(self, start_after: Optional[str], stop: Optional[str]) -> Dict[str, str]:
+        sql = "SELECT key, etag FROM objects WHERE 1 = 1"
+        params: Tuple = ()
+        if start_after:
+            sql, params = sql + " AND key > ?", params + (start_after,)
+        if stop is not None:
+            sql, params = sql + " AND key <= ?", params + (stop,)
+        return dict(self._conn.execute(sql, params).fetchall())
+
+    def refresh(self, *, tail: bool = False) -> ManifestDiff:
+        if tail:
+            last = self._conn.execute("SELECT MAX(key) FROM objects").fetchone()[0]
+            ranges = [(last, None)]
+        else:
+            bounds = self._boundaries()
+            lower = [None] + bounds
+            upper = bounds + [None]
+            ranges = list(zip(lower, upper))
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(ranges))) as pool:
+            listings = list(pool.map(lambda r: self._list_range(*r), ranges))
+
+        diff = ManifestDiff()
+        for (start_after, stop), listed in zip(ranges, listings):
+            known = self._known(start_after, stop)
+            diff.listed += len(listed)
+            for info in listed:
+                etag = known.pop(info.key, None)
+                if etag is None:
+                    diff.added.append(info)
+                elif etag != info.etag:
+                    diff.changed.append(info)
+            if not tail:
+                diff.removed.extend(known)
+
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO objects (key, etag, size, last_modified) VALUES (?, ?, ?, ?)",
+            diff.added + diff.changed,
+        )
+        self._conn.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in diff.removed])
+        self._conn.execute("COMMIT")
+        return diff
+
+
+def main() -> None:
+    from tools.s3_prefetch import pooled_s3_client
+
+    p = argparse.ArgumentParser(description="Refresh the local manifest of an S3 prefix")
+    p.add_argument("bucket")
+    p.add_argument("prefix")
+    p.add_argument("--path", help="manifest file (default: $S3_MANIFEST_DIR or manifests/)")
+    p.add_argument("--tail", action="store_true", help="only list keys after the last known key")
+    p.add_argument("--workers", type=int, default=16)
+    args = p.parse_args()
+
+    manifest = S3Manifest(
+        pooled_s3_client(args.workers), args.bucket, args.prefix, args.path, workers=args.workers
+    )
+    print(manifest.refresh(tail=args.tail).summary())
+    print(f"{len(manifest)} objects in {manifest.path}")
+
+
+if __name__ == "__main__":
+    main()
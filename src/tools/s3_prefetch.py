@@ -0,0 +1,116 @@
+"""Ordered, concurrent prefetching of pickles from S3.
+
+The ``*_aws`` loaders did ``get_object`` + ``read()`` + ``pickle.loads`` for
+one document at a time in the main loop, so every document paid a full S3
+round trip before any embedding or indexing could start. ``prefetch_pickles``
+keeps up to ``max_ahead`` downloads running on a thread pool (over one
+client whose connection pool is sized to match), deserializes on the workers
+(pickle, or Parquet for ``.parquet`` keys) and yields the documents in their
+original order.
+
+Fetched-but-not-yet-consumed pickles are held to about ``max_bytes`` of raw
+pickle data: a new download only starts while the buffered bytes plus the
+running downloads (estimated at the mean object size seen so far) fit the
+budget, so memory stays bounded even when the consumer (embedding, bulk
+indexing) is the slow side. The first object is fetched alone to get an
+estimate; after that at least one download is always kept running.
+
+Usage:
+    s3_client = pooled_s3_client()
+    for report, fetched in prefetch_pickles(s3_client, bucket, reports, key=lambda r: f"{prefix}{r.id}.pkl"):
+        try:
+            data = fetched.result()  # raises whatever the download raised
+            ...
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+import boto3
+from botocore.config import Config
+
+from tools.chunk_store import loads
+
+T = TypeVar("T")
+
+DEFAULT_WORKERS = 16
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def pooled_s3_client(max_pool_connections: int = DEFAULT_WORKERS * 2, **kwargs):
+    """An S3 client whose HTTP connection pool fits ``max_pool_connections`` threads (botocore default: 10)."""
+    config = Config(max_pool_connections=max_pool_connections, retries={"max_attempts": 5, "mode": "adaptive"})
+    return boto3.client("s3", config=config, **kwargs)
+
+
+def prefetch_pickles(
+    s3_client,
+    bucket: str,
+    items: Iterable[T],
+    key: Callable[[T], str],
+    *,
+    workers: int = DEFAULT_WORKERS,
+    max_ahead: Optional[int] = None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Iterator[Tuple[T, "Future[Any]"]]:
+    """Yields ``(item, future)`` in the order of ``items``; ``future.result()`` is the unpickled object.
+
+    ``items`` is consumed lazily on the calling thread (so a keyset generator
+    keeps using its connection from one thread).
+    """
+    max_ahead = max_ahead or workers * 2
+    lock = threading.Lock()
+    # bytes fetched but not yet yielded, downloads running, bytes / objects fetched so far
+    state = {"buffered": 0, "running": 0, "seen_bytes": 0, "seen": 0}
+
+    def fetch(object_key: str, size: list) -> Any:
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=object_key)["Body"].read()
+        finally:
+            with lock:
+                state["running"] -= 1
+        with lock:
+            size[0] = len(body)
+            state["buffered"] += len(body)
+            state["seen_bytes"] += len(body)
+            state["seen"] += 1
+        return loads(object_key, body)
+
+    def has_room() -> bool:
+        with lock:
+            if not state["seen"]:
+                # Nothing to estimate from yet: size the first object before fanning out.
+                return state["running"] == 0
+            mean = state["seen_bytes"] / state["seen"]
+            return state["buffered"] + (state["running"] + 1) * mean <= max_bytes
+
+    source = iter(items)
+    window: deque = deque()
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-prefetch") as pool:
+        try:
+            while True:
+                while not exhausted and len(window) < max_ahead:
+                    if window and not has_room():
+                        break
+                    try:
+                        item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    size = [0]
+                    with lock:
+                        state["running"] += 1
+                    window.append((item, pool.submit(fetch, key(item), size), size))
+                if not window:
+                    return
+                item, future, size = window.popleft()
+                wait([future])
+                with lock:
+                    state["buffered"] -= size[0]
+                yield item, future
+        finally:
+            for _, future, _ in window:
+                future.cancel()
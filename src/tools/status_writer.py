@@ -0,0 +1,240 @@
+"""Write-behind buffer for per-document status timestamps in Postgres.
+
+The ingestion and indexing scripts stamp ``upload_time`` / ``embedding_time`` /
+``fulltext_time`` (and friends) one row at a time, each with its own commit.
+``StatusWriter`` collects those stamps and writes them as a single
+``UPDATE ... FROM (VALUES ...)`` statement once ``max_batch`` keys are pending
+or ``max_delay`` seconds have passed, whichever comes first.
+
+Pending stamps are flushed on ``close()``, at interpreter exit and on SIGTERM
+(``pkill``), so at most ``max_delay`` seconds of stamps are lost if the process
+is killed outright. A flush that fails as a whole (connection lost, database
+down) keeps its rows and retries them with the next one. When the statement
+itself is rejected, the rows are written one by one under savepoints so a
+single bad key (a failed ``::uuid`` cast, a constraint) does not hold back the
+others; a row that fails ``max_attempts`` flushes in a row is logged and
+dropped.
+
+Usage:
+    with StatusWriter(db_pool, "journals", "upload_time", key_type="uuid") as writer:
+        ...
+        writer.mark(file_id)
+"""
+
+import atexit
+import logging
+import signal
+import threading
+from datetime import UTC, datetime
+from typing import Dict, Optional
+
+from psycopg2 import DatabaseError, OperationalError, sql
+from psycopg2.extras import execute_values
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def install_sigterm_exit() -> None:
+    """Turns SIGTERM into SystemExit so ``finally`` blocks and atexit hooks run."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+
+
+class StatusWriter:
+    def __init__(
+        self,
+        db,
+        table: str,
+        column: str,
+        key_column: str = "id",
+        *,
+        key_type: Optional[str] = None,
+        max_batch: int = 500,
+        max_delay: float = 5.0,
+        max_attempts: int = 3,
+    ) -> None:
+        """``db`` is either a psycopg2 connection pool or a single connection.
+
+        Flushes run on a background thread, so a pool must be a
+        ``ThreadedConnectionPool`` when the caller uses it too (``SimpleConnectionPool``
+        is not thread-safe).
+
+        ``key_type`` is the SQL type of ``key_column`` (e.g. ``"uuid"``); when
+        omitted it is looked up from the catalog on the first flush.
+        """
+        self.db = db
+        self.table = table
+        self.key_column = key_column
+        self.key_type = key_type
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.max_attempts = max(1, max_attempts)
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+
+        self._query = sql.SQL(
+            "UPDATE {table} AS t SET {column} = v.ts FROM (VALUES %s) AS v(key, ts)"
+            " WHERE t.{key_column} = v.key"
+        ).format(
+            table=sql.Identifier(table),
+            column=sql.Identifier(column),
+            key_column=sql.Identifier(key_column),
+        )
+        self._pending: Dict[str, datetime] = {}
+        self._attempts: Dict[str, int] = {}  # failed flushes per key, for rows rejected on their own
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=f"status-writer-{table}.{column}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        install_sigterm_exit()
+
+    def __enter__(self) -> "StatusWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def mark(self, key, ts: Optional[datetime] = None) -> None:
+        """Queues ``SET column = ts`` for ``key`` (defaults to now, UTC)."""
+        with self._lock:
+            self._pending[str(key)] = ts or datetime.now(UTC)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            self.flush()
+
+    def _checkout(self):
+        if hasattr(self.db, "getconn"):
+            return self.db.getconn(), self.db.putconn
+        return self.db, None
+
+    def _lookup_key_type(self, cur) -> str:
+        cur.execute(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute"
+            " WHERE attrelid = %s::regclass AND attname = %s",
+            (self.table, self.key_column),
+        )
+        row = cur.fetchone()
+        if not row:
+            raise RuntimeError(f"Column {self.table}.{self.key_column} not found")
+        return row[0]
+
+    def _execute(self, cur, rows) -> None:
+        execute_values(
+            cur,
+            self._query,
+            rows,
+            template=f"(%s::{self.key_type}, %s::timestamptz)",
+            page_size=self.max_batch,
+        )
+
+    def _execute_rows(self, cur, batch: Dict[str, datetime]) -> Dict[str, datetime]:
+        """Writes ``batch`` one row per savepoint in the open transaction; returns the rows that failed."""
+        failed = {}
+        for key, ts in batch.items():
+            cur.execute("SAVEPOINT status_row")
+            try:
+                self._execute(cur, [(key, ts)])
+            except OperationalError:
+                raise
+            except DatabaseError as exc:
+                cur.execute("ROLLBACK TO SAVEPOINT status_row")
+                logging.warning("Status update of %s failed: %s", key, exc)
+                failed[key] = ts
+            cur.execute("RELEASE SAVEPOINT status_row")
+        return failed
+
+    def _requeue(self, failed: Dict[str, datetime]) -> None:
+        """Puts rows rejected on their own back into the queue, or drops them after ``max_attempts``."""
+        with self._lock:
+            for key, ts in failed.items():
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop(key, None)
+                    self.dropped += 1
+                    logging.error("Dropping status update of %s after %d failed flushes", key, attempts)
+                    continue
+                self._attempts[key] = attempts
+                # A newer stamp that arrived while the flush was running wins.
+                self._pending.setdefault(key, ts)
+
+    def flush(self) -> int:
+        """Writes every pending stamp now; returns the number of keys written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            conn, release = None, None
+            failed: Dict[str, datetime] = {}
+            try:
+                conn, release = self._checkout()
+                with conn.cursor() as cur:
+                    if self.key_type is None:
+                        self.key_type = self._lookup_key_type(cur)
+                    try:
+                        self._execute(cur, list(batch.items()))
+                    except OperationalError:
+                        raise
+                    except DatabaseError as exc:
+                        # One bad row fails the whole statement: find it row by row.
+                        logging.warning("Status flush of %d keys failed (%s); retrying row by row", len(batch), exc)
+                        conn.rollback()
+                        failed = self._execute_rows(cur, batch)
+                conn.commit()
+            except Exception as exc:
+                logging.error("Status flush of %d keys failed: %s", len(batch), exc)
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                with self._lock:
+                    # Keep newer stamps that arrived while the flush was running.
+                    batch.update(self._pending)
+                    self._pending = batch
+                return 0
+            finally:
+                if conn is not None and release is not None:
+                    release(conn)
+            if self._attempts:
+                with self._lock:
+                    for key in batch.keys() - failed.keys():
+                        self._attempts.pop(key, None)
+            self._requeue(failed)
+            written = len(batch) - len(failed)
+            self.flushed += written
+            self.flushes += 1
+            logging.info("Flushed %d status updates (%d total)", written, self.flushed)
+            return written
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.max_delay + 1)
+        self.flush()
+        if len(self):
+            logging.error("%d status updates could not be written before exit", len(self))
+        atexit.unregister(self.close)
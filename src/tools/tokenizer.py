@@ -0,0 +1,38 @@
+"""Cached tiktoken encoder and batched token counting.
+
+``tiktoken.get_encoding`` takes a global lock and a registry lookup on every
+call, and the chunking code used to call it (and re-encode the same text) two
+or three times per chunk. Here the encoder is resolved once per process and
+``count_tokens`` counts a whole list of texts with ``encode_ordinary_batch``,
+which releases the GIL and encodes on several threads.
+
+Text is encoded as ordinary text: special-token markers such as
+``<|endoftext|>`` inside a document are counted instead of raising.
+"""
+
+from functools import lru_cache
+from typing import List, Sequence
+
+import tiktoken
+
+ENCODING_NAME = "cl100k_base"
+# Below this many texts a plain loop beats spinning up encode_ordinary_batch's threads.
+_BATCH_THRESHOLD = 16
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(name)
+
+
+def num_tokens_from_string(string: str) -> int:
+    """Returns the number of tokens in a text string."""
+    return len(get_encoding().encode_ordinary(string))
+
+
+def count_tokens(texts: Sequence[str], num_threads: int = 8) -> List[int]:
+    """Returns the token count of every text, in order."""
+    encoding = get_encoding()
+    if len(texts) < _BATCH_THRESHOLD:
+        return [len(encoding.encode_ordinary(text)) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts), num_threads=num_threads)]
@@ -0,0 +1,142 @@
+"""Constant-memory work discovery over Postgres tables.
+
+The loaders used to ``fetchall()`` every matching row (or page with
+``LIMIT/OFFSET``, which re-reads every skipped row) and then build one dict per
+column. ``iter_keyset`` pages through the table by its key instead
+(``WHERE key > last ORDER BY key LIMIT n``, as ``export_all_journals_pickle.py``
+does), so each page costs the same and the first records are yielded as soon
+as the first page arrives. Rows come back as compact named tuples.
+
+``iter_named`` streams an arbitrary query through a named (server-side)
+cursor for queries that cannot be keyset-paged.
+
+Usage:
+    class Report(NamedTuple):
+        id: str
+        title: str
+
+    for report in iter_keyset(conn_pg, "esg_meta", Report._fields, record=Report,
+                              where="unstructure_time IS NOT NULL"):
+        ...
+"""
+
+import logging
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from psycopg2 import sql
+
+
+@contextmanager
+def _connection(db):
+    """Yields a connection from a psycopg2 pool or the connection itself."""
+    if hasattr(db, "getconn"):
+        conn = db.getconn()
+        try:
+            yield conn
+        finally:
+            db.putconn(conn)
+    else:
+        yield db
+
+
+def _record_type(columns: Sequence[str], record: Optional[Callable]) -> Callable:
+    return record or namedtuple("Record", columns)
+
+
+def iter_keyset(
+    db,
+    table: str,
+    columns: Sequence[str],
+    *,
+    key: str = "id",
+    where: Optional[str] = None,
+    params: Sequence[Any] = (),
+    record: Optional[Callable] = None,
+    batch_size: int = 5000,
+) -> Iterator[Any]:
+    """Yields ``record(*row)`` for every row of ``table`` matching ``where``.
+
+    ``key`` must be unique and indexed (the primary key is the usual choice);
+    it does not have to be one of ``columns``. ``where`` is a raw SQL
+    condition whose ``%s`` placeholders are filled from ``params``. Each page
+    is read in its own short transaction, so the connection (or a pool
+    connection) can be shared with ``StatusWriter`` while iterating.
+    """
+    columns = list(columns)
+    make = _record_type(columns, record)
+    select = columns if key in columns else [key, *columns]
+    key_index = select.index(key)
+    strip_key = key not in columns
+
+    conditions = [sql.SQL("({})").format(sql.SQL(where))] if where else []
+    base = sql.SQL("SELECT {fields} FROM {table}").format(
+        fields=sql.SQL(", ").join(map(sql.Identifier, select)),
+        table=sql.Identifier(table),
+    )
+
+    def page_query(after: bool) -> sql.Composed:
+        clauses = conditions + ([sql.SQL("{} > %s").format(sql.Identifier(key))] if after else [])
+        query = base
+        if clauses:
+            query = query + sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses)
+        return query + sql.SQL(" ORDER BY {} LIMIT %s").format(sql.Identifier(key))
+
+    first_page, next_page = page_query(False), page_query(True)
+    last_key = None
+    total = 0
+    while True:
+        with _connection(db) as conn:
+            with conn.cursor() as cur:
+                if last_key is None:
+                    cur.execute(first_page, (*params, batch_size))
+                else:
+                    cur.execute(next_page, (*params, last_key, batch_size))
+                rows = cur.fetchall()
+            # End the read transaction; never roll back, a shared connection may
+            # hold a StatusWriter update that is about to be committed.
+            conn.commit()
+        if not rows:
+            break
+        last_key = rows[-1][key_index]
+        if isinstance(last_key, uuid.UUID):
+            last_key = str(last_key)
+        total += len(rows)
+        logging.debug("Discovered %d rows from %s (last %s=%s)", total, table, key, last_key)
+        for row in rows:
+            yield make(*row[1:]) if strip_key else make(*row)
+        if len(rows) < batch_size:
+            break
+
+
+def iter_named(
+    db,
+    query: str,
+    params: Sequence[Any] = (),
+    *,
+    columns: Optional[Sequence[str]] = None,
+    record: Optional[Callable] = None,
+    itersize: int = 5000,
+) -> Iterator[Any]:
+    """Streams ``query`` through a named server-side cursor.
+
+    The cursor is declared ``WITH HOLD`` so commits on the same connection
+    (e.g. a ``StatusWriter`` sharing it) do not close it. Rows are fetched
+    ``itersize`` at a time. ``columns`` default to the query's column names.
+    """
+    with _connection(db) as conn:
+        cur = conn.cursor(name=f"discovery_{uuid.uuid4().hex}", withhold=True)
+        try:
+            cur.itersize = itersize
+            cur.execute(query, params)
+            conn.commit()
+            make = None
+            for row in cur:
+                if make is None:
+                    make = _record_type(columns or [d[0] for d in cur.description], record)
+                yield make(*row)
+        finally:
+            cur.close()
+            conn.commit()